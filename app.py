@@ -1,13 +1,33 @@
+import time
+_import_started = time.perf_counter()  # startup timing includes the imports below
 from flask import Flask, render_template, Response, request, jsonify
 import cv2
 import os
 import numpy as np
 import datetime
 import threading
-import time
+import atexit
 import base64
-from urllib.parse import urlparse
+import contextlib
+import functools
+import hashlib
+import json
 import logging
+from kiosk_sessions import SessionRegistry
+from face_tracker import FaceTracker
+from preprocess import FramePreprocessor
+from lbph_matcher import LBPHMatcher, NO_MATCH
+from face_index import IVFIndex, MIN_TRAIN, create_index
+from model_store import ModelStore, SegmentLog, CorruptRecord, OP_ADD, OP_TOMBSTONE, record_label
+from shared_model import SharedGallery
+from training_worker import TrainingService, QueueFull
+from db_pool import DBConfig, ConnectionPool
+from attendance_writer import AttendanceWriter
+from attendance_state import CooldownIndex, DailyLog
+from event_hub import EventHub, TooManySubscribers, format_sse
+from profile_images import ProfileImageCache, make_thumbnail, MISSING
+from metrics import Registry, SamplingProfiler
+from startup import Startup
 
 # Database Imports
 try:
@@ -24,107 +44,137 @@ app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
 
 # --- CONFIGURATION ---
-MODEL_FILE = "trainer.yml"
+MODEL_FILE = "trainer.yml"          # legacy YAML model, imported once into MODEL_STORE_FILE
+MODEL_STORE_FILE = "model.lbps"     # append-only binary histogram segments (model_store.py)
+SHARED_MODEL_FILE = "model.mmap"    # gallery memory-mapped by every worker (shared_model.py)
+MODEL_SYNC_FILE = "model.sync"      # model_segments fingerprint MODEL_STORE_FILE was last synced with
+MODEL_FETCH_ROWS = int(os.environ.get('MODEL_FETCH_ROWS', 64))                # model_segments rows per query
+MODEL_FETCH_BYTES = int(os.environ.get('MODEL_FETCH_BYTES', 4 * 1024 * 1024))  # legacy blob bytes per query
+MODEL_DIGEST_KEY = 'model_digest'   # system_storage row: "<max id> <sha256>" of the segments at compaction
+MODEL_FETCH_ATTEMPTS = 3            # re-reads when model_segments changes during a load
 ATTENDANCE_FILE = "attendance_log.csv"
 COOLDOWN_SECONDS = 30
 CONFIDENCE_THRESHOLD = 75  # Increased from 55 for better reliability
 FACE_SIZE = (100, 100)      # Standard size for face samples
+TRACK_DETECT_EVERY = int(os.environ.get('TRACK_DETECT_EVERY', 5))  # 1 = detect on every frame
+MATCHER_REDUCE = os.environ.get('MATCHER_REDUCE', 'all')  # 'all', 'centroid' or 'topk'
+FACE_INDEX = os.environ.get('FACE_INDEX', 'none')  # 'none' or 'ivf' (approximate search)
+INDEX_NPROBE = int(os.environ.get('INDEX_NPROBE', 128))  # IVF cells probed per face; higher = better recall
+INDEX_RERANK = int(os.environ.get('INDEX_RERANK', 32))   # shortlisted candidates scored exactly; 0 = all
+INDEX_FILE = "face_index.npz"
+TRAIN_QUEUE_SIZE = int(os.environ.get('TRAIN_QUEUE_SIZE', 32))  # registrations waiting for training
+TRAIN_MAX_BATCH = int(os.environ.get('TRAIN_MAX_BATCH', 16))    # queued registrations merged per model update
+TRAIN_NICE = int(os.environ.get('TRAIN_NICE', 10))                # training thread priority below requests; 0 = same
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))              # connections per worker process
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))     # seconds to wait for a free connection
+ATTENDANCE_BATCH = int(os.environ.get('ATTENDANCE_BATCH', 100))     # rows per executemany
+ATTENDANCE_FLUSH_SECONDS = float(os.environ.get('ATTENDANCE_FLUSH_SECONDS', 0.5))
+ATTENDANCE_SPILL_DIR = "attendance_spill"  # rows waiting for the DB to come back
+ATTENDANCE_LOG_MAX = int(os.environ.get('ATTENDANCE_LOG_MAX', 5000))  # entries kept for /get_attendance
+EVENTS_MAX_CLIENTS = int(os.environ.get('EVENTS_MAX_CLIENTS', 16))  # open /events streams per worker (each holds a thread)
+EVENTS_KEEPALIVE_SECONDS = 15
+EVENTS_MAX_SECONDS = 300  # streams are closed and re-opened by the browser after this
+RECOGNITION_REPUSH_SECONDS = 2  # re-send an unchanged recognition so the card stays up
+PROFILE_CACHE_BYTES = int(os.environ.get('PROFILE_CACHE_BYTES', 16 << 20))  # in-memory profile images per worker
+PROFILE_CACHE_DIR = os.environ.get('PROFILE_CACHE_DIR')  # optional on-disk image cache shared by workers
+PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', '0') == '1'  # allow /debug/profile sampling
+STARTUP_BACKGROUND = os.environ.get('STARTUP_BACKGROUND', '1') == '1'  # serve while the model loads
+SCHEMA_VERSION = 1  # bump whenever init_db's tables change
 
-# Global State
-app_mode = 'idle'
-reg_name = ""
-reg_emp_id = ""
-reg_counter = 0
-reg_faces = []
-reg_status_msg = "idle"
-today_log = []
-reg_faces_color = []
-latest_recognition = {"name": "", "emp_id": "", "time": 0}
+# Global State (per-kiosk mode/registration state lives in `sessions`)
+startup = Startup(_import_started)  # phase timings and readiness for /readyz
+sessions = SessionRegistry()
+today_log = DailyLog(ATTENDANCE_LOG_MAX)  # today's entries, cleared at midnight
+cooldowns = CooldownIndex(COOLDOWN_SECONDS)  # emp_id -> last logged (monotonic)
+event_hub = EventHub(max_subscribers=EVENTS_MAX_CLIENTS)  # pushes for /events
+pipeline_metrics = Registry()  # stage timings and counters for /metrics
 user_db = {}
-DB_TYPE = 'mysql' # 'mysql' or 'postgres'
+db_config = DBConfig()  # DATABASE_URL, parsed once
+DB_TYPE = db_config.backend  # 'mysql', 'postgres' or 'sqlite' (local testing)
+db_pool = ConnectionPool(db_config, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT)
 
 # Detectors
-face_cascade = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml'))
-if face_cascade.empty():
-    print("WARNING: Face Cascade Classifier failed to load! Check opencv installation.")
-recognizer = cv2.face.LBPHFaceRecognizer_create()
-clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+face_cascade = None  # loaded by the startup thread (load_detector)
+matcher = LBPHMatcher(reduce=MATCHER_REDUCE)       # serves every prediction
+model_store = ModelStore(MODEL_STORE_FILE, scale=matcher.cell_area(FACE_SIZE))
+shared_gallery = SharedGallery(SHARED_MODEL_FILE, matcher.dim)
+model_lock = threading.Lock()  # swaps `matcher` within this worker
+image_cache = ProfileImageCache(PROFILE_CACHE_BYTES, PROFILE_CACHE_DIR)  # /user_image, keyed by emp_id
+
+def load_detector():
+    global face_cascade
+    cascade = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml'))
+    if cascade.empty():
+        print("WARNING: Face Cascade Classifier failed to load! Check opencv installation.")
+    face_cascade = cascade
+
+# Preprocessing buffers are reused across frames, one set per request thread
+_thread_state = threading.local()
+
+def get_preprocessor():
+    pre = getattr(_thread_state, 'preprocessor', None)
+    if pre is None:
+        pre = _thread_state.preprocessor = FramePreprocessor(scale=0.5, face_size=FACE_SIZE)
+    return pre
 
 # --- DATABASE CONFIG & HELPERS ---
-def get_db_connection(db_name=None):
-    global DB_TYPE
-    db_url = os.environ.get('DATABASE_URL')
-    
-    if db_url and (db_url.startswith("postgres://") or db_url.startswith("postgresql://")):
-        # PostgreSQL (Render)
-        DB_TYPE = 'postgres'
-        if not psycopg2:
-            print("CRITICAL: psycopg2 not installed but DATABASE_URL is postgres.")
-            return None
-        # Fix Render's "postgres://" (deprecated) to "postgresql://" for SQLAlchemy/psycopg2 if needed
-        if db_url.startswith("postgres://"):
-            db_url = db_url.replace("postgres://", "postgresql://", 1)
-        
-        try:
-            conn = psycopg2.connect(db_url)
-            return conn
-        except Exception as e:
-            print(f"Postgres Connect Error: {e}")
-            return None
+def get_db_connection():
+    """Checks a connection out of the pool, or None if the DB is unreachable.
+    conn.close() returns it to the pool."""
+    try:
+        return db_pool.acquire()
+    except Exception as e:
+        pipeline_metrics.inc('db_errors')
+        print(f"{DB_TYPE} Connect Error: {e}")
+        return None
 
-    else:
-        # MySQL Fallback
-        DB_TYPE = 'mysql'
-        
-        # Check if MySQL is available at all
-        try:
-             import mysql.connector
-        except ImportError:
-             print("CRITICAL: mysql-connector not installed.")
-             return None
-            
-        if db_url:
-            result = urlparse(db_url)
-            db_from_url = result.path[1:] if result.path else ""
-            target_db = db_name if db_name else (db_from_url if db_from_url else 'face')
-            conf = {
-                'host': result.hostname,
-                'user': result.username,
-                'password': result.password,
-                'database': target_db,
-                'port': result.port or 3306
-            }
-        else:
-            conf = {
-                'host': os.environ.get('DB_HOST', 'localhost'),
-                'user': os.environ.get('DB_USER', 'root'), 
-                'password': os.environ.get('DB_PASSWORD', ''),
-                'database': os.environ.get('DB_NAME', 'face') if not db_name else db_name,
-                'port': int(os.environ.get('DB_PORT', 3306))
-            }
-        
-        try:
-            conn = mysql.connector.connect(**conf)
-            return conn
-        except Exception as err:
-            print(f"MySQL Connect Error: {err}")
-            return None
+@contextlib.contextmanager
+def db_connection():
+    """`with db_connection() as conn:` -- conn is None if the DB is unreachable;
+    the connection goes back to the pool (or is dropped if it broke)."""
+    conn = get_db_connection()
+    try:
+        yield conn
+    except Exception as e:
+        pipeline_metrics.inc('db_errors')
+        if conn and isinstance(e, db_config.connection_errors()): conn.broken = True
+        raise
+    finally:
+        if conn: conn.close()
 
 def get_cursor(conn, dictionary=False):
     if DB_TYPE == 'postgres':
         if dictionary:
             return conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         return conn.cursor()
+    elif DB_TYPE == 'sqlite':
+        return conn.cursor()  # rows are sqlite3.Row, readable by column name
     else:
         return conn.cursor(dictionary=dictionary)
 
+def schema_is_current(conn):
+    """True if the schema_version marker matches SCHEMA_VERSION (one query
+    instead of the CREATE statements on every start)."""
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT data_blob FROM system_storage WHERE key_name = 'schema_version'")
+        row = cursor.fetchone()
+        return bool(row and row[0]) and blob_bytes(row[0]).decode() == str(SCHEMA_VERSION)
+    except Exception:
+        conn.rollback()  # e.g. no system_storage table yet
+        return False
+
 def init_db():
-    global DB_TYPE
     conn = get_db_connection()
     if not conn:
         print("CRITICAL: COULD NOT CONNECT TO any DB.")
         return
 
+    if schema_is_current(conn):
+        print(f"Schema version {SCHEMA_VERSION} present; skipping schema checks.")
+        conn.close()
+        return
+
     # Create Database if MySQL and localhost (Postgres usually connects to existing DB)
     if DB_TYPE == 'mysql':
         try:
@@ -146,6 +196,10 @@ def init_db():
         auto_inc = 'SERIAL PRIMARY KEY'
         timestamp_default = "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
         # Postgres requires Trigger for ON UPDATE
+    elif DB_TYPE == 'sqlite':
+        blob_type = 'BLOB'
+        auto_inc = 'INTEGER PRIMARY KEY AUTOINCREMENT'
+        timestamp_default = "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
     else:
         blob_type = 'LONGBLOB'
         auto_inc = 'INT AUTO_INCREMENT PRIMARY KEY'
@@ -184,126 +238,413 @@ def init_db():
             )
         """)
         
+        # Model segments: one row per enrollment / tombstone (model_store.py records)
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS model_segments (
+                id {auto_inc},
+                op SMALLINT,
+                label INT,
+                data_blob {blob_type},
+                created_at {timestamp_default}
+            )
+        """)
+        
+        # Small profile images made at enrollment for the dashboard card
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS profile_thumbs (
+                emp_id VARCHAR(50) PRIMARY KEY,
+                data_blob {blob_type},
+                updated_at {timestamp_default}
+            )
+        """)
+        
+        # Marker checked by schema_is_current on the next start
+        cursor.execute("DELETE FROM system_storage WHERE key_name = 'schema_version'")
+        cursor.execute("INSERT INTO system_storage (key_name, data_blob) VALUES (%s, %s)",
+                       ('schema_version', str(SCHEMA_VERSION).encode()))
         conn.commit()
     except Exception as e:
         print(f"Init DB Error: {e}")
     finally:
         conn.close()
 
+def predict_faces(faces):
+    """[(label, distance), ...] for a stacked batch of normalized faces,
+    scored in one pass over the gallery."""
+    return matcher.predict_batch(faces)
+
+def publish_model(log):
+    """Rewrites the shared gallery from a replayed SegmentLog (hold shared_gallery.lock())."""
+    hist_t, labels = log.gallery_t(matcher.dim)
+    shared_gallery.rewrite(hist_t, labels, model_store.size())
+
+def attach_shared_model():
+    """Points this worker's matcher at the current shared gallery (no copy)."""
+    global matcher
+    old_layout = shared_gallery.layout
+    current = shared_gallery.view()
+    if current is None: return
+    hist_t, labels, sums = current
+    fresh = LBPHMatcher(reduce=MATCHER_REDUCE)
+    fresh.set_gallery(hist_t, labels, sums)
+    if FACE_INDEX == 'ivf' and MATCHER_REDUCE == 'all':
+        index = next_face_index(fresh, old_layout)
+        if index is not None:
+            fresh.attach_index(index)  # already covers the gallery: nothing is retrained here
+        elif len(fresh) >= MIN_TRAIN:
+            start_index_rebuild()  # exact search until the new index is swapped in
+    matcher = fresh
+
+def next_face_index(fresh, old_layout):
+    """An index covering `fresh`'s gallery that leaves the current matcher's
+    index untouched (requests may still be searching it), or None."""
+    index = matcher.index
+    if index is None:
+        return None if index_rebuilding() else load_face_index(fresh)
+    if not index.ready or old_layout != shared_gallery.layout or len(index) != len(matcher):
+        return None
+    if len(fresh) == len(index):
+        return index  # same columns
+    # Columns were appended in place: a copy with just those inserted
+    return index.extended(fresh.histograms_matrix[len(index):], len(index))
+
+_index_thread = None
+
+def index_rebuilding():
+    return _index_thread is not None and _index_thread.is_alive()
+
+def start_index_rebuild():
+    global _index_thread
+    if index_rebuilding(): return
+    _index_thread = threading.Thread(target=rebuild_face_index, name="face-index", daemon=True)
+    _index_thread.start()
+
+def rebuild_face_index():
+    """Trains an index on the current gallery off the request path, then
+    swaps in a matcher that uses it (again if the gallery changed meanwhile)."""
+    global matcher
+    try:
+        while True:
+            target = matcher
+            index = create_index(FACE_INDEX, target.dim, nprobe=INDEX_NPROBE, rerank=INDEX_RERANK)
+            t0 = time.perf_counter()
+            index.rebuild(target.histograms_matrix.T)
+            with model_lock:
+                if matcher is target:
+                    matcher = target.with_index(index)
+                    break
+        print(f"Face index trained on {len(index)} samples in {time.perf_counter() - t0:.1f}s.")
+        save_face_index()
+    except Exception as e:
+        print(f"Error training face index: {e}")
+
+def refresh_model():
+    """Picks up a model published by any worker; one shared-memory read when unchanged."""
+    if not shared_gallery.changed(): return
+    with model_lock:
+        if shared_gallery.changed():
+            attach_shared_model()
+            if any(int(label) not in user_db for label in np.unique(matcher.labels)):
+                load_user_records()  # registered through another worker
+
+def load_face_index(matcher):
+    """The persisted index if it still matches the model, else None."""
+    if FACE_INDEX == 'ivf' and os.path.exists(INDEX_FILE):
+        try:
+            index = IVFIndex.load(INDEX_FILE)
+            if len(index) == len(matcher) and index.dim == matcher.dim:
+                index.nprobe, index.rerank = INDEX_NPROBE, INDEX_RERANK
+                print("Face index loaded from local file.")
+                return index
+        except Exception as e:
+            print(f"Error loading face index: {e}")
+    return None
+
+def save_face_index():
+    if matcher is None or matcher.index is None: return
+    try:
+        matcher.index.save(INDEX_FILE)
+    except Exception as e:
+        print(f"Error saving face index: {e}")
+
+def blob_bytes(blob):
+    # Postgres returns memoryview or bytes
+    return blob.tobytes() if hasattr(blob, 'tobytes') else bytes(blob)
+
+def segments_fingerprint(cursor):
+    """(rows, max id, stored digest) of model_segments; differs whenever a row
+    is appended or the table is rewritten."""
+    cursor.execute("SELECT COUNT(*), MAX(id) FROM model_segments")
+    count, max_id = cursor.fetchone()
+    cursor.execute("SELECT data_blob FROM system_storage WHERE key_name = %s", (MODEL_DIGEST_KEY,))
+    row = cursor.fetchone()
+    return count, max_id, blob_bytes(row[0]).decode() if row and row[0] else None
+
+def load_segments_from_db(known=None):
+    """Replays the model_segments table into the local store. Returns
+    (log, fingerprint); log is None if the table is empty, or if it still
+    matches `known`, the fingerprint of an earlier read (then nothing is
+    fetched). Rows are fetched MODEL_FETCH_ROWS at a time and replayed as they arrive
+    (8-bit records are widened to float32; publish_model copies the result
+    into the shared gallery). The rows covered by the digest stored at the
+    last compaction must match it; later appends rely on their record CRCs.
+    If the table changes while it is being read, the read starts over.
+    Raises CorruptRecord or RuntimeError; the local file is only rewritten
+    if its hash differs."""
+    conn = get_db_connection()
+    if not conn: return None, None
+    try:
+        cursor = conn.cursor()
+        for _ in range(MODEL_FETCH_ATTEMPTS):
+            before = segments_fingerprint(cursor)
+            if known is not None and list(before) == list(known):
+                return None, before
+            log, buffers = read_segments(cursor, before[2])
+            if segments_fingerprint(cursor) == before: break
+            print("Model segments changed while loading; reading them again.")
+        else:
+            raise RuntimeError(f"model_segments kept changing over {MODEL_FETCH_ATTEMPTS} reads")
+        if not buffers: return None, before
+        content = hashlib.sha256()
+        for blob in buffers: content.update(blob)
+        print(f"Model loaded from database ({len(buffers)} segments, sha256 {content.hexdigest()[:12]}).")
+        return model_store.adopt(log, buffers, content.hexdigest()), before
+    finally:
+        conn.close()
+
+def read_model_sync():
+    try:
+        with open(MODEL_SYNC_FILE, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_model_sync(fingerprint):
+    tmp = MODEL_SYNC_FILE + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(list(fingerprint), f)
+    os.replace(tmp, MODEL_SYNC_FILE)
+
+def read_segments(cursor, stored_digest):
+    """One keyset-paged pass over model_segments; (log, blobs) in id order."""
+    covered_id, expected = stored_digest.split() if stored_digest else (0, None)
+    covered_id, covered = int(covered_id), hashlib.sha256()
+    log, buffers, last_id = SegmentLog(), [], 0
+    while True:
+        cursor.execute("SELECT id, data_blob FROM model_segments WHERE id > %s ORDER BY id LIMIT %s",
+                       (last_id, MODEL_FETCH_ROWS))
+        rows = cursor.fetchall()
+        for row_id, blob in rows:
+            if not blob: continue
+            before = log.valid_bytes
+            log.replay(blob)  # records are CRC-checked; float32 payloads stay views of blob
+            if log.valid_bytes - before != len(blob):
+                raise CorruptRecord(f"model segment {row_id} is truncated")
+            if row_id <= covered_id: covered.update(blob)
+            buffers.append(blob)
+        if len(rows) < MODEL_FETCH_ROWS: break
+        last_id = rows[-1][0]
+    if expected and covered.hexdigest() != expected:
+        raise CorruptRecord("model segments do not match the digest stored at compaction")
+    return log, buffers
+
+def fetch_legacy_blob():
+    """The old trainer_model blob, fetched MODEL_FETCH_BYTES at a time into
+    one buffer, or None."""
+    with db_connection() as conn:
+        if not conn: return None
+        cursor = conn.cursor()
+        key = 'trainer_model'
+        cursor.execute("SELECT length(data_blob) FROM system_storage WHERE key_name = %s", (key,))
+        row = cursor.fetchone()
+        if not (row and row[0]): return None
+        data = bytearray(row[0])
+        for pos in range(0, len(data), MODEL_FETCH_BYTES):
+            cursor.execute("SELECT substr(data_blob, %s, %s) FROM system_storage WHERE key_name = %s",
+                           (pos + 1, MODEL_FETCH_BYTES, key))
+            chunk = cursor.fetchone()[0]
+            if len(chunk) != min(MODEL_FETCH_BYTES, len(data) - pos):
+                raise CorruptRecord("legacy model changed while it was being read")
+            data[pos:pos + len(chunk)] = chunk
+        return data
+
+def import_legacy_model():
+    """One-time migration of trainer.yml (local or the old DB blob) into segments."""
+    try:
+        if os.path.exists(MODEL_FILE):
+            with open(MODEL_FILE, encoding='utf-8') as f:
+                text = f.read()
+        else:
+            data = fetch_legacy_blob()  # parsed in memory; no trainer.yml is written
+            if data is None: return None
+            text = data.decode('utf-8')
+            del data
+        legacy = LBPHMatcher.from_yaml(text)
+        del text
+        log = SegmentLog()
+        for label in np.unique(legacy.labels):
+            log.apply(OP_ADD, int(label), legacy.histograms_matrix[legacy.labels == label])
+        records = log.compacted_records(model_store.scale)
+        log = model_store.write_all(records)
+        replace_segments_db(records)
+        print(f"Imported legacy {MODEL_FILE} into {MODEL_STORE_FILE}.")
+        return log
+    except Exception as e:
+        print(f"Error importing legacy model: {e}")
+        return None
+
 def load_resources():
-    global user_db, recognizer
-    user_db = {}
-    
-    # 1. Try to load model from Local File first (if exists)
-    model_loaded = False
-    if os.path.exists(MODEL_FILE):
+    # The first worker builds the shared gallery; the rest just map it
+    with shared_gallery.lock():
+        # 1. Database segments (Render persistence, other hosts' registrations),
+        # read only if they changed since this host last synced; model.lbps is
+        # rewritten only if its sha256 differs. 2. Local file. 3. Legacy trainer.yml
+        log, db_ok = None, True
+        known = read_model_sync() if model_store.exists() else None
         try:
-            recognizer.read(MODEL_FILE)
-            model_loaded = True
-            print("Model loaded from local file.")
-        except: pass
-    
-    # 2. If not loaded, try to load from Database (Render Persistence)
-    if not model_loaded:
-        conn = get_db_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("SELECT data_blob FROM system_storage WHERE key_name = 'trainer_model'")
-                row = cursor.fetchone()
-                # Row format: Postgres (blob,), MySQL (blob,)
-                if row and row[0]:
-                    blob = row[0]
-                    # Postgres returns memoryview or bytes
-                    if hasattr(blob, 'tobytes'): blob = blob.tobytes()
-                    with open(MODEL_FILE, "wb") as f:
-                        f.write(blob)
-                    recognizer.read(MODEL_FILE)
-                    model_loaded = True
-                    print("Model loaded from database.")
-            except Exception as e:
-                print(f"Error loading model from DB: {e}")
-            finally:
-                conn.close()
-
-    # 3. Load user records
+            log, fingerprint = load_segments_from_db(known)
+            if fingerprint is not None:
+                write_model_sync(fingerprint)
+        except Exception as e:
+            # Leave the table alone: a legacy import would replace it
+            print(f"Error loading model from DB: {e}")
+            db_ok = False
+        state = shared_gallery.state()
+        if log is None and (state is None or state[3] != model_store.size()):
+            if model_store.exists():
+                try:
+                    log = model_store.load()
+                    print("Model loaded from local file.")
+                except Exception as e:
+                    print(f"Error loading local model: {e}")
+                    if db_ok and known is not None:
+                        try:
+                            log = load_segments_from_db()[0]  # unchanged in the DB, but needed now
+                        except Exception as e:
+                            print(f"Error loading model from DB: {e}")
+                            db_ok = False
+            if log is None and db_ok:
+                log = import_legacy_model()
+            if log is not None:
+                publish_model(log)
+        elif log is not None:
+            publish_model(log)
+        else:
+            print("Model mapped from shared file.")
+
+    load_user_records()
+    with model_lock:
+        attach_shared_model()
+    if not len(matcher):
+        print("No trained model found. Please register users.")
+
+def load_user_records():
+    global user_db
     try:
-        conn = get_db_connection()
-        if conn:
+        with db_connection() as conn:
+            if not conn: return
             cursor = get_cursor(conn, dictionary=True)
             cursor.execute("SELECT id, name, emp_id FROM users")
-            for row in cursor.fetchall():
-                user_db[row['id']] = {"name": row['name'], "emp_id": row['emp_id']}
-            conn.close()
+            user_db = {row['id']: {"name": row['name'], "emp_id": row['emp_id']} for row in cursor.fetchall()}
     except Exception as e:
         print(f"Error loading user records: {e}")
-    
-    if not model_loaded:
-        print("No trained model found. Please register users.")
 
 def log_attendance_db(internal_id, user_data):
-    global today_log
-    name = user_data['name']
-    emp_id = user_data.get('emp_id', 'N/A')
+    log_attendance_batch([(internal_id, user_data)])
+
+def log_attendance_batch(recognized):
+    """Logs the (internal_id, user_data) pairs recognized in one frame: one
+    attendance event and one queued writer entry for all of them."""
     now = datetime.datetime.now()
-    time_str = now.strftime("%Y-%m-%d %H:%M:%S")
-
-    # Check cooldown locally
-    for entry in today_log:
-        if entry['id'] == emp_id:
-             try:
-                last_time = datetime.datetime.strptime(entry['time'], "%Y-%m-%d %H:%M:%S")
-                if (now - last_time).total_seconds() < COOLDOWN_SECONDS:
-                    return
-             except: pass
-
-    today_log.append({"name": name, "id": emp_id, "time": time_str})
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO attendance (user_id, name, emp_id, timestamp) VALUES (%s, %s, %s, %s)", 
-                          (internal_id, name, emp_id, now))
-            conn.commit()
-            print(f"Logged attendance for {name}")
-        except Exception as e:
-            print(f"Error Logging Attachment: {e}")
-        finally:
-            conn.close()
+    stamp = now.strftime("%Y-%m-%d %H:%M:%S")
+    rows, seq = [], None
+    for internal_id, user_data in recognized:
+        name = user_data['name']
+        emp_id = user_data.get('emp_id', 'N/A')
+        if not cooldowns.hit(emp_id):
+            continue  # logged within the last COOLDOWN_SECONDS
+        seq = today_log.append({"name": name, "id": emp_id, "time": stamp}, now)
+        rows.append((internal_id, name, emp_id, now))
+    if not rows:
+        return
+    pipeline_metrics.inc('attendance_logged', len(rows))
+    event_hub.publish("attendance", "attendance", seq)
+    # Written in batches by the background writer, off the request thread
+    attendance_writer.submit_many(rows)
+    print(f"Logged attendance for {', '.join(row[1] for row in rows)}")
+
+attendance_writer = AttendanceWriter(db_connection, batch_size=ATTENDANCE_BATCH,
+                                     flush_interval=ATTENDANCE_FLUSH_SECONDS, spill_dir=ATTENDANCE_SPILL_DIR)
+atexit.register(attendance_writer.close)  # flush queued rows on shutdown
+
+def append_segment_db(op, label, record):
+    """Persists one model record as a new row; nothing else is rewritten."""
+    try:
+        with db_connection() as conn:
+            if conn:
+                cursor = conn.cursor()
+                cursor.execute("INSERT INTO model_segments (op, label, data_blob) VALUES (%s, %s, %s)",
+                               (op, int(label), record))
+                conn.commit()
+    except Exception as e:
+        print(f"Error backing up model segment: {e}")
 
-def save_model_to_db():
-    """Saves the trainer.yml file to the database for persistence."""
-    if not os.path.exists(MODEL_FILE): return
+def replace_segments_db(records):
+    """Swaps the whole model_segments table for `records` in one transaction
+    (legacy import and compaction)."""
     try:
-        with open(MODEL_FILE, "rb") as f:
-            blob = f.read()
         conn = get_db_connection()
-        if conn:
+        if not conn: return
+        try:
             cursor = conn.cursor()
-            if DB_TYPE == 'postgres':
-                # PostgreSQL UPSERT
-                cursor.execute("""
-                    INSERT INTO system_storage (key_name, data_blob, updated_at) 
-                    VALUES (%s, %s, %s)
-                    ON CONFLICT (key_name) 
-                    DO UPDATE SET data_blob = EXCLUDED.data_blob, updated_at = EXCLUDED.updated_at
-                """, ('trainer_model', blob, datetime.datetime.now()))
-            else:
-                # MySQL REPLACE
-                cursor.execute("REPLACE INTO system_storage (key_name, data_blob) VALUES ('trainer_model', %s)", (blob,))
-            
+            cursor.execute("DELETE FROM model_segments")
+            digest = hashlib.sha256()
+            for record in records:
+                cursor.execute("INSERT INTO model_segments (op, label, data_blob) VALUES (%s, %s, %s)",
+                               (OP_ADD, record_label(record), record))
+                digest.update(record)
+            # Checked by load_segments_from_db; covers these rows, not later appends
+            cursor.execute("SELECT MAX(id) FROM model_segments")
+            max_id = cursor.fetchone()[0] or 0
+            cursor.execute("DELETE FROM system_storage WHERE key_name = %s", (MODEL_DIGEST_KEY,))
+            cursor.execute("INSERT INTO system_storage (key_name, data_blob) VALUES (%s, %s)",
+                           (MODEL_DIGEST_KEY, f"{max_id} {digest.hexdigest()}".encode()))
             conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
             conn.close()
-            print("Model backed up to database.")
     except Exception as e:
-        print(f"Error backing up model: {e}")
+        print(f"Error compacting model segments in DB: {e}")
 
-def save_new_user():
-    global user_db, reg_faces, reg_faces_color, reg_name, reg_emp_id, recognizer
-    if not reg_faces: return False
+def compact_model_if_needed():
+    """Hold shared_gallery.lock(). This worker's view of the log only counts
+    its own appends, so it never compacts early; re-read before deciding."""
+    if not model_store.log.needs_compaction(): return
+    model_store.load()
+    if not model_store.log.needs_compaction(): return
+    records = model_store.compact()
+    replace_segments_db(records)
+    shared_gallery.set_log_bytes(model_store.size())
+    print(f"Model store compacted to {len(records)} segments.")
+
+def delete_user_model(label):
+    """Tombstones a user's face samples locally and in the DB."""
+    with shared_gallery.lock():
+        record = model_store.delete(label)
+        append_segment_db(OP_TOMBSTONE, label, record)
+        shared_gallery.remove(label, model_store.size())
+        compact_model_if_needed()
+    refresh_model()
+    save_face_index()
+
+def insert_user_row(reg_name, reg_emp_id, reg_faces_color):
+    """Creates the users row (or finds it for an existing emp_id) with the
+    profile image; returns its id, or None."""
     try:
         conn = get_db_connection()
-        if not conn: return False
+        if not conn: return None
         cursor = conn.cursor()
         
         # Save profile image
@@ -314,6 +655,7 @@ def save_new_user():
             if success: img_blob = encoded.tobytes()
 
         new_internal_id = None
+        reenrolled = False
         try:
             if DB_TYPE == 'postgres':
                 # Postgres logic
@@ -322,7 +664,8 @@ def save_new_user():
                                    (reg_name, reg_emp_id, img_blob))
                      res = cursor.fetchone()
                      if res: new_internal_id = res[0]
-                except psycopg2.errors.UniqueViolation:
+                except db_config.integrity_errors():
+                     reenrolled = True
                      conn.rollback()
                      cursor = conn.cursor() # Get new cursor after rollback
                      cursor.execute("SELECT id FROM users WHERE emp_id = %s", (reg_emp_id,))
@@ -330,16 +673,23 @@ def save_new_user():
                      if row: new_internal_id = row[0]
                      
             else:
-                # MySQL logic
+                # MySQL (and SQLite) logic
                 try:
                     cursor.execute("INSERT INTO users (name, emp_id, profile_image) VALUES (%s, %s, %s)", (reg_name, reg_emp_id, img_blob))
                     new_internal_id = cursor.lastrowid
-                except mysql.connector.errors.IntegrityError:
+                except db_config.integrity_errors():
+                    reenrolled = True
                     cursor.execute("SELECT id FROM users WHERE emp_id = %s", (reg_emp_id,))
                     res = cursor.fetchone()
                     if res: new_internal_id = res[0]
 
+            if new_internal_id is not None and img_blob:
+                if reenrolled:
+                    # Re-enrollment: the new capture replaces the old photo
+                    cursor.execute("UPDATE users SET profile_image = %s WHERE id = %s", (img_blob, new_internal_id))
+                save_thumbnail(cursor, reg_emp_id, make_thumbnail(img_blob))
             conn.commit()
+            image_cache.invalidate(reg_emp_id)
         except Exception as e:
             print(f"DB Save User Error: {e}")
             conn.rollback()
@@ -348,181 +698,516 @@ def save_new_user():
 
         if new_internal_id is None:
              print("Failed to get User ID")
-             return False
+        return new_internal_id
+    except Exception as e:
+        print(f"Error saving user: {e}")
+        return None
 
-        user_db[new_internal_id] = {"name": reg_name, "emp_id": reg_emp_id}
-        
-        # Train recognizer
-        faces_np = [np.array(f, dtype=np.uint8) for f in reg_faces]
-        ids_np = np.array([new_internal_id]*len(reg_faces))
+def save_thumbnail(cursor, emp_id, thumb):
+    if thumb is None: return
+    cursor.execute("DELETE FROM profile_thumbs WHERE emp_id = %s", (emp_id,))
+    cursor.execute("INSERT INTO profile_thumbs (emp_id, data_blob) VALUES (%s, %s)", (emp_id, thumb))
+
+def fetch_profile_image(emp_id, variant):
+    """JPEG bytes from the database, or None if there is no image. A missing
+    thumbnail (users enrolled before thumbnails existed) is made and saved."""
+    with db_connection() as conn:
+        if not conn: raise ConnectionError("database unavailable")
+        cursor = conn.cursor()
+        if variant == 'thumb':
+            cursor.execute("SELECT data_blob FROM profile_thumbs WHERE emp_id = %s", (emp_id,))
+            row = cursor.fetchone()
+            if row and row[0]:
+                return blob_bytes(row[0])
+        cursor.execute("SELECT profile_image FROM users WHERE emp_id = %s", (emp_id,))
+        row = cursor.fetchone()
+        if not (row and row[0]):
+            return None
+        img = blob_bytes(row[0])
+        if variant == 'thumb':
+            thumb = make_thumbnail(img)
+            save_thumbnail(cursor, emp_id, thumb)
+            conn.commit()
+            return thumb
+        return img
 
+def train_registrations(jobs):
+    """Training worker handler: one model update for a batch of queued
+    registrations. Returns (ok, error) per job."""
+    for job in jobs:
+        publish_registration(sessions.get(job.payload['kiosk_id']))  # now 'training'
+    results, new_hists, new_labels = [], [], []
+    for job in jobs:
+        reg = job.payload
         try:
-            if os.path.exists(MODEL_FILE):
-                 recognizer.update(faces_np, ids_np)
-            else:
-                recognizer.train(faces_np, ids_np)
-            recognizer.write(MODEL_FILE)
-            save_model_to_db() # Persist to DB
-            return True
+            with pipeline_metrics.stage('train_user_row'):
+                internal_id = insert_user_row(reg['name'], reg['emp_id'], reg['faces_color'])
+            if internal_id is None:
+                results.append((False, "could not save user"))
+                continue
+            with pipeline_metrics.stage('train_histograms'):
+                hists = matcher.histograms([np.array(f, dtype=np.uint8) for f in reg['faces']])
+            new_hists.append(hists)
+            new_labels.append(np.full(len(hists), internal_id, np.int32))
+            user_db[internal_id] = {"name": reg['name'], "emp_id": reg['emp_id']}
+            results.append((True, None))
         except Exception as e:
-            print(f"Training Error: {e}")
-            return False
+            print(f"Registration Error: {e}")
+            results.append((False, str(e)))
+    if not new_hists:
+        return results
 
+    try:
+        # Append only these people's histograms, locally and as one DB row each,
+        # then publish them to every worker in a single generation bump
+        with pipeline_metrics.stage('train_publish'), shared_gallery.lock():
+            for hists, labels in zip(new_hists, new_labels):
+                record = model_store.add(int(labels[0]), hists)
+                append_segment_db(OP_ADD, int(labels[0]), record)
+            shared_gallery.append(np.vstack(new_hists), np.concatenate(new_labels), model_store.size())
+            compact_model_if_needed()
+        with pipeline_metrics.stage('train_refresh'):
+            refresh_model()  # new matcher built aside, then swapped in
+            save_face_index()
     except Exception as e:
-        print(f"Error saving model: {e}")
-        return False
+        print(f"Training Error: {e}")
+        results = [(False, str(e)) if ok else (ok, error) for ok, error in results]
+    finally:
+        pipeline_metrics.inc('registrations_trained', sum(ok for ok, _ in results))
+    return results
+
+def requires_ready(view):
+    """503 with Retry-After until the startup thread has loaded the model."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not startup.ready:
+            response = jsonify({"success": False, "error": "Starting up"})
+            response.status_code = 503
+            response.headers['Retry-After'] = '1'
+            return response
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the worker is up and answering."""
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: schema checked, detector and model loaded (503 until then)."""
+    return jsonify(startup.snapshot()), 200 if startup.ready else 503
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    # STREAM_URL points the page at stream_server.py; empty means plain HTTP polling
+    return render_template('index.html', stream_url=os.environ.get('STREAM_URL', ''))
 
-@app.route('/process_frame', methods=['POST'])
-def process_frame():
-    global app_mode, reg_counter, reg_faces, reg_faces_color, reg_status_msg, latest_recognition
-    
-    data = request.json
-    frame_data = data.get('image')
-    if not frame_data:
-        return jsonify({"success": False, "error": "No image data"})
+# Raw frame uploads skip the base64/JSON round trip entirely
+RAW_FRAME_MIMETYPES = ('application/octet-stream', 'image/jpeg', 'image/webp')
+
+def decode_frame(buf):
+    """Decodes JPEG/WebP bytes straight from the request buffer (no intermediate copies)."""
+    if not buf: return None
+    return cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_COLOR)
 
+def read_request_frame():
+    """Returns (frame, error) from a raw, multipart or legacy JSON data-URL request body."""
+    mimetype = request.mimetype
+    if mimetype in RAW_FRAME_MIMETYPES:
+        buf = request.get_data(cache=False)
+    elif mimetype == 'multipart/form-data':
+        upload = request.files.get('image')
+        if not upload: return None, "No image data"
+        stream = upload.stream
+        # Small uploads are spooled in a BytesIO; view its buffer instead of copying it
+        buf = stream.getbuffer() if hasattr(stream, 'getbuffer') else upload.read()
+    else:
+        # Legacy path: JSON body carrying a base64 data URL
+        data = request.get_json(silent=True) or {}
+        frame_data = data.get('image')
+        if not frame_data: return None, "No image data"
+        try:
+            with pipeline_metrics.stage('base64'):
+                buf = base64.b64decode(frame_data.split(',')[1])
+        except Exception:
+            return None, "Invalid image format"
+
+    if not buf: return None, "No image data"
     try:
-        # Decode base64 image
-        img_data = base64.b64decode(frame_data.split(',')[1])
-        nparr = np.frombuffer(img_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if frame is None: return jsonify({"success": False, "error": "Decode failed"})
-    except:
-        return jsonify({"success": False, "error": "Invalid image format"})
+        with pipeline_metrics.stage('decode'):
+            frame = decode_frame(buf)
+    except Exception:
+        return None, "Invalid image format"
+    if frame is None: return None, "Decode failed"
+    return frame, None
+
+def analyze_frame(frame, session):
+    """Runs registration capture or attendance recognition on one BGR frame
+    for the given kiosk session. Shared by the HTTP endpoint and the
+    WebSocket stream server."""
+    response_data = {"success": True, "faces": []}
+    pre = get_preprocessor()
     
-    try:
-        response_data = {"success": True, "faces": []}
+    pipeline_metrics.inc('frames')
+    if session.mode == 'registration':
+        with pipeline_metrics.stage('preprocess'):
+            _, small_gray = pre.prepare(frame)
+        with pipeline_metrics.stage('detect'):
+            # minSize is in detection-image pixels: (60, 60) at full resolution
+            faces = [pre.to_full(box) for box in face_cascade.detectMultiScale(small_gray, 1.1, 5, minSize=(30, 30))]
+        pipeline_metrics.inc('faces', len(faces))
         
-        if app_mode == 'registration':
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            gray = clahe.apply(gray)
-            faces = face_cascade.detectMultiScale(gray, 1.1, 5, minSize=(60, 60))
-            
-            for (x,y,w,h) in faces:
-                response_data['faces'].append({"x": int(x), "y": int(y), "w": int(w), "h": int(h)})
-                if reg_counter < 40 and reg_status_msg == "processing":
-                    # Standardize face size
-                    face_roi = cv2.resize(gray[y:y+h, x:x+w], FACE_SIZE)
-                    reg_faces.append(face_roi)
-                    reg_faces_color.append(frame[y:y+h, x:x+w])
-                    reg_counter += 1
-                    if reg_counter >= 40:
-                        reg_status_msg = "training"
-                        threading.Thread(target=finish_registration).start()
-                        
-        elif app_mode == 'attendance':
-            small_frame = cv2.resize(frame, (0, 0), fx=0.5, fy=0.5)
-            small_gray = cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY)
-            small_gray = clahe.apply(small_gray)
-            faces_small = face_cascade.detectMultiScale(small_gray, 1.1, 5, minSize=(30, 30))
-            
-            gray_full = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            gray_full = clahe.apply(gray_full)
-    
-            for (x, y, w, h) in faces_small:
-                x, y, w, h = int(x*2), int(y*2), int(w*2), int(h*2)
+        for (x,y,w,h) in faces:
+            response_data['faces'].append({"x": int(x), "y": int(y), "w": int(w), "h": int(h)})
+            with session.lock:
+                if session.reg_counter < 40 and session.reg_status_msg == "processing":
+                    # Standardize face size and contrast
+                    with pipeline_metrics.stage('register_capture'):
+                        session.reg_faces.append(pre.face((x, y, w, h)))
+                    session.reg_faces_color.append(frame[y:y+h, x:x+w])
+                    session.reg_counter += 1
+                    if session.reg_counter >= 40:
+                        queue_registration(session)
+                    publish_registration(session)
+                    
+    elif session.mode == 'attendance':
+        refresh_model()
+        with pipeline_metrics.stage('preprocess'):
+            _, small_gray = pre.prepare(frame)
+
+        with session.lock:
+            if session.tracker is None:
+                session.tracker = FaceTracker(detect_every=TRACK_DETECT_EVERY)
+            tracker = session.tracker
+            # Full cascade only every few frames; identities are cached per track
+            # and re-checked on each cascade pass
+            with pipeline_metrics.stage('track'):
+                tracks = tracker.update(small_gray, detect_faces)
+            pipeline_metrics.inc('faces', len(tracks))
+
+            # Every face that needs a prediction is scored in one batch
+            pending = [t for t in tracks if tracker.needs_recognition(t)] if user_db else []
+            if pending:
+                try:
+                    with pipeline_metrics.stage('predict'):
+                        results = predict_faces(pre.faces([pre.to_full(t.box) for t in pending]))
+                    for track, (id_label, conf) in zip(pending, results):
+                        known = conf < CONFIDENCE_THRESHOLD and id_label in user_db
+                        pipeline_metrics.inc('recognitions' if known else 'unknowns')
+                        # A re-check that misses or names someone else replaces the cached identity
+                        track.set_identity(id_label if known else None, conf, tracker.frame_index)
+                except Exception as e:
+                    print(f"Prediction Error: {e}")
+
+            recognized = []
+            for track in tracks:
+                x, y, w, h = pre.to_full(track.box)
                 name = "Unknown"
                 emp_id = ""
-                conf_val = 999
-                
-                if user_db:
-                    try:
-                        face_roi = cv2.resize(gray_full[y:y+h, x:x+w], FACE_SIZE)
-                        id_label, conf = recognizer.predict(face_roi)
-                        conf_val = conf
-                        
-                        if conf < CONFIDENCE_THRESHOLD:
-                            user_data = user_db.get(id_label)
-                            if user_data:
-                                name = user_data['name']
-                                emp_id = user_data['emp_id']
-                                log_attendance_db(id_label, user_data)
-                                latest_recognition = {"name": name, "emp_id": emp_id, "time": time.time()}
-                    except Exception as e:
-                        print(f"Prediction Error: {e}")
+                user_data = user_db.get(track.label) if track.recognized else None
+                if user_data:
+                    name = user_data['name']
+                    emp_id = user_data['emp_id']
+                    recognized.append((track.label, user_data))
+                    publish_recognition(session, {"name": name, "emp_id": emp_id, "time": time.time()})
                 
                 response_data['faces'].append({
                     "x": x, "y": y, "w": w, "h": h, 
-                    "name": name, "emp_id": emp_id, "conf": int(conf_val)
+                    "name": name, "emp_id": emp_id, "conf": client_conf(track.distance)
                 })
+            if recognized:
+                with pipeline_metrics.stage('attendance'):
+                    log_attendance_batch(recognized)
+
+    return response_data
 
-        return jsonify(response_data)
+def client_conf(distance):
+    """Distance as the clients show it; 999 (as before the matcher) when
+    nothing was matched, e.g. an empty model."""
+    return int(distance) if np.isfinite(distance) and distance < NO_MATCH[1] else 999
 
+def detect_faces(small_gray):
+    """Full cascade pass for the tracker (only every few frames)."""
+    with pipeline_metrics.stage('detect'):
+        return face_cascade.detectMultiScale(small_gray, 1.1, 5, minSize=(30, 30))
+
+def current_session():
+    """Session for the calling kiosk (X-Kiosk-Id header or ?kiosk= parameter)."""
+    kiosk_id = request.headers.get('X-Kiosk-Id') or request.args.get('kiosk')
+    return sessions.get(kiosk_id)
+
+@app.route('/process_frame', methods=['POST'])
+@requires_ready
+def process_frame():
+    with pipeline_metrics.stage('frame'):
+        return handle_frame_request()
+
+def handle_frame_request():
+    frame, error = read_request_frame()
+    if frame is None:
+        return jsonify({"success": False, "error": error})
+    
+    try:
+        session = current_session()
+        # With several workers the kiosk's mode may have been set on another
+        # one; the page sends its current mode along with every frame.
+        hinted_mode = request.headers.get('X-Kiosk-Mode')
+        if hinted_mode in ('idle', 'attendance') and not session.busy:
+            session.mode = hinted_mode
+        return jsonify(analyze_frame(frame, session))
     except Exception as e:
         print(f"Error in process_frame: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({"success": False, "error": str(e)})
 
-def finish_registration():
-    global reg_status_msg, reg_faces, reg_faces_color, app_mode
-    if save_new_user():
-        reg_status_msg = "complete"
-    else:
-        reg_status_msg = "error"
-    time.sleep(2)
-    reg_status_msg = "idle"
-    reg_faces, reg_faces_color = [], []
-    app_mode = 'idle'
+def queue_registration(session):
+    """Hands a finished capture to the training worker (hold session.lock)."""
+    payload = {"kiosk_id": session.kiosk_id, "name": session.reg_name, "emp_id": session.reg_emp_id,
+               "faces": session.reg_faces, "faces_color": session.reg_faces_color}
+    try:
+        session.reg_job = training_service.submit(payload)
+        session.reg_status_msg = "queued"
+    except QueueFull as e:
+        print(f"Registration rejected: {e}")
+        session.reg_job = None
+        session.reg_status_msg = "error"
+        threading.Timer(2, end_registration, args=(session, session.reg_attempt)).start()
+
+def registration_finished(job):
+    session = sessions.get(job.payload['kiosk_id'])
+    with session.lock:
+        if session.reg_job is not job: return  # the kiosk has started another registration
+        session.reg_status_msg = "complete" if job.status == 'done' else "error"
+        publish_registration(session)
+        attempt = session.reg_attempt
+    threading.Timer(2, end_registration, args=(session, attempt)).start()
+
+def end_registration(session, attempt):
+    with session.lock:
+        if session.reg_attempt != attempt: return  # a newer registration owns the session
+        session.reg_status_msg = "idle"
+        session.reg_job = None
+        session.reset_registration()
+        session.mode = 'idle'
+        publish_registration(session)
+
+training_service = TrainingService(train_registrations, maxsize=TRAIN_QUEUE_SIZE, max_batch=TRAIN_MAX_BATCH,
+                                   on_finish=registration_finished, nice=TRAIN_NICE)
+
+def set_app_mode(session, mode):
+    if mode in ['idle', 'attendance', 'registration']:
+        with session.lock:
+            session.mode = mode
+            session.tracker = None
+            publish_registration(session)
+        return True
+    return False
+
+def start_registration(session, name, emp_id):
+    if not (name and emp_id): return False
+    with session.lock:
+        if session.reg_status_msg in ("queued", "training"): return False
+        session.reg_name, session.reg_emp_id = name, emp_id
+        session.reset_registration()
+        session.reg_attempt += 1  # pending end_registration timers now leave it alone
+        session.reg_job = None
+        session.reg_status_msg, session.mode = "processing", 'registration'
+        publish_registration(session)
+    return True
+
+def registration_snapshot(session):
+    snapshot = {"status": session.reg_status_msg, "progress": session.reg_counter, "mode": session.mode,
+                "queue": training_service.stats()}
+    job = session.reg_job
+    if job is not None:
+        snapshot["job"] = dict(job.snapshot(), position=training_service.position(job))
+    return snapshot
+
+def publish_registration(session):
+    event_hub.publish(session.kiosk_id, "registration", registration_snapshot(session))
+
+def publish_recognition(session, latest):
+    """Records the kiosk's latest recognition; pushes it when the person
+    changes, and again every few seconds while they stay in view."""
+    previous = session.latest_recognition
+    session.latest_recognition = latest
+    if previous['emp_id'] != latest['emp_id'] or latest['time'] - session.recognition_pushed >= RECOGNITION_REPUSH_SECONDS:
+        session.recognition_pushed = latest['time']
+        event_hub.publish(session.kiosk_id, "recognition", latest)
+
+def recognition_snapshot(session):
+    latest = session.latest_recognition
+    if time.time() - latest['time'] < 4.0:
+        return latest
+    return {}
 
 @app.route('/set_mode')
 def set_mode():
-    global app_mode
-    mode = request.args.get('mode')
-    if mode in ['idle', 'attendance', 'registration']:
-        app_mode = mode
-        return jsonify({"success": True, "mode": app_mode})
+    session = current_session()
+    if set_app_mode(session, request.args.get('mode')):
+        return jsonify({"success": True, "mode": session.mode})
     return jsonify({"success": False})
 
 @app.route('/register_start')
+@requires_ready
 def register_start():
-    global app_mode, reg_name, reg_emp_id, reg_counter, reg_faces, reg_faces_color, reg_status_msg
-    name, emp_id = request.args.get('name'), request.args.get('emp_id')
-    if name and emp_id:
-        reg_name, reg_emp_id, reg_counter = name, emp_id, 0
-        reg_faces, reg_faces_color = [], []
-        reg_status_msg, app_mode = "processing", 'registration'
+    if start_registration(current_session(), request.args.get('name'), request.args.get('emp_id')):
         return jsonify({"success": True})
     return jsonify({"success": False})
 
 @app.route('/registration_status')
 def registration_status():
-    return jsonify({"status": reg_status_msg, "progress": reg_counter, "mode": app_mode})
+    job_id = request.args.get('job', type=int)
+    if job_id is not None:
+        # Any job by id (e.g. polled from another worker's kiosk), plus the queue
+        job = training_service.get(job_id)
+        return jsonify({"job": job.snapshot() if job else None, "queue": training_service.stats()})
+    return jsonify(registration_snapshot(current_session()))
 
 @app.route('/get_attendance')
 def get_attendance():
-    return jsonify(today_log)
+    """Today's entries. With ?since=<seq>, only what is newer than that
+    cursor plus the per-employee summaries it changed; 304 when the client's
+    ETag says it is already up to date."""
+    since = request.args.get('since', type=int)
+    day, seq = today_log.version()
+    etag = f"{day}-{seq}" if since is None else f"{day}-{seq}-{since}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    elif since is None:
+        response = jsonify(today_log.entries())
+    else:
+        feed = today_log.feed(since)
+        etag = f"{feed['day']}-{feed['seq']}-{since}"  # an entry may have landed since version()
+        response = jsonify(feed)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/delete_user', methods=['POST'])
+@requires_ready
+def delete_user():
+    """Stops recognizing an employee: tombstones their face samples. The
+    users row is kept so past attendance still resolves."""
+    emp_id = (request.get_json(silent=True) or {}).get('emp_id') or request.args.get('emp_id')
+    # A copy: the training thread adds registrations to user_db meanwhile
+    internal_id = next((uid for uid, u in list(user_db.items()) if u['emp_id'] == emp_id), None)
+    if internal_id is None:
+        return jsonify({"success": False, "error": "Unknown employee"})
+    delete_user_model(internal_id)
+    user_db.pop(internal_id, None)
+    return jsonify({"success": True})
+
+@app.route('/events')
+def events():
+    """Server-sent events for one kiosk (?kiosk=): 'registration' and
+    'recognition' when they change, 'attendance' feeds as entries arrive."""
+    session = current_session()
+    try:
+        sub = event_hub.subscribe([session.kiosk_id, "attendance"])
+    except TooManySubscribers as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+
+    def stream():
+        cursor, deadline = 0, time.monotonic() + EVENTS_MAX_SECONDS
+        try:
+            yield "retry: 2000\n\n"
+            yield format_sse("registration", registration_snapshot(session))
+            pending = [("attendance", None)]
+            while time.monotonic() < deadline:
+                for kind, data in pending:
+                    if kind == "attendance":
+                        feed = today_log.feed(cursor)
+                        cursor = feed["seq"]
+                        data = feed
+                    yield format_sse(kind, data)
+                pending = sub.get(timeout=EVENTS_KEEPALIVE_SECONDS)
+                if not pending:
+                    yield ": keepalive\n\n"  # also notices closed connections
+        finally:
+            sub.close()
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/current_recognition')
 def current_recognition():
-    if time.time() - latest_recognition['time'] < 4.0:
-        return jsonify(latest_recognition)
-    return jsonify({})
+    return jsonify(recognition_snapshot(current_session()))
 
 @app.route('/user_image/<emp_id>')
+@requires_ready
 def user_image(emp_id):
+    """Profile photo (?size=thumb for the small one). Served from the image
+    cache with an ETag; the database is only read on a cache miss."""
+    variant = 'thumb' if request.args.get('size') == 'thumb' else 'full'
+    state = shared_gallery.state()
+    generation = state[0] if state else 0
+    image_cache.validate(generation)  # (re-)enrollments publish a new generation
+    item = image_cache.get(emp_id, variant)
+    if item is None:
+        try:
+            item = image_cache.put(emp_id, variant, fetch_profile_image(emp_id, variant), generation)
+        except Exception as e:
+            print(f"Profile image error: {e}")
+            return "", 404
+    if item is MISSING:
+        return "", 404
+    etag, img = item
+    response = Response(img, mimetype='image/jpeg')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=60'
+    return response.make_conditional(request)
+
+@app.route('/db_stats')
+def db_stats():
+    """Connection pool usage (checkouts, wait times, reconnects, in-use peak)
+    and the attendance writer's queue, batch and spill counters."""
+    return jsonify(dict(db_pool.metrics(), attendance_writer=attendance_writer.metrics()))
+
+# Component stats, read when /metrics is scraped
+pipeline_metrics.collector('db_pool', db_pool.metrics)
+pipeline_metrics.collector('attendance_writer', attendance_writer.metrics)
+pipeline_metrics.collector('training', training_service.stats)
+pipeline_metrics.collector('events', event_hub.stats)
+pipeline_metrics.collector('profile_images', image_cache.metrics)
+pipeline_metrics.collector('model', lambda: {"samples": len(matcher), "users": len(user_db)})
+pipeline_metrics.collector('startup', startup.metrics)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text: per-stage latency histograms, frame/face/recognition
+    counters and component stats for this worker (?format=json for p50/p95/p99)."""
+    if request.args.get('format') == 'json':
+        return jsonify(pipeline_metrics.snapshot())
+    return Response(pipeline_metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+_profile_lock = threading.Lock()
+
+@app.route('/debug/profile')
+def debug_profile():
+    """Samples every thread's stack for ?seconds= (default 10, max 60) and
+    returns collapsed stacks for flamegraph tools. Needs PROFILER_ENABLED=1."""
+    if not PROFILER_ENABLED:
+        return "", 404
+    if not _profile_lock.acquire(blocking=False):
+        return jsonify({"success": False, "error": "a profile is already running"}), 409
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT profile_image FROM users WHERE emp_id = %s", (emp_id,))
-        row = cursor.fetchone()
-        conn.close()
-        # Handle Postgres bytes/memoryview
-        if row and row[0]:
-            img = row[0]
-            if hasattr(img, 'tobytes'): img = img.tobytes()
-            return Response(img, mimetype='image/jpeg')
-    except: pass
-    return "", 404
-
-# Initialize App
-with app.app_context():
-    init_db()
-    load_resources()
+        seconds = min(max(request.args.get('seconds', 10, type=float), 0.1), 60)
+        profiler = SamplingProfiler(interval=max(request.args.get('interval', 0.005, type=float), 0.001))
+        profiler.start()
+        time.sleep(seconds)
+        profiler.stop()
+        return Response(profiler.collapsed(), mimetype='text/plain')
+    finally:
+        _profile_lock.release()
+
+# Initialize App: only cheap setup happens at import; the slow phases run
+# on a background thread (inline with STARTUP_BACKGROUND=0) while / is served
+startup.mark('import')
+startup.run([('detector', load_detector), ('schema', init_db), ('model', load_resources)],
+            background=STARTUP_BACKGROUND)
 
 if __name__ == '__main__':
     # For local running
@@ -5,6 +5,8 @@ import numpy as np
 import datetime
 import pyttsx3
 import time
+from preprocess import FramePreprocessor
+from video_pipeline import Announcer, CaptureThread, FrameSlot, RateMeter, RecognitionWorker
 
 # Configuration
 DATA_FILE = "encodings.pickle" # We will reuse this name but store LBPH model data differently or separate files
@@ -13,18 +15,30 @@ LABELS_FILE = "labels.pickle"
 ATTENDANCE_FILE = "attendance_log.csv"
 COOLDOWN_SECONDS = 30
 CONFIDENCE_THRESHOLD = 50 
+SAMPLE_INTERVAL = 0.1  # seconds between registration samples
+ANNOUNCE_REPEAT_SECONDS = 10  # the same announcement is not repeated sooner
 # Note: For LBPH, confidence is 'distance'. 
 # Lower is better. 0 = perfect match. < 50 is good. > 80 is unknown.
 
-# Initialize Text-to-Speech
-try:
-    engine = pyttsx3.init()
-    engine.setProperty('rate', 150)
-except Exception as e:
-    print(f"Warning: TTS initialization failed: {e}")
-    engine = None
+# Text-to-Speech, initialized on first use by the thread that speaks
+# (the Announcer's), since pyttsx3 engines are not shared across threads
+engine = None
+_engine_ready = False
+
+def get_engine():
+    global engine, _engine_ready
+    if not _engine_ready:
+        _engine_ready = True
+        try:
+            engine = pyttsx3.init()
+            engine.setProperty('rate', 150)
+        except Exception as e:
+            print(f"Warning: TTS initialization failed: {e}")
+    return engine
 
 def speak(text):
+    """Blocks until `text` has been spoken; only the Announcer calls this."""
+    engine = get_engine()
     if engine:
         try:
             engine.say(text)
@@ -39,8 +53,8 @@ face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_fronta
 # Initialize Recognizer
 recognizer = cv2.face.LBPHFaceRecognizer_create()
 
-# Initialize CLAHE
-clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+# Shared preprocessing (grayscale once per frame, CLAHE on face crops only)
+preprocessor = FramePreprocessor(scale=0.5)
 
 def load_data():
     """Laws trained model and labels."""
@@ -93,9 +107,8 @@ def get_face_capture(cap):
         ret, frame = cap.read()
         if not ret: break
         
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        gray = clahe.apply(gray) # Apply CLAHE
-        faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+        _, small_gray = preprocessor.prepare(frame)
+        faces = [preprocessor.to_full(box) for box in face_cascade.detectMultiScale(small_gray, 1.3, 5)]
         
         # Draw all
         for (x,y,w,h) in faces:
@@ -108,8 +121,7 @@ def get_face_capture(cap):
         key = cv2.waitKey(1) & 0xFF
         if key == ord('c'):
             if len(faces) == 1:
-                (x, y, w, h) = faces[0]
-                return gray[y:y+h, x:x+w]
+                return preprocessor.face(faces[0])
             elif len(faces) == 0:
                 print("No face detected.")
             else:
@@ -119,10 +131,12 @@ def get_face_capture(cap):
 
 
 
-def register_new_user(cap, current_label_map):
+def register_new_user(slot, current_label_map, say):
     """
     Walks user through capturing multiple photos for training.
     Uses Tkinter for input to avoid freezing the OpenCV window.
+    Frames come from the capture thread's slot; the caller pauses
+    recognition while this runs.
     """
     # Create a hidden root window for the dialog
     import tkinter as tk
@@ -132,13 +146,13 @@ def register_new_user(cap, current_label_map):
     root.withdraw() # Hide the main window
     root.attributes('-topmost', True) # Make sure popup is on top
     
-    speak("Do you want to register a new user?")
+    say("Do you want to register a new user?")
     # We can just prompt for name immediately
     name = simpledialog.askstring("Register Face", "Enter Name for new user (Click Cancel to skip):")
     root.destroy()
     
     if not name: 
-        speak("Registration cancelled.")
+        say("Registration cancelled.")
         return current_label_map
     
     if name in current_label_map:
@@ -152,36 +166,43 @@ def register_new_user(cap, current_label_map):
         current_label_map[name] = user_id
         
     print(f"Capturing faces for {name}. Look at the camera.")
-    speak("Please look at the camera. I need to take 10 photos.")
+    say("Please look at the camera. I need to take 20 photos.")
     
     collected_faces = []
     collected_ids = []
     
     count = 0
+    seq = 0
+    last_sample = 0.0
     while count < 20: # Take 20 samples
-        ret, frame = cap.read()
-        if not ret: break
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        gray = clahe.apply(gray) # Apply CLAHE
-        faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+        frame = slot.get(after=seq, timeout=2.0)
+        if frame is None: break
+        seq = frame.seq
+        image = frame.image.copy()  # the slot's frame is shared with the display
+        _, small_gray = preprocessor.prepare(image)
+        faces = [preprocessor.to_full(box) for box in face_cascade.detectMultiScale(small_gray, 1.3, 5)]
         
         for (x,y,w,h) in faces:
-            cv2.rectangle(frame, (x,y), (x+w,y+h), (0,255,0), 2)
-            # Save the face region
-            collected_faces.append(gray[y:y+h, x:x+w])
-            collected_ids.append(user_id)
-            count += 1
-            cv2.waitKey(100) # Small delay
+            cv2.rectangle(image, (x,y), (x+w,y+h), (0,255,0), 2)
+            # Spaced out in time instead of sleeping in waitKey, so the video keeps running
+            now = time.perf_counter()
+            if count < 20 and now - last_sample >= SAMPLE_INTERVAL:
+                # Save the normalized face region
+                collected_faces.append(preprocessor.face((x, y, w, h)))
+                collected_ids.append(user_id)
+                count += 1
+                last_sample = now
             
-        cv2.putText(frame, f"Capturing: {count}/20", (10, 30), 
+        cv2.putText(image, f"Capturing: {count}/20", (10, 30), 
                     cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-        cv2.imshow('Attendance System', frame)
+        cv2.imshow('Attendance System', image)
         cv2.waitKey(1)
-        
-        if count >= 20:
-             break
 
-    speak("Capture complete. Model updating.")
+    if not collected_faces:
+        say("Registration failed. No face captured.")
+        return current_label_map
+
+    say("Capture complete. Model updating.")
     
     # We need to re-train the model with ALL data. 
     recognizer.update(collected_faces, np.array(collected_ids))
@@ -191,10 +212,63 @@ def register_new_user(cap, current_label_map):
     with open(LABELS_FILE, "wb") as f:
         pickle.dump(current_label_map, f)
         
-    speak("Registration successful.")
+    say("Registration successful.")
     return current_label_map
 
 
+def recognize_faces(image, id_to_name, last_attendance, say):
+    """Detects and recognizes every face in `image` and logs attendance.
+    Runs on the recognition worker; returns [((x, y, w, h), name, color)]."""
+    # Grayscale once, detect on the downscaled copy
+    _, small_gray = preprocessor.prepare(image)
+
+    faces_small = face_cascade.detectMultiScale(small_gray, 1.2, 5)
+    
+    results = []
+    for (x, y, w, h) in (preprocessor.to_full(box) for box in faces_small):
+        name = "Unknown"
+        color = (0, 0, 255)
+        # Recognize
+        if id_to_name: # Only if we have a model
+            try:
+                # Full-res face crop, CLAHE applied to the crop only
+                id_, confidence = recognizer.predict(preprocessor.face((x, y, w, h)))
+                
+                # Check confidence
+                # Confidence is distance: 0 is match, 100+ is mismatch
+                if confidence < 75: 
+                    name = id_to_name.get(id_, "Unknown")
+                    
+                    # Attendance
+                    now = datetime.datetime.now()
+                    if name in last_attendance:
+                         delta = (now - last_attendance[name]).total_seconds()
+                    else:
+                         delta = 999
+                         
+                    if delta > COOLDOWN_SECONDS:
+                        mark_attendance(name)
+                        last_attendance[name] = now
+                        say(f"Thank you {name}")  # queued; never holds up the video
+                        
+                    color = (0, 255, 0)
+            except Exception as e:
+                name = "Unknown"
+                color = (0, 0, 255)
+        results.append(((x, y, w, h), name, color))
+    return results
+
+def draw_status(image, display_meter, latency_ms, worker):
+    """End-to-end FPS and capture-to-display latency, plus the recognition
+    worker's own rate and latency."""
+    result = worker.latest
+    recog_ms = (result.finished_at - result.captured_at) * 1000 if result else 0.0
+    lines = [f"Display {display_meter.rate():4.1f} fps  latency {latency_ms:4.0f} ms",
+             f"Recognition {worker.meter.rate():4.1f} fps  {recog_ms:4.0f} ms"]
+    for i, text in enumerate(lines):
+        cv2.putText(image, text, (10, 25 + 22 * i), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+
+
 def main():
     import tkinter as tk
     from tkinter import messagebox
@@ -214,90 +288,70 @@ def main():
         print("ERROR: Could not open video source. Please check your camera permissions.")
         speak("Error. I cannot see the camera.")
         return
-        
+
+    # Capture -> latest-frame slot -> recognition worker; the display loop
+    # below shows the newest frame with the latest result drawn on it
+    announcer = Announcer(speak, repeat_seconds=ANNOUNCE_REPEAT_SECONDS)
+    announcer.start()
+    slot = FrameSlot()
+    capture = CaptureThread(cap, slot)
+    capture.start()
+    last_attendance = {} # name: time
+    # Reads id_to_name when called, so it sees the map rebuilt after a registration
+    worker = RecognitionWorker(slot, lambda image: recognize_faces(image, id_to_name, last_attendance, announcer.say))
+
     # ASK USER ON STARTUP
     root = tk.Tk()
     root.withdraw()
     root.attributes('-topmost', True)
     if messagebox.askyesno("Attendance System", "Do you want to add a new user now?"):
-        name_to_id = register_new_user(cap, name_to_id)
+        name_to_id = register_new_user(slot, name_to_id, announcer.say)
         id_to_name = {v: k for k, v in name_to_id.items()}
     root.destroy()
-    
-    last_attendance = {} # name: time
+    worker.start()
 
     print("System Ready.")
     if not id_to_name:
-        speak("No users registered. Press 'a' to add a user.")
+        announcer.say("No users registered. Press 'a' to add a user.")
 
+    display_meter = RateMeter()
+    latency_ms = 0.0
+    seq = 0
     while True:
-        ret, frame = cap.read()
-        if not ret: break
-        
-        # Optimization: Resize for detection
-        small_frame = cv2.resize(frame, (0, 0), fx=0.5, fy=0.5)
-        small_gray = cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY)
-        small_gray = clahe.apply(small_gray)
-
-        faces_small = face_cascade.detectMultiScale(small_gray, 1.2, 5)
-        
-        faces = []
-        for (x, y, w, h) in faces_small:
-            faces.append((x*2, y*2, w*2, h*2))
-
-        for (x, y, w, h) in faces:
-            # Recognize
-            if id_to_name: # Only if we have a model
-                try:
-                    # Use full res gray with CLAHE
-                    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                    gray = clahe.apply(gray)
-                    id_, confidence = recognizer.predict(gray[y:y+h, x:x+w])
-                    
-                    # Check confidence
-                    # Confidence is distance: 0 is match, 100+ is mismatch
-                    if confidence < 75: 
-                        name = id_to_name.get(id_, "Unknown")
-                        conf_text = f" {round(100 - confidence)}%"
-                        
-                        # Attendance
-                        now = datetime.datetime.now()
-                        if name in last_attendance:
-                             delta = (now - last_attendance[name]).total_seconds()
-                        else:
-                             delta = 999
-                             
-                        if delta > COOLDOWN_SECONDS:
-                            mark_attendance(name)
-                            last_attendance[name] = now
-                            speak(f"Thank you {name}")
-                            
-                        color = (0, 255, 0)
-                    else:
-                        name = "Unknown"
-                        conf_text = f" {round(100 - confidence)}%"
-                        color = (0, 0, 255)
-                except Exception as e:
-                    name = "Unknown"
-                    color = (0, 0, 255)
-            else:
-                 name = "Unknown"
-                 color = (0, 0, 255)
-
-            cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
-            cv2.putText(frame, str(name), (x+5, y-5), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-        
-        cv2.putText(frame, "'a': Add User | 'q': Quit", (10, 450), cv2.FONT_HERSHEY_PLAIN, 1.5, (255, 255, 0), 2)
-        cv2.imshow('Attendance System', frame)
+        frame = slot.get(after=seq, timeout=0.03)
+        if frame is not None:
+            seq = frame.seq
+            image = frame.image.copy()  # the worker may still be reading the original
+            result = worker.latest
+            for (x, y, w, h), name, color in (result.faces if result else []):
+                cv2.rectangle(image, (x, y), (x+w, y+h), color, 2)
+                cv2.putText(image, str(name), (x+5, y-5), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+            
+            draw_status(image, display_meter, latency_ms, worker)
+            cv2.putText(image, "'a': Add User | 'q': Quit", (10, 450), cv2.FONT_HERSHEY_PLAIN, 1.5, (255, 255, 0), 2)
+            cv2.imshow('Attendance System', image)
+            # Smoothed; shown on the next frame
+            latency_ms = 0.9 * latency_ms + 0.1 * (time.perf_counter() - frame.captured_at) * 1000
+            display_meter.tick()
+        elif slot.closed:
+            print("Camera stopped delivering frames.")
+            break
 
         k = cv2.waitKey(1) & 0xFF
         if k == ord('q'):
             break
         elif k == ord('a'):
-            name_to_id = register_new_user(cap, name_to_id)
+            worker.pause()  # the recognizer is retrained below
+            name_to_id = register_new_user(slot, name_to_id, announcer.say)
             # Rebuild reverse map
             id_to_name = {v: k for k, v in name_to_id.items()}
+            worker.resume()
 
+    worker.stop()
+    capture.stop()
+    capture.join(2.0)
+    worker.join(2.0)
+    announcer.close()
     cap.release()
     cv2.destroyAllWindows()
 
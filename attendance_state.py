@@ -0,0 +1,146 @@
+"""
+In-memory attendance state shared by request threads.
+
+CooldownIndex replaces the scan over today_log (which re-parsed every
+entry's timestamp for each recognized face): the last time each employee
+was logged is kept in a dict keyed by emp_id, as time.monotonic() seconds
+so wall-clock jumps can't extend or cut a cooldown. Entries are kept in
+the order they were marked, so expired ones are dropped from the front
+and the index only ever holds people seen within the last cooldown.
+
+DailyLog is the list behind /get_attendance: today's entries only
+(cleared when the date changes) and at most `max_entries` of them, the
+oldest dropped first. Every entry gets a sequence number that keeps
+increasing across days, so a reader can ask for what is new since the
+last one it saw, along with per-employee first-in/last-seen summaries
+that are updated as entries arrive rather than recomputed per request.
+"""
+import datetime
+import threading
+import time
+from collections import OrderedDict, deque
+
+class CooldownIndex:
+    def __init__(self, seconds, clock=time.monotonic):
+        self.seconds = seconds
+        self.clock = clock
+        self._last = OrderedDict()  # key -> monotonic time, oldest first
+        self._lock = threading.Lock()
+
+    def hit(self, key):
+        """Marks `key` and returns True unless it was marked within the
+        cooldown, in which case nothing changes and False is returned."""
+        now = self.clock()
+        with self._lock:
+            self._expire(now)
+            if key in self._last:
+                return False
+            self._last[key] = now
+            return True
+
+    def remaining(self, key):
+        """Seconds left on `key`'s cooldown (0 if none)."""
+        now = self.clock()
+        with self._lock:
+            last = self._last.get(key)
+        return max(0.0, self.seconds - (now - last)) if last is not None else 0.0
+
+    def forget(self, key):
+        with self._lock:
+            self._last.pop(key, None)
+
+    def _expire(self, now):
+        while self._last:
+            key, last = next(iter(self._last.items()))
+            if now - last < self.seconds:
+                break
+            del self._last[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._last)
+
+class DailyLog:
+    def __init__(self, max_entries=5000, now=datetime.datetime.now):
+        self.max_entries = max_entries
+        self.now = now
+        self.day = now().date()
+        self._entries = deque(maxlen=max_entries)  # (seq, entry)
+        self._summary = OrderedDict()  # emp_id -> aggregate, least recently updated first
+        self._seq = 0
+        self.dropped = 0  # entries pushed out today by the size bound
+        self._lock = threading.Lock()
+
+    def append(self, entry, when=None):
+        """Adds one {"name", "id", "time"} entry timestamped `when` (default
+        now) and folds it into that employee's summary; returns its seq."""
+        day = (when or self.now()).date()
+        with self._lock:
+            self._rotate(day)
+            if len(self._entries) == self.max_entries:
+                self.dropped += 1
+            self._seq += 1
+            self._entries.append((self._seq, entry))
+            summary = self._summary.pop(entry['id'], None)
+            if summary is None:
+                summary = {"id": entry['id'], "first_in": entry['time'], "count": 0}
+            summary.update(name=entry['name'], last_seen=entry['time'], seq=self._seq)
+            summary["count"] += 1
+            self._summary[entry['id']] = summary
+            return self._seq
+
+    def entries(self):
+        """Today's entries, oldest first."""
+        return [entry for _, entry in self.since(0)[0]]
+
+    def since(self, seq):
+        """(seq, entry) pairs newer than `seq`, and the latest seq."""
+        day = self.now().date()
+        with self._lock:
+            self._rotate(day)
+            return self._newer(self._entries, seq, lambda item: item[0]), self._seq
+
+    def version(self):
+        """(day, latest seq): changes whenever the feed would."""
+        day = self.now().date()
+        with self._lock:
+            self._rotate(day)
+            return self.day.isoformat(), self._seq
+
+    def feed(self, seq):
+        """Everything a client holding cursor `seq` is missing: new entries
+        and the summaries they changed. A client whose `day` differs from
+        the returned one starts over (the cursor still works: seqs never
+        repeat across days)."""
+        day = self.now().date()
+        with self._lock:
+            self._rotate(day)
+            entries = self._newer(self._entries, seq, lambda item: item[0])
+            summary = self._newer(self._summary.values(), seq, lambda s: s["seq"])
+            return {"day": self.day.isoformat(), "seq": self._seq,
+                    "entries": [dict(entry, seq=n) for n, entry in entries],
+                    "summary": [dict(s) for s in summary],
+                    # Entries after the cursor that the size bound already dropped
+                    "truncated": bool(self._entries) and self._entries[0][0] > seq + 1 and self.dropped > 0}
+
+    @staticmethod
+    def _newer(items, seq, key):
+        # Walk back from the newest: costs the number of new items
+        new = []
+        for item in reversed(items):
+            if key(item) <= seq:
+                break
+            new.append(item)
+        new.reverse()
+        return new
+
+    def _rotate(self, day):
+        if day != self.day:
+            self.day = day
+            self._entries.clear()
+            self._summary.clear()
+            self.dropped = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
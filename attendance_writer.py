@@ -0,0 +1,279 @@
+"""
+Background batched writer for attendance rows.
+
+log_attendance_db used to INSERT and commit inside the request, putting
+a database round trip in every kiosk frame that recognized someone.
+Now the request only enqueues the row. One writer thread drains the
+queue with executemany, one transaction per batch, flushing when
+`batch_size` rows are waiting or `flush_interval` seconds after the
+first row of a batch arrived.
+
+If the database is down, a failed batch is appended to a JSON-lines
+spill file and the writer backs off for `retry_interval` seconds. Spilled
+rows are replayed (oldest first) once writes succeed again, including
+spill files left by earlier processes. A replaying process claims a file
+by renaming it to `.replay-<pid>`; claims left by a process that died
+mid-replay are picked up again (rows of batches it had already written
+are then written twice). Unreadable lines, such as one torn by a crash
+mid-append, are moved to `<spill>.bad` instead of stopping the replay,
+and the writer thread logs any error and carries on. Appends and replays take an flock on the file,
+so a row is never appended to a file another worker is reading. When the
+queue is full, new rows go straight to the spill file, so request
+threads never block on the database. close() (registered with atexit by app.py) drains everything
+that is still queued.
+
+submit_many() queues the rows of one frame as a single entry, so they
+are always written in the same transaction.
+"""
+import datetime
+import glob
+import json
+import os
+import queue
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows dev server: single process, nothing to share
+    fcntl = None
+
+INSERT_SQL = "INSERT INTO attendance (user_id, name, emp_id, timestamp) VALUES (%s, %s, %s, %s)"
+
+class AttendanceWriter:
+    def __init__(self, connect, batch_size=100, flush_interval=0.5, maxsize=10000,
+                 spill_dir="attendance_spill", retry_interval=5.0, sql=INSERT_SQL):
+        """`connect()` is a context manager yielding a DB connection (or None)."""
+        self.connect = connect
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.sql = sql
+        self.queue = queue.Queue(maxsize)
+        self.spill_dir = spill_dir
+        self.spill_path = os.path.join(spill_dir, f"spill-{os.getpid()}.jsonl")
+        self.stats = {"enqueued": 0, "written": 0, "batches": 0, "spilled": 0, "overflow": 0,
+                      "replayed": 0, "discarded": 0, "failures": 0, "last_batch_rows": 0, "last_batch_ms": 0.0}
+        self._stats_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._flush_now = threading.Event()
+        self._stopping = False
+        self._retry_at = 0.0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="attendance-writer", daemon=True)
+                self._thread.start()
+        return self
+
+    def submit(self, row):
+        """Queues (user_id, name, emp_id, datetime); never blocks."""
+        self.submit_many([row])
+
+    def submit_many(self, rows):
+        """Queues several rows as one entry (one queue operation); never blocks."""
+        rows = list(rows)
+        if not rows:
+            return
+        self.start()
+        self._count(enqueued=len(rows))
+        try:
+            self.queue.put_nowait(rows)
+        except queue.Full:
+            # Backpressure: keep the rows durable without stalling the caller
+            self._count(overflow=len(rows))
+            self._spill(rows)
+
+    def flush(self, timeout=10.0):
+        """Writes everything queued so far; True if the queue drained in time."""
+        self._flush_now.set()
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not self.queue.unfinished_tasks
+
+    def close(self, timeout=10.0):
+        """Drains the queue and stops the writer (spilling if the DB is down)."""
+        self._stopping = True
+        self._flush_now.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def metrics(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["queue_depth"] = self.queue.qsize()
+        stats["spill_files"] = len(self._spill_files())
+        return stats
+
+    def _count(self, **deltas):
+        # Request threads and the writer thread both update the counters
+        with self._stats_lock:
+            for key, delta in deltas.items():
+                self.stats[key] += delta
+
+    # --- Writer thread ---
+
+    def _run(self):
+        while True:
+            try:
+                if not self._step():
+                    return
+            except Exception as e:
+                # A full disk or an unreadable spill file must not stop the thread
+                self._retry_at = time.monotonic() + self.retry_interval
+                print(f"Attendance writer error (retrying in {self.retry_interval:g}s): {e}")
+
+    def _step(self):
+        """One batch plus a replay attempt; False once stopped and drained."""
+        batch, entries = self._collect()
+        if batch:
+            try:
+                if time.monotonic() < self._retry_at and not self._stopping:
+                    self._spill(batch)  # DB known down: don't wait on it per batch
+                elif not self._write(batch):
+                    self._spill(batch)
+            finally:
+                for _ in range(entries):
+                    self.queue.task_done()
+        elif self._stopping:
+            return False
+        if time.monotonic() >= self._retry_at and not self._stopping:
+            self._replay_spills()
+        return True
+
+    def _collect(self):
+        """Blocks for the first entry, then gathers until the size or time
+        trigger. Returns (rows, entries taken off the queue); an entry's rows
+        are never split across batches."""
+        try:
+            batch = list(self.queue.get(timeout=self.flush_interval))
+        except queue.Empty:
+            return [], 0
+        entries = 1
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if self._stopping or self._flush_now.is_set():
+                remaining = 0
+            try:
+                batch.extend(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+            entries += 1
+        if self.queue.empty():
+            self._flush_now.clear()
+        return batch, entries
+
+    def _write(self, rows):
+        start = time.monotonic()
+        try:
+            with self.connect() as conn:
+                if conn is None:
+                    raise ConnectionError("database unavailable")
+                cursor = conn.cursor()
+                cursor.executemany(self.sql, rows)
+                conn.commit()
+        except Exception as e:
+            self._count(failures=1)
+            self._retry_at = time.monotonic() + self.retry_interval
+            print(f"Attendance write failed ({len(rows)} rows spilled): {e}")
+            return False
+        self._count(written=len(rows), batches=1)
+        with self._stats_lock:
+            self.stats["last_batch_rows"] = len(rows)
+            self.stats["last_batch_ms"] = (time.monotonic() - start) * 1000
+        return True
+
+    # --- Spill files ---
+
+    def _spill(self, rows):
+        with self._spill_lock:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            while True:
+                with open(self.spill_path, 'a', encoding='utf-8') as f:
+                    if fcntl: fcntl.flock(f, fcntl.LOCK_EX)
+                    if not self._renamed(f):
+                        for user_id, name, emp_id, ts in rows:
+                            f.write(json.dumps([user_id, name, emp_id, ts.isoformat()]) + "\n")
+                        f.flush()
+                        os.fsync(f.fileno())
+                        break
+                # Another process claimed the file while we waited; the
+                # next open creates a fresh one
+        self._count(spilled=len(rows))
+
+    def _renamed(self, f):
+        """True if the open spill file is no longer at self.spill_path."""
+        try:
+            return os.stat(self.spill_path).st_ino != os.fstat(f.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _spill_files(self):
+        return sorted(glob.glob(os.path.join(self.spill_dir, "spill-*.jsonl")), key=os.path.getmtime)
+
+    def _stale_claims(self):
+        """Claimed files whose replaying process is gone (this process only
+        replays inside _replay_spills, so its own leftovers are stale too)."""
+        stale = []
+        for path in glob.glob(os.path.join(self.spill_dir, "spill-*.jsonl.replay-*")):
+            suffix = path.rsplit("-", 1)[1]
+            pid = int(suffix) if suffix.isdigit() else 0
+            if pid and pid != os.getpid():
+                try:
+                    os.kill(pid, 0)
+                    continue  # still replaying it
+                except PermissionError:
+                    continue  # alive, owned by another user
+                except OSError:
+                    pass
+            stale.append(path)
+        return sorted(stale, key=os.path.getmtime)
+
+    def _replay_spills(self):
+        for path in self._stale_claims() + self._spill_files():
+            # Claim the file so another worker process doesn't replay it too
+            claimed = f"{path.split('.replay-')[0]}.replay-{os.getpid()}"
+            try:
+                with self._spill_lock:
+                    if path != claimed:
+                        os.rename(path, claimed)
+            except OSError:
+                continue
+            rows = self._read_spill(claimed)
+            for start in range(0, len(rows), self.batch_size):
+                if not self._write(rows[start:start + self.batch_size]):
+                    # Still down: put the unwritten remainder back
+                    self._spill(rows[start:])
+                    self._count(spilled=-len(rows[start:]))
+                    os.remove(claimed)
+                    return
+                self._count(replayed=len(rows[start:start + self.batch_size]))
+            os.remove(claimed)
+            if rows:
+                print(f"Replayed {len(rows)} spilled attendance rows.")
+
+    def _read_spill(self, claimed):
+        """The rows of a claimed spill file. Lines that don't parse (e.g. torn
+        by a crash mid-append) are moved to `<spill>.bad` and skipped."""
+        rows, bad = [], []
+        with open(claimed, encoding='utf-8') as f:
+            # Wait out an append that opened the file before the rename
+            if fcntl: fcntl.flock(f, fcntl.LOCK_SH)
+            for line in f:
+                if not line.strip(): continue
+                try:
+                    u, n, e, t = json.loads(line)
+                    rows.append((u, n, e, datetime.datetime.fromisoformat(t)))
+                except (ValueError, TypeError) as err:
+                    bad.append(line if line.endswith("\n") else line + "\n")
+                    print(f"Skipping unreadable spill line in {claimed}: {err}")
+        if bad:
+            with open(claimed.split('.replay-')[0] + ".bad", 'a', encoding='utf-8') as f:
+                f.writelines(bad)
+            self._count(discarded=len(bad))
+        return rows
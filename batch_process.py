@@ -0,0 +1,279 @@
+"""
+Reconstructs attendance from recorded footage.
+
+    python batch_process.py lobby-0800.mp4 lobby-1200.mp4 --csv attendance_footage.csv
+    python batch_process.py snapshots/ --db --every 5
+    python batch_process.py lobby.mp4 --csv out.csv --resume        # after an interruption
+
+Inputs are video files or directories of images (sorted by name, one
+frame each). They are cut into segments of consecutive frames, and a
+process pool decodes, preprocesses and detects faces in the segments on
+every core, with the same detection settings and face normalization as
+app.analyze_frame. The main process then scores each segment's faces in
+one batch against app.py's model and enrolled users.
+
+Attendance follows the live rules, timed by the footage rather than the
+wall clock. A face counts when its distance is under
+app.CONFIDENCE_THRESHOLD. A person is logged again only COOLDOWN_SECONDS
+after their last logged event. Events are written in bulk to a CSV file
+and/or the attendance table. Video timestamps count from --start, or
+from the file's modification time taken as the end of the recording;
+images use their own modification times.
+
+After every segment, the events are written first and then a checkpoint
+file records the progress and the cooldown state. --resume continues
+from it. A crash between those two steps can repeat at most one
+segment's events.
+"""
+import argparse
+import csv
+import datetime
+import json
+import multiprocessing
+import os
+import time
+
+import cv2
+import numpy as np
+
+from preprocess import DETECT_SCALE, FACE_SIZE, FramePreprocessor
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+SEGMENT_FRAMES = 240  # frames per task handed to the pool
+
+# --- Inputs ---
+
+def list_images(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.lower().endswith(IMAGE_EXTENSIONS))
+
+def plan_segments(paths, every, sample_fps, start):
+    """[(input, kind, path_or_files, first_frame, stop_frame, step, t0, fps)]
+    covering every input in order; t0 is the datetime of frame 0."""
+    segments = []
+    for i, path in enumerate(paths):
+        if os.path.isdir(path):
+            files = list_images(path)
+            step = max(1, every)
+            size = max(step, SEGMENT_FRAMES // step * step)  # aligned like videos below
+            for first in range(0, len(files), size):
+                segments.append((i, 'images', files[first:first + size], first,
+                                 min(len(files), first + size), step, None, None))
+            continue
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            raise SystemExit(f"ERROR: Could not open video {path}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        step = max(1, round(fps / sample_fps)) if sample_fps else max(1, every)
+        t0 = start or datetime.datetime.fromtimestamp(os.path.getmtime(path)) - datetime.timedelta(seconds=total / fps)
+        # Segment borders on multiples of `step`, so sampling is the same as one pass
+        size = max(step, SEGMENT_FRAMES // step * step)
+        for first in range(0, total, size):
+            segments.append((i, 'video', path, first, min(total, first + size), step, t0, fps))
+    return segments
+
+# --- Pool workers: decode, preprocess, detect ---
+
+_worker = {}
+
+def init_worker():
+    cv2.setNumThreads(1)  # the pool provides the parallelism
+    _worker['pre'] = FramePreprocessor(scale=DETECT_SCALE, face_size=FACE_SIZE)
+    _worker['cascade'] = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades,
+                                                            'haarcascade_frontalface_default.xml'))
+
+def detect(frame):
+    """(boxes, faces) like app.analyze_frame: detection on the downscaled
+    gray frame, boxes mapped back to full size, faces stacked at FACE_SIZE."""
+    pre, cascade = _worker['pre'], _worker['cascade']
+    _, small_gray = pre.prepare(frame)
+    boxes = [pre.to_full(box) for box in cascade.detectMultiScale(small_gray, 1.1, 5, minSize=(30, 30))]
+    return boxes, pre.faces(boxes)
+
+def scan_segment(segment):
+    """Returns (segment, decoded, [(frame_no, datetime, boxes, faces)])."""
+    _, kind, source, first, stop, step, t0, fps = segment
+    hits, decoded = [], 0
+    if kind == 'images':
+        for offset in range(0, stop - first, step):
+            path = source[offset]
+            frame = cv2.imread(path)
+            decoded += 1
+            if frame is None:
+                continue
+            boxes, faces = detect(frame)
+            if boxes:
+                hits.append((first + offset, datetime.datetime.fromtimestamp(os.path.getmtime(path)), boxes, faces))
+        return segment, decoded, hits
+
+    cap = cv2.VideoCapture(source)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+    for frame_no in range(first, stop):
+        if (frame_no % step) != 0:
+            if not cap.grab():  # skipped frames are never converted
+                break
+            continue
+        ok, frame = cap.read()
+        decoded += 1
+        if not ok:
+            break
+        boxes, faces = detect(frame)
+        if boxes:
+            hits.append((frame_no, t0 + datetime.timedelta(seconds=frame_no / fps), boxes, faces))
+    cap.release()
+    return segment, decoded, hits
+
+# --- Attendance ---
+
+class FootageAttendance:
+    """The live cooldown (COOLDOWN_SECONDS per emp_id) on footage time."""
+
+    def __init__(self, cooldown, last_logged=None):
+        self.cooldown = datetime.timedelta(seconds=cooldown)
+        self.last_logged = last_logged or {}  # emp_id -> datetime
+
+    def seen(self, emp_id, when):
+        last = self.last_logged.get(emp_id)
+        if last is not None and abs(when - last) < self.cooldown:
+            return False
+        self.last_logged[emp_id] = when
+        return True
+
+class CsvSink:
+    FIELDS = ["name", "emp_id", "timestamp", "source", "frame", "distance"]
+
+    def __init__(self, path):
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'a', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        if new:
+            self.writer.writerow(self.FIELDS)
+
+    def write(self, events):
+        for e in events:
+            self.writer.writerow([e["name"], e["emp_id"], e["time"].strftime("%Y-%m-%d %H:%M:%S"),
+                                  e["source"], e["frame"], f"{e['distance']:.1f}"])
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+class DbSink:
+    """executemany into the attendance table, one transaction per segment."""
+
+    def __init__(self, app):
+        from attendance_writer import INSERT_SQL
+        self.app = app
+        self.sql = INSERT_SQL
+
+    def write(self, events):
+        if not events:
+            return
+        with self.app.db_connection() as conn:
+            if conn is None:
+                raise SystemExit("ERROR: database unavailable; rerun with --resume once it is back")
+            cursor = conn.cursor()
+            cursor.executemany(self.sql, [(e["user_id"], e["name"], e["emp_id"], e["time"]) for e in events])
+            conn.commit()
+
+    def close(self):
+        pass
+
+# --- Checkpoint ---
+
+def load_checkpoint(path, paths):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        state = json.load(f)
+    if state["inputs"] != [os.path.abspath(p) for p in paths]:
+        raise SystemExit(f"ERROR: {path} was written for different inputs: {state['inputs']}")
+    state["last_logged"] = {k: datetime.datetime.fromisoformat(v) for k, v in state["last_logged"].items()}
+    return state
+
+def save_checkpoint(path, paths, done, attendance, totals):
+    state = {"inputs": [os.path.abspath(p) for p in paths], "segments_done": done,
+             "last_logged": {k: v.isoformat() for k, v in attendance.last_logged.items()}, "totals": totals}
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+# --- Main ---
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('inputs', nargs='+', help="video files or image directories, in time order")
+    parser.add_argument('--csv', help="append attendance events to this CSV file")
+    parser.add_argument('--db', action='store_true', help="insert attendance events into the database")
+    parser.add_argument('--every', type=int, default=1, help="process every Nth frame")
+    parser.add_argument('--sample-fps', type=float, help="process about this many frames per second of video")
+    parser.add_argument('--start', type=datetime.datetime.fromisoformat,
+                        help="time of the first frame of each video (default: from the file time)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="decode/detect processes")
+    parser.add_argument('--checkpoint', help="progress file (default: <csv>.checkpoint.json or batch.checkpoint.json)")
+    parser.add_argument('--resume', action='store_true', help="continue from the checkpoint")
+    args = parser.parse_args()
+    if not args.csv and not args.db:
+        parser.error("give --csv and/or --db")
+
+    checkpoint = args.checkpoint or (f"{args.csv}.checkpoint.json" if args.csv else "batch.checkpoint.json")
+    state = load_checkpoint(checkpoint, args.inputs) if args.resume else None
+    if state is None and os.path.exists(checkpoint) and not args.resume:
+        print(f"Starting over; {checkpoint} will be replaced (use --resume to continue it).")
+    segments = plan_segments(args.inputs, args.every, args.sample_fps, args.start)
+    done = state["segments_done"] if state else 0
+    totals = state["totals"] if state else {"decoded": 0, "faces": 0, "recognized": 0, "logged": 0, "seconds": 0.0}
+
+    # Workers are forked before app starts any threads or connections
+    pool = multiprocessing.Pool(args.workers, initializer=init_worker)
+    import app  # model, enrolled users and database; only the main process needs them
+    app.startup.wait()
+    attendance = FootageAttendance(app.COOLDOWN_SECONDS, state["last_logged"] if state else None)
+    sinks = ([CsvSink(args.csv)] if args.csv else []) + ([DbSink(app)] if args.db else [])
+    print(f"{len(segments)} segments from {len(args.inputs)} inputs, {done} already done; "
+          f"{args.workers} workers; {len(app.matcher)} gallery samples, {len(app.user_db)} users")
+
+    started, last_report, decoded_before = time.perf_counter(), 0.0, totals["decoded"]
+    with pool:
+        for segment, decoded, hits in pool.imap(scan_segment, segments[done:]):
+            faces = [f for _, _, _, stack in hits for f in stack]
+            predictions = iter(app.predict_faces(np.asarray(faces)) if faces and len(app.matcher) else
+                               [(-1, float('inf'))] * len(faces))
+            events = []
+            for frame_no, when, boxes, _ in hits:
+                for _ in boxes:
+                    label, distance = next(predictions)
+                    user = app.user_db.get(label) if distance < app.CONFIDENCE_THRESHOLD else None
+                    if user is None:
+                        continue
+                    totals["recognized"] += 1
+                    if attendance.seen(user['emp_id'], when):
+                        events.append({"user_id": label, "name": user['name'], "emp_id": user['emp_id'],
+                                       "time": when, "source": os.path.basename(args.inputs[segment[0]]),
+                                       "frame": frame_no, "distance": distance})
+            for sink in sinks:
+                sink.write(events)
+            done += 1
+            totals["decoded"] += decoded
+            totals["faces"] += len(faces)
+            totals["logged"] += len(events)
+            elapsed = time.perf_counter() - started
+            totals["seconds"] = (state["totals"]["seconds"] if state else 0.0) + elapsed
+            save_checkpoint(checkpoint, args.inputs, done, attendance, totals)
+            if elapsed - last_report >= 5 or done == len(segments):
+                last_report = elapsed
+                print(f"  {done}/{len(segments)} segments  {(totals['decoded'] - decoded_before) / elapsed:7.1f} fps  "
+                      f"faces {totals['faces']}  recognized {totals['recognized']}  logged {totals['logged']}")
+    for sink in sinks:
+        sink.close()
+    elapsed = time.perf_counter() - started
+    print(f"Done: {totals['decoded']} frames processed in {totals['seconds']:.1f}s "
+          f"({(totals['decoded'] - decoded_before) / elapsed if elapsed else 0:.1f} fps this run), "
+          f"{totals['logged']} attendance events.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+"""Offline benchmarks for the recognition pipeline (run with python -m benchmarks.<name>)."""
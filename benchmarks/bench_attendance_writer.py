@@ -0,0 +1,113 @@
+"""
+Attendance write throughput: per-event INSERT + commit vs the batched
+background writer, against a local SQLite database.
+
+"connect+commit" is the old log_attendance_db (new connection, one row,
+commit, close); "pooled commit" reuses one connection but still commits
+every row; "batched writer" is attendance_writer.AttendanceWriter. For
+the writer, "submit us" is what the request thread pays per event.
+Finally the database is made unavailable for a while to show rows
+spilling to disk and being replayed once it is back.
+
+    python -m benchmarks.bench_attendance_writer --events 5000
+"""
+import argparse
+import contextlib
+import datetime
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from attendance_writer import AttendanceWriter, INSERT_SQL
+from db_pool import DBConfig, ConnectionPool
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS attendance (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INT, name VARCHAR(100),
+    emp_id VARCHAR(50), timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"""
+
+def rows(n):
+    now = datetime.datetime.now()
+    return [(i % 500 + 1, f"Person {i % 500}", f"E{i % 500:04d}", now) for i in range(n)]
+
+def count(pool):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM attendance")
+        return cursor.fetchone()[0]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--batch', type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = DBConfig(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        pool = ConnectionPool(config, size=2)
+        with pool.connection() as conn:
+            conn.cursor().execute(SCHEMA)
+            conn.commit()
+        events = rows(args.events)
+        print(f"{'mode':>16} {'events/s':>10} {'submit us p50':>14} {'submit us p99':>14}")
+
+        n_sync = min(args.events, 1000)
+        t0 = time.perf_counter()
+        for row in events[:n_sync]:
+            raw = config.connect()
+            raw.execute(INSERT_SQL.replace("%s", "?"), row)
+            raw.commit()
+            raw.close()
+        per_s = n_sync / (time.perf_counter() - t0)
+        print(f"{'connect+commit':>16} {per_s:>10.0f} {1e6 / per_s:>14.0f} {1e6 / per_s:>14.0f}")
+
+        t0 = time.perf_counter()
+        for row in events[:n_sync]:
+            with pool.connection() as conn:
+                conn.cursor().execute(INSERT_SQL, row)
+                conn.commit()
+        per_s = n_sync / (time.perf_counter() - t0)
+        print(f"{'pooled commit':>16} {per_s:>10.0f} {1e6 / per_s:>14.0f} {1e6 / per_s:>14.0f}")
+
+        writer = AttendanceWriter(pool.connection, batch_size=args.batch, flush_interval=0.05,
+                                  spill_dir=os.path.join(tmp, 'spill')).start()
+        before = count(pool)
+        submit = []
+        t0 = time.perf_counter()
+        for row in events:
+            s = time.perf_counter()
+            writer.submit(row)
+            submit.append(time.perf_counter() - s)
+        writer.flush(60)
+        per_s = args.events / (time.perf_counter() - t0)
+        us = np.array(submit) * 1e6
+        print(f"{'batched writer':>16} {per_s:>10.0f} {np.percentile(us, 50):>14.1f} {np.percentile(us, 99):>14.1f}")
+        print(f"rows written {count(pool) - before}/{args.events} in {writer.stats['batches']} batches")
+
+        # Outage: connect() fails for a while, rows spill, then replay
+        down = {"until": time.monotonic() + 1.0}
+
+        @contextlib.contextmanager
+        def flaky():
+            if time.monotonic() < down["until"]:
+                yield None
+            else:
+                with pool.connection() as conn:
+                    yield conn
+
+        writer.close()
+        writer = AttendanceWriter(flaky, batch_size=args.batch, flush_interval=0.05, retry_interval=0.5,
+                                  spill_dir=os.path.join(tmp, 'spill')).start()
+        before = count(pool)
+        for row in events[:1000]:
+            writer.submit(row)
+        writer.flush(5)
+        spilled = writer.stats["spilled"]
+        time.sleep(2.0)
+        writer.close()
+        print(f"outage: {spilled} rows spilled while down, {writer.stats['replayed']} replayed, "
+              f"{count(pool) - before}/1000 in the table")
+
+if __name__ == '__main__':
+    main()
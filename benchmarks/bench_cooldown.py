@@ -0,0 +1,59 @@
+"""
+Cost of the attendance cooldown check as the day's log grows.
+
+"scan" is the old check: walk today_log and strptime every entry with
+the same emp_id. "index" is attendance_state.CooldownIndex. Each check is
+for an employee already in the log (the common case: the same person in
+front of the camera for several frames).
+
+    python -m benchmarks.bench_cooldown --entries 100 1000 10000
+"""
+import argparse
+import datetime
+import time
+
+from attendance_state import CooldownIndex, DailyLog
+
+def scan_check(log, emp_id, now, cooldown=30):
+    for entry in log:
+        if entry['id'] == emp_id:
+            try:
+                last_time = datetime.datetime.strptime(entry['time'], "%Y-%m-%d %H:%M:%S")
+                if (now - last_time).total_seconds() < cooldown:
+                    return False
+            except ValueError:
+                pass
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--employees', type=int, default=500)
+    parser.add_argument('--checks', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'entries':>8} {'scan us':>10} {'index us':>10}")
+    for n in args.entries:
+        now = datetime.datetime.now()
+        log, daily, index = [], DailyLog(max_entries=n), CooldownIndex(30)
+        for i in range(n):
+            entry = {"name": f"Person {i}", "id": f"E{i % args.employees:04d}",
+                     "time": (now - datetime.timedelta(seconds=n - i)).strftime("%Y-%m-%d %H:%M:%S")}
+            log.append(entry)
+            daily.append(entry, now)
+            index.hit(entry['id'])
+
+        checks = max(1, min(args.checks, 200000 // max(n, 1)))
+        t0 = time.perf_counter()
+        for i in range(checks):
+            scan_check(log, f"E{i % args.employees:04d}", now)
+        scan_us = (time.perf_counter() - t0) / checks * 1e6
+
+        t0 = time.perf_counter()
+        for i in range(args.checks):
+            index.hit(f"E{i % args.employees:04d}")
+        index_us = (time.perf_counter() - t0) / args.checks * 1e6
+        print(f"{n:>8} {scan_us:>10.1f} {index_us:>10.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Recall-vs-latency curve for the IVF face index against the exact matcher.
+
+For each gallery size, the same LBPHMatcher gallery is searched with a
+full scan and with face_index.IVFIndex at several `nprobe` and `rerank`
+values (rerank 0 scores every candidate exactly). "recall@1" is the
+fraction of queries where the index returns the same label as the exact
+scan. "scanned" is the average share of gallery columns probed per query.
+Also reports index build time, the cost of one incremental enrollment,
+and save/load time for the persisted index.
+
+The defaults (nprobe 128, rerank 32, index from 2000 columns) come from
+this benchmark on the procedural textures, one sample per identity:
+
+    identities  exact     nprobe 8, no rerank   nprobe 128, rerank 32
+    3,000       40 ms     1.0x, 74% recall      3.7x, 100% recall
+    10,000      136 ms    -                     5.2x, 100% recall
+    20,000      280 ms    4.5x, 59% recall      6.0x, 96% recall
+
+The probe and the shortlist both go through the query's heaviest bins, so
+recall is set by nprobe alone; rerank 32 lost no matches at any size.
+
+Real faces cluster differently; re-run this on a copy of the production
+gallery before changing INDEX_NPROBE or INDEX_RERANK.
+
+    python -m benchmarks.bench_index --sizes 5000 20000 --nprobe 32 64 128 256 --rerank 0 32
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_matcher import build, texture_faces
+from face_index import NPROBE, RERANK, IVFIndex
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5000, 20000])
+    parser.add_argument('--samples', type=int, default=1, help="samples per identity")
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[32, 64, 128, 256])
+    parser.add_argument('--rerank', type=int, nargs='+', default=[0, 32], help="0 = score all candidates exactly")
+    parser.add_argument('--proj-dim', type=int, default=64)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        matcher, _ = build(size, args.samples, {}, with_opencv=False)
+        queries = texture_faces(np.linspace(1, size, args.queries).astype(int), sample=10_000)
+        hists = matcher.histograms(queries)
+
+        t0 = time.perf_counter()
+        exact = matcher.predict_histograms(hists)
+        exact_ms = (time.perf_counter() - t0) * 1000 / len(hists)
+
+        index = IVFIndex(matcher.dim, proj_dim=args.proj_dim)
+        t0 = time.perf_counter()
+        matcher.attach_index(index)
+        build_s = time.perf_counter() - t0
+
+        print(f"\n{size} identities, {len(matcher)} rows, {len(index.centroids)} cells, "
+              f"built in {build_s:.1f}s; exact scan {exact_ms:.2f} ms/face")
+        print(f"{'nprobe':>6} {'rerank':>6} {'ms/face':>8} {'speedup':>8} {'recall@1':>9} {'scanned':>8}")
+        for nprobe in args.nprobe:
+            index.nprobe = nprobe
+            scanned = np.mean([len(index.candidates(h)) for h in hists]) / len(matcher)
+            for rerank in args.rerank:
+                index.rerank = rerank
+                t0 = time.perf_counter()
+                approx = matcher.predict_histograms(hists)
+                ms = (time.perf_counter() - t0) * 1000 / len(hists)
+                recall = np.mean([a[0] == e[0] for a, e in zip(approx, exact)])
+                print(f"{nprobe:>6} {rerank:>6} {ms:>8.2f} {exact_ms / ms:>7.1f}x {recall:>9.1%} {scanned:>8.1%}")
+        index.nprobe, index.rerank = NPROBE, RERANK
+
+        # One new person enrolled with 30 samples, as save_new_user does
+        new_faces = [texture_faces([size + 1], s)[0] for s in range(30)]
+        t0 = time.perf_counter()
+        matcher.update(new_faces, [size + 1] * len(new_faces))
+        insert_ms = (time.perf_counter() - t0) * 1000
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'face_index.npz')
+            t0 = time.perf_counter()
+            index.save(path)
+            save_ms = (time.perf_counter() - t0) * 1000
+            t0 = time.perf_counter()
+            IVFIndex.load(path)
+            load_ms = (time.perf_counter() - t0) * 1000
+            file_mb = os.path.getsize(path) / 1e6
+        print(f"enroll 30 samples {insert_ms:.1f} ms (incl. histograms), "
+              f"save {save_ms:.1f} ms, load {load_ms:.1f} ms, {file_mb:.1f} MB on disk")
+
+if __name__ == '__main__':
+    main()
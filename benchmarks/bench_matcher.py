@@ -0,0 +1,85 @@
+"""
+LBPHMatcher (vectorized NumPy) vs cv2.face.LBPHFaceRecognizer.predict on
+synthetic galleries of 100 to 50,000 identities.
+
+Galleries use cheap per-identity procedural textures instead of drawn
+faces; only the histogram count matters for matching cost. "agree" is
+the fraction of faces where both engines return the same label. Each gallery row is a
+64 KB histogram, so 50,000 identities x 1 sample needs about 3.3 GB;
+OpenCV keeps its own copy, so it is only timed up to --opencv-max.
+
+    python -m benchmarks.bench_matcher --sizes 100 1000 10000 50000 --batch 8
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from lbph_matcher import LBPHMatcher
+
+FACE_SIZE = (100, 100)
+
+def texture_faces(labels, sample):
+    """Identity-consistent textures: a fixed pattern per label plus per-sample noise."""
+    faces = []
+    for label in labels:
+        base = np.random.default_rng(int(label)).normal(128, 40, (FACE_SIZE[1], FACE_SIZE[0]))
+        base = cv2.GaussianBlur(base.astype(np.float32), (0, 0), 1.5)
+        noise = np.random.default_rng((int(label), sample)).normal(0, 4, base.shape)
+        faces.append(np.clip(base + noise, 0, 255).astype(np.uint8))
+    return faces
+
+def build(identities, samples, matcher_kwargs, with_opencv, step=1000):
+    matcher = LBPHMatcher(**matcher_kwargs)
+    recognizer = cv2.face.LBPHFaceRecognizer_create() if with_opencv else None
+    for start in range(0, identities, step):
+        labels = np.arange(start + 1, min(identities, start + step) + 1, dtype=np.int32)
+        for s in range(samples):
+            faces = texture_faces(labels, s)
+            matcher.add_histograms(matcher.histograms(faces), labels)
+            if recognizer is not None:
+                if start == 0 and s == 0:
+                    recognizer.train(faces, labels)
+                else:
+                    recognizer.update(faces, labels)
+    return matcher, recognizer
+
+def timed(fn, repeat):
+    fn()
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 50000])
+    parser.add_argument('--samples', type=int, default=1, help="samples per identity")
+    parser.add_argument('--batch', type=int, default=8, help="faces per predict call")
+    parser.add_argument('--reduce', default='all', choices=['all', 'centroid', 'topk'])
+    parser.add_argument('--opencv-max', type=int, default=10000, help="largest gallery timed with OpenCV")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'identities':>10} {'rows':>8} {'opencv ms/face':>15} {'numpy ms/face':>14} {'speedup':>8} {'agree':>6}")
+    for size in args.sizes:
+        with_opencv = size <= args.opencv_max
+        matcher, recognizer = build(size, args.samples, {"reduce": args.reduce}, with_opencv)
+        # Queries: unseen samples of enrolled identities
+        queries = texture_faces(np.linspace(1, size, args.batch).astype(int), sample=10_000)
+        numpy_ms = timed(lambda: matcher.predict_batch(queries), args.repeat) / args.batch
+        if recognizer is not None:
+            opencv_ms = timed(lambda: [recognizer.predict(q) for q in queries], args.repeat) / args.batch
+            ours = matcher.predict_batch(queries)
+            agree = np.mean([recognizer.predict(q)[0] == o[0] for q, o in zip(queries, ours)])
+            print(f"{size:>10} {len(matcher):>8} {opencv_ms:>15.2f} {numpy_ms:>14.2f} "
+                  f"{opencv_ms / numpy_ms:>7.1f}x {agree:>6.0%}")
+        else:
+            print(f"{size:>10} {len(matcher):>8} {'-':>15} {numpy_ms:>14.2f} {'-':>8} {'-':>6}")
+        del matcher, recognizer
+
+if __name__ == '__main__':
+    main()
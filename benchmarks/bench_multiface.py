@@ -0,0 +1,100 @@
+"""
+Cost of a crowded kiosk frame as the number of faces grows (1..10).
+
+Every frame is the worst case: a fresh tracker, so every face in it needs
+a prediction (a group walking up to the kiosk at once).
+
+  - frame: decode + analyze_frame as /process_frame runs it (preprocess,
+    detect, track, one predict_faces call on the stacked faces, one
+    log_attendance_batch call), and the same per face;
+  - recognize: that frame's recognition step alone, "per-face" being the
+    old loop (crop, predict and log attendance face by face) and
+    "batched" the new one, given the same boxes.
+
+The exhaustive chi-square scan still costs the same per face and gallery
+column, so the recognition step grows about linearly with faces; what
+batching shares is everything per frame and per call (decode,
+detection, tracking, one gallery pass set-up, one feed update and one
+writer entry). The cooldown is disabled so every face writes a row.
+
+    python -m benchmarks.bench_multiface --population 1000 --faces 1 2 4 6 8 10
+"""
+import argparse
+import time
+
+from attendance_state import CooldownIndex
+from benchmarks import synthetic
+from benchmarks.pipeline_driver import PipelineDriver, encode_frames
+from preprocess import FramePreprocessor
+
+def crowded_frame(faces, frame_size=(1280, 720)):
+    width, height = frame_size
+    face_px = int(min(height * 0.45, width / faces * 0.8))
+    frame, truth = next(synthetic.frame_stream(1, identities=tuple(range(1, faces + 1)),
+                                               frame_size=frame_size, face_px=face_px, seed=faces))
+    return frame, [box for _, box in truth]
+
+def time_per_call(fn, repeats):
+    fn()  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - t0) / repeats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--faces', type=int, nargs='+', default=list(range(1, 11)), help="faces per frame")
+    parser.add_argument('--population', type=int, default=1000, help="enrolled identities")
+    parser.add_argument('--samples', type=int, default=5, help="faces per enrolled identity")
+    parser.add_argument('--repeats', type=int, default=20, help="timed frames per point")
+    args = parser.parse_args()
+
+    driver = PipelineDriver()
+    app = driver.app
+    try:
+        driver.enroll(range(1, args.population + 1), samples=args.samples,
+                      captured=range(1, max(args.faces) + 1))
+        app.cooldowns = CooldownIndex(0)
+        session = app.sessions.get("crowd")
+        app.set_app_mode(session, 'attendance')
+        pre = FramePreprocessor()
+        print(f"{len(app.matcher)} gallery samples, {args.population} identities")
+
+        def frame_path(jpeg):
+            session.tracker = None
+            found = app.analyze_frame(app.decode_frame(jpeg), session)['faces']
+            return len(found)
+
+        def per_face(boxes):
+            for box in boxes:
+                label, conf = app.matcher.predict(pre.face(box))
+                if label in app.user_db:
+                    app.log_attendance_db(label, app.user_db[label])
+
+        def batched(boxes):
+            results = app.predict_faces(pre.faces(boxes))
+            app.log_attendance_batch([(label, app.user_db[label]) for label, conf in results
+                                      if label in app.user_db])
+
+        print(f"{'faces':>5} {'found':>5} {'frame ms':>9} {'ms/face':>8} {'x 1-face':>9}"
+              f" {'per-face ms':>12} {'batched ms':>11}")
+        single = None
+        for n in args.faces:
+            frame, boxes = crowded_frame(n)
+            jpeg = encode_frames([frame])[0]
+            found = frame_path(jpeg)
+            whole = time_per_call(lambda: frame_path(jpeg), args.repeats)
+            single = single or whole
+            pre.prepare(frame)
+            old = time_per_call(lambda: per_face(boxes), args.repeats)
+            new = time_per_call(lambda: batched(boxes), args.repeats)
+            print(f"{n:>5} {found:>5} {whole * 1000:>9.2f} {whole * 1000 / n:>8.2f} {whole / single:>9.2f}"
+                  f" {old * 1000:>12.2f} {new * 1000:>11.2f}")
+        app.attendance_writer.flush()
+        stats = app.attendance_writer.metrics()
+        print(f"writer: {stats['written']} rows in {stats['batches']} batches")
+    finally:
+        driver.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Memory per worker: private gallery copies vs the shared memory map.
+
+Starts W worker processes (like gunicorn workers) that each load a
+gallery of N histograms, run one prediction and touch every page of it.
+"private" copies the gallery into every worker, as loading trainer.yml did;
+"shared" maps shared_model.SharedGallery. Reports the summed PSS
+(proportional set size: shared pages are split between the processes
+mapping them) and each worker's private bytes, then times how long
+readers take to pick up an enrollment published by another process.
+
+Linux only (reads /proc/self/smaps_rollup).
+
+    python -m benchmarks.bench_shared_model --rows 20000 --workers 1 2 4
+"""
+import argparse
+import multiprocessing as mp
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from lbph_matcher import LBPHMatcher
+from shared_model import SharedGallery
+from benchmarks.bench_matcher import texture_faces
+
+def memory_kb():
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    private = fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    return fields.get('Pss', 0), private
+
+def worker(path, mode, queries, barrier, results):
+    gallery = SharedGallery(path, LBPHMatcher().dim)
+    hist_t, labels, sums = gallery.view()
+    matcher = LBPHMatcher()
+    if mode == 'private':
+        hist_t, labels, sums = np.array(hist_t), np.array(labels), np.array(sums)
+    matcher.set_gallery(hist_t, labels, sums)
+    matcher.predict_batch(queries)
+    float(hist_t.sum())  # make sure every page is resident
+    barrier.wait()  # every worker has the gallery resident
+    results.put(memory_kb())
+    barrier.wait()  # keep mappings alive until all have measured
+
+def measure(path, mode, workers, queries):
+    ctx = mp.get_context('spawn')  # fresh interpreters, like separate gunicorn workers
+    barrier, results = ctx.Barrier(workers), ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(path, mode, queries, barrier, results)) for _ in range(workers)]
+    for p in procs: p.start()
+    stats = [results.get() for _ in procs]
+    for p in procs: p.join()
+    return sum(s[0] for s in stats) / 1024, np.mean([s[1] for s in stats]) / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000, help="histograms in the gallery")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+
+    matcher = LBPHMatcher()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'model.mmap')
+        gallery = SharedGallery(path, matcher.dim)
+        hist_t = np.empty((matcher.dim, args.rows), np.float32)
+        for start in range(0, args.rows, 1000):
+            labels = np.arange(start + 1, min(args.rows, start + 1000) + 1)
+            hist_t[:, start:start + len(labels)] = matcher.histograms(texture_faces(labels, 0)).T
+        with gallery.lock():
+            gallery.rewrite(hist_t, np.arange(1, args.rows + 1, dtype=np.int32), 0)
+        del hist_t
+        print(f"gallery: {args.rows} rows, {args.rows * matcher.dim * 4 / 2**20:.0f} MB of histograms")
+
+        queries = texture_faces([1, args.rows // 2], sample=99)
+        print(f"{'mode':>8} {'workers':>8} {'total PSS MB':>13} {'private MB/worker':>18}")
+        for mode in ('private', 'shared'):
+            for workers in args.workers:
+                pss, private = measure(path, mode, workers, queries)
+                print(f"{mode:>8} {workers:>8} {pss:>13.0f} {private:>18.0f}")
+
+        # Enrollment in one process -> noticed and remapped by another
+        reader = SharedGallery(path, matcher.dim)
+        reader.view()
+        new = matcher.histograms(texture_faces([args.rows + 1] * 30, 0))
+        t0 = time.perf_counter()
+        with gallery.lock():
+            gallery.append(new, np.full(30, args.rows + 1, np.int32), 0)
+        publish_ms = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        changed = reader.changed()
+        hist_t, labels, _ = reader.view()
+        pickup_ms = (time.perf_counter() - t0) * 1000
+        print(f"\nappend 30 samples: publish {publish_ms:.1f} ms, reader saw change={changed} "
+              f"and remapped {len(labels)} rows in {pickup_ms:.2f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Per-frame cost of the attendance path with and without FaceTracker.
+
+Replays a synthetic kiosk stream twice: once detecting and predicting on
+every frame (the original /process_frame behaviour) and once through
+FaceTracker. Reports per-frame latency, cascade/predict call counts and
+accuracy drift (box IoU against per-frame detection, identity agreement).
+
+    python -m benchmarks.bench_tracking --frames 300 --detect-every 5
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks import synthetic
+from face_tracker import FaceTracker, iou
+from preprocess import FramePreprocessor
+
+FACE_SIZE = (100, 100)
+THRESHOLD = 75
+
+def build_recognizer(identities, samples):
+    faces, labels = synthetic.gallery(identities, samples)
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.train(faces, labels)
+    return recognizer
+
+def predict(recognizer, pre, box):
+    label, dist = recognizer.predict(pre.face(pre.to_full(box)))
+    return label if dist < THRESHOLD else None
+
+def run_baseline(frames, cascade, recognizer):
+    pre = FramePreprocessor(scale=0.5, face_size=FACE_SIZE)
+    times, outputs, calls = [], [], {"detect": 0, "predict": 0}
+    for frame in frames:
+        t0 = time.perf_counter()
+        _, small_gray = pre.prepare(frame)
+        boxes = cascade.detectMultiScale(small_gray, 1.1, 5, minSize=(30, 30))
+        calls["detect"] += 1
+        result = []
+        for box in boxes:
+            result.append((tuple(int(v) for v in box), predict(recognizer, pre, box)))
+            calls["predict"] += 1
+        times.append(time.perf_counter() - t0)
+        outputs.append(result)
+    return times, outputs, calls
+
+def run_tracked(frames, cascade, recognizer, detect_every):
+    pre = FramePreprocessor(scale=0.5, face_size=FACE_SIZE)
+    tracker = FaceTracker(detect_every=detect_every)
+    detect = lambda img: cascade.detectMultiScale(img, 1.1, 5, minSize=(30, 30))
+    times, outputs, calls = [], [], {"detect": 0, "predict": 0}
+    for frame in frames:
+        t0 = time.perf_counter()
+        _, small_gray = pre.prepare(frame)
+        result = []
+        for track in tracker.update(small_gray, detect):
+            if tracker.needs_recognition(track):
+                label = predict(recognizer, pre, track.box)
+                track.set_identity(label, 0, tracker.frame_index)
+                calls["predict"] += 1
+            result.append((track.box, track.label))
+        times.append(time.perf_counter() - t0)
+        outputs.append(result)
+    calls["detect"] = tracker.detections
+    return times, outputs, calls
+
+def drift(reference, tracked):
+    """Mean IoU of tracked boxes vs per-frame detections, and identity agreement."""
+    ious, agree, total = [], 0, 0
+    for ref, got in zip(reference, tracked):
+        for rbox, rlabel in ref:
+            best = max(got, key=lambda g: iou(rbox, g[0]), default=None)
+            overlap = iou(rbox, best[0]) if best else 0.0
+            ious.append(overlap)
+            total += 1
+            agree += bool(best) and overlap > 0.3 and best[1] == rlabel
+    return (float(np.mean(ious)) if ious else 0.0), (agree / total if total else 1.0)
+
+def summarize(name, times, calls):
+    ms = np.array(times) * 1000
+    print(f"{name:10s} mean={ms.mean():6.2f}ms p50={np.percentile(ms, 50):6.2f} "
+          f"p95={np.percentile(ms, 95):6.2f} max={ms.max():6.2f}  "
+          f"detect={calls['detect']} predict={calls['predict']}")
+    return ms.mean()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--faces', type=int, default=2, help="people in front of the kiosk")
+    parser.add_argument('--identities', type=int, default=10)
+    parser.add_argument('--samples', type=int, default=10)
+    parser.add_argument('--detect-every', type=int, default=5)
+    args = parser.parse_args()
+
+    cascade = synthetic.cascade()
+    recognizer = build_recognizer(args.identities, args.samples)
+    people = tuple(range(1, args.faces + 1))
+    frames = [f for f, _ in synthetic.frame_stream(args.frames, identities=people, face_px=150)]
+
+    base_t, base_out, base_calls = run_baseline(frames, cascade, recognizer)
+    track_t, track_out, track_calls = run_tracked(frames, cascade, recognizer, args.detect_every)
+    base_mean = summarize("per-frame", base_t, base_calls)
+    track_mean = summarize("tracked", track_t, track_calls)
+    mean_iou, agreement = drift(base_out, track_out)
+    print(f"speedup x{base_mean / track_mean:.2f}  box IoU vs per-frame detection {mean_iou:.3f}  "
+          f"identity agreement {agreement:.1%}")
+
+if __name__ == '__main__':
+    main()
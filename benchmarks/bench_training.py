@@ -0,0 +1,84 @@
+"""
+Recognition latency while registrations are being trained.
+
+A predict loop runs on the main thread (like a request thread) against
+a gallery of N identities while a burst of B registrations of 40 faces
+each goes through training_worker.TrainingService. Training builds each
+new matcher aside and swaps it in, so predictions never wait on a lock.
+With spare cores p50/p99 stay at the idle baseline. On a single core the
+two threads share the CPU; the worker runs at a lower priority (--nice,
+TRAIN_NICE in app.py), so predictions keep most of it and training takes
+longer instead. One core, 2000 identities, burst 8:
+
+    nice 0:   p50 26 ms idle, 64 ms while training; trained in 1.1 s
+    nice 10:  p50 29 ms idle, 30 ms while training; trained in 6.1 s
+
+(this loop predicts non-stop; a kiosk leaves the CPU idle between frames,
+which the worker then gets.)
+
+    python -m benchmarks.bench_training --identities 2000 --burst 8 --nice 10
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from lbph_matcher import LBPHMatcher
+from training_worker import DEFAULT_NICE, TrainingService
+from benchmarks.bench_matcher import texture_faces
+
+def percentiles(samples):
+    ms = np.array(samples) * 1000
+    return f"p50 {np.percentile(ms, 50):6.2f} ms  p99 {np.percentile(ms, 99):6.2f} ms  ({len(ms)} predictions)"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--identities', type=int, default=2000)
+    parser.add_argument('--burst', type=int, default=8, help="registrations submitted at once")
+    parser.add_argument('--max-batch', type=int, default=16)
+    parser.add_argument('--idle-seconds', type=float, default=3.0)
+    parser.add_argument('--nice', type=int, default=DEFAULT_NICE, help="training thread priority below predictions")
+    args = parser.parse_args()
+
+    state = {"matcher": LBPHMatcher()}
+    labels = np.arange(1, args.identities + 1)
+    state["matcher"].add_histograms(state["matcher"].histograms(texture_faces(labels, 0)), labels)
+    query = texture_faces([args.identities // 2], sample=99)[0]
+
+    def train(jobs):
+        current = state["matcher"]
+        fresh = LBPHMatcher()
+        fresh.set_gallery(np.ascontiguousarray(current.histograms_matrix.T), current.labels.copy())
+        for job in jobs:
+            label = job.payload
+            faces = [texture_faces([label], k)[0] for k in range(40)]
+            fresh.update(faces, [label] * len(faces))
+        state["matcher"] = fresh  # atomic swap for readers
+        return [(True, None)] * len(jobs)
+
+    def predict_for(seconds, until=None):
+        samples, end = [], time.perf_counter() + seconds
+        while time.perf_counter() < end and not (until and until()):
+            t0 = time.perf_counter()
+            state["matcher"].predict(query)
+            samples.append(time.perf_counter() - t0)
+        return samples
+
+    print(f"gallery {args.identities} identities")
+    print(f"idle:     {percentiles(predict_for(args.idle_seconds))}")
+
+    service = TrainingService(train, max_batch=args.max_batch, nice=args.nice).start()
+    done = threading.Event()
+    t0 = time.perf_counter()
+    jobs = [service.submit(args.identities + 1 + i) for i in range(args.burst)]
+    threading.Thread(target=lambda: (service.queue.join(), done.set()), daemon=True).start()
+    busy = predict_for(600, until=done.is_set)
+    elapsed = time.perf_counter() - t0
+    print(f"training: {percentiles(busy)}")
+    stats = service.stats()
+    print(f"{args.burst} registrations trained in {elapsed:.2f}s as {stats['batches']} model update(s); "
+          f"all done: {all(j.status == 'done' for j in jobs)}; gallery now {len(state['matcher'])} rows")
+
+if __name__ == '__main__':
+    main()
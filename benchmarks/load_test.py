@@ -0,0 +1,306 @@
+"""
+HTTP load test: N simulated kiosks against /process_frame.
+
+Each kiosk behaves like templates/index.html in attendance mode: a frame
+timer every 150 ms that skips a tick while the previous upload is still
+in flight (counted as a dropped frame), raw JPEG uploads with the
+X-Kiosk-Id/X-Kiosk-Mode headers, and on a second connection the page's
+polls, /current_recognition every second and /get_attendance?since=
+with If-None-Match every two seconds.
+
+Without --url, a local server is started: a temp directory gets a SQLite
+database and a model with --population synthetic people (enrolled via
+pipeline_driver), then gunicorn serves app:app from it with the given
+workers/threads (or Flask's threaded dev server with --server flask).
+Frames are synthetic by default, or replayed from a directory of JPEGs
+or a video file.
+
+    python -m benchmarks.load_test --kiosks 1 4 8 16 --duration 20 --workers 2
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --frames-dir recorded/
+"""
+import argparse
+import glob
+import http.client
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+import cv2
+import numpy as np
+
+from benchmarks.pipeline_driver import REPO_ROOT, encode_frames, percentiles
+
+FRAME_INTERVAL = 0.150      # the page's frame timer
+RECOGNITION_INTERVAL = 1.0
+ATTENDANCE_INTERVAL = 2.0
+
+# --- Frames ---
+
+def load_frames(args):
+    if args.frames_dir:
+        paths = sorted(glob.glob(os.path.join(args.frames_dir, "*.jp*g")))
+        if not paths:
+            sys.exit(f"no JPEG files in {args.frames_dir}")
+        frames = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                frames.append(f.read())
+        return frames
+    if args.video:
+        cap, frames = cv2.VideoCapture(args.video), []
+        while len(frames) < args.max_frames:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            frames.append(frame)
+        cap.release()
+        if not frames:
+            sys.exit(f"could not read frames from {args.video}")
+        return encode_frames(frames)
+    from benchmarks.suite import FRAME_SIZES, scenario_frames
+    return scenario_frames(args.max_frames, args.faces, FRAME_SIZES[args.frame_size])
+
+# --- Local server ---
+
+def seed(workdir, population, captured):
+    """Enrolls the synthetic population into workdir's database and model files."""
+    from benchmarks.pipeline_driver import PipelineDriver
+    driver = PipelineDriver(workdir=workdir)
+    driver.enroll(range(1, population + 1), samples=5, captured=range(1, captured + 1))
+    driver.close()
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(args, workdir):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+               PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    print(f"seeding {args.population} people into {workdir} ...")
+    subprocess.run([sys.executable, "-c", "import sys; from benchmarks.load_test import seed; "
+                    "seed(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))",
+                    workdir, str(args.population), str(args.faces)],
+                   cwd=REPO_ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+    port = free_port()
+    if args.server == 'gunicorn':
+        cmd = [sys.executable, "-m", "gunicorn", "--chdir", workdir, "-b", f"127.0.0.1:{port}",
+               "-w", str(args.workers), "--worker-class", "gthread", "--threads", str(args.threads),
+               "--log-level", "warning", "app:app"]
+    else:
+        cmd = [sys.executable, "-c", "import sys, app; app.app.run('127.0.0.1', int(sys.argv[1]), threaded=True)",
+               str(port)]
+    log = open(os.path.join(workdir, "server.log"), 'w')
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120
+    ready = 0  # consecutive 200s from /readyz; each connection may reach a different worker
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f"server exited; see {log.name}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/readyz")
+            ready = ready + 1 if conn.getresponse().status == 200 else 0
+            conn.close()
+            if ready >= 2 * args.workers:
+                return proc, url
+        except OSError:
+            ready = 0
+        if not ready:
+            time.sleep(0.2)
+    proc.kill()
+    sys.exit("server did not come up")
+
+# --- Kiosks ---
+
+class Stats:
+    def __init__(self):
+        self.latency = {}  # endpoint -> [seconds]
+        self.errors = {}
+        self.frames = 0
+        self.dropped = 0
+        self.faces = 0
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, ok):
+        with self._lock:
+            self.latency.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def frame(self, faces, dropped):
+        with self._lock:
+            self.frames += 1
+            self.faces += faces
+            self.dropped += dropped
+
+class Client:
+    """One keep-alive connection that reconnects after errors."""
+
+    def __init__(self, host, port, kiosk_id, timeout):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.headers = {"X-Kiosk-Id": kiosk_id}
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        """(status, body bytes, response headers), status 0 on a network error."""
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.conn.request(method, path, body=body, headers=dict(self.headers, **(headers or {})))
+            resp = self.conn.getresponse()
+            return resp.status, resp.read(), resp
+        except (OSError, http.client.HTTPException):
+            if self.conn is not None:
+                self.conn.close()
+            self.conn = None
+            return 0, b"", None
+
+class Kiosk:
+    def __init__(self, index, url, frames, stats, stop, timeout=30):
+        parsed = urlparse(url)
+        self.kiosk_id = f"load-{index}"
+        self.frames, self.stats, self.stop = frames, stats, stop
+        self.offset = index * 7  # kiosks don't upload identical frames in lockstep
+        self.uploads = Client(parsed.hostname, parsed.port or 80, self.kiosk_id, timeout)
+        self.polls = Client(parsed.hostname, parsed.port or 80, self.kiosk_id, timeout)
+
+    def run_frames(self):
+        self.uploads.request("GET", "/set_mode?mode=attendance")
+        start, tick, i = time.monotonic(), 0, 0
+        while not self.stop.is_set():
+            delay = start + tick * FRAME_INTERVAL - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            t0 = time.monotonic()
+            status, body, _ = self.uploads.request(
+                "POST", "/process_frame", body=self.frames[(self.offset + i) % len(self.frames)],
+                headers={"Content-Type": "image/jpeg", "X-Kiosk-Mode": "attendance"})
+            elapsed = time.monotonic() - t0
+            ok, faces = status == 200, 0
+            if ok:
+                try:
+                    result = json.loads(body)
+                    ok = result.get("success", False)
+                    faces = len(result.get("faces", []))
+                except ValueError:
+                    ok = False
+            self.stats.record("process_frame", elapsed, ok)
+            i += 1
+            # Timer ticks that fired while this upload was in flight were skipped
+            next_tick = max(tick + 1, math.ceil((time.monotonic() - start) / FRAME_INTERVAL))
+            self.stats.frame(faces, next_tick - tick - 1)
+            tick = next_tick
+
+    def run_polls(self):
+        cursor, etag = 0, None
+        next_recognition = next_attendance = time.monotonic()
+        while not self.stop.is_set():
+            now = time.monotonic()
+            if now >= next_recognition:
+                t0 = time.monotonic()
+                status, _, _ = self.polls.request("GET", "/current_recognition")
+                self.stats.record("current_recognition", time.monotonic() - t0, status == 200)
+                next_recognition += RECOGNITION_INTERVAL
+            if now >= next_attendance:
+                t0 = time.monotonic()
+                status, body, resp = self.polls.request("GET", f"/get_attendance?since={cursor}",
+                                                        headers={"If-None-Match": etag} if etag else None)
+                self.stats.record("get_attendance", time.monotonic() - t0, status in (200, 304))
+                if status == 200:
+                    etag = resp.getheader("ETag")
+                    try:
+                        cursor = json.loads(body).get("seq", cursor)
+                    except ValueError:
+                        pass
+                next_attendance += ATTENDANCE_INTERVAL
+            self.stop.wait(max(0.0, min(next_recognition, next_attendance) - time.monotonic()))
+
+def run_level(url, frames, kiosks, duration, warmup):
+    stop = threading.Event()
+    stats = Stats()
+    threads = []
+    for k in range(kiosks):
+        kiosk = Kiosk(k, url, frames, stats, stop)
+        threads += [threading.Thread(target=kiosk.run_frames, daemon=True),
+                    threading.Thread(target=kiosk.run_polls, daemon=True)]
+    for t in threads:
+        t.start()
+    time.sleep(warmup)
+    with stats._lock:  # measure steady state only
+        stats.latency, stats.errors = {}, {}
+        stats.frames = stats.dropped = stats.faces = 0
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join(60)
+
+    offered = kiosks * duration / FRAME_INTERVAL
+    result = {"kiosks": kiosks, "duration_s": duration, "offered_fps": offered / duration,
+              "fps": stats.frames / duration, "frames": stats.frames, "dropped": stats.dropped,
+              "dropped_pct": 100.0 * stats.dropped / max(1, stats.frames + stats.dropped),
+              "faces_per_frame": stats.faces / max(1, stats.frames), "endpoints": {}}
+    for endpoint, samples in sorted(stats.latency.items()):
+        errors = stats.errors.get(endpoint, 0)
+        result["endpoints"][endpoint] = dict(percentiles(samples), requests=len(samples), errors=errors,
+                                             error_pct=100.0 * errors / max(1, len(samples)))
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--kiosks', type=int, nargs='+', default=[1, 4, 8], help="concurrent kiosks (one run each)")
+    parser.add_argument('--duration', type=float, default=20.0, help="measured seconds per run")
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--url', help="existing server; default starts a local one")
+    parser.add_argument('--server', choices=['gunicorn', 'flask'], default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--population', type=int, default=100, help="people enrolled in the local server")
+    parser.add_argument('--frames-dir', help="replay these JPEG files")
+    parser.add_argument('--video', help="replay frames from this video file")
+    parser.add_argument('--frame-size', default='vga', choices=['qvga', 'vga', 'hd'])
+    parser.add_argument('--faces', type=int, default=1, help="faces per synthetic frame")
+    parser.add_argument('--max-frames', type=int, default=120)
+    parser.add_argument('--out', help="write results JSON here")
+    args = parser.parse_args()
+
+    frames = load_frames(args)
+    proc, tmp = None, None
+    url = args.url
+    if url is None:
+        tmp = tempfile.TemporaryDirectory(prefix="face-load-")
+        proc, url = start_server(args, tmp.name)
+    print(f"{len(frames)} frames, {np.mean([len(f) for f in frames]) / 1024:.0f} KB avg, against {url}")
+    print(f"{'kiosks':>6} {'offered':>8} {'fps':>7} {'dropped':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>7} {'poll p99':>9}")
+    results = []
+    try:
+        for kiosks in args.kiosks:
+            r = run_level(url, frames, kiosks, args.duration, args.warmup)
+            results.append(r)
+            f = r["endpoints"].get("process_frame", percentiles([]))
+            polls = [e["p99_ms"] for name, e in r["endpoints"].items() if name != "process_frame"]
+            errors = sum(e["errors"] for e in r["endpoints"].values())
+            print(f"{kiosks:>6} {r['offered_fps']:>8.1f} {r['fps']:>7.1f} {r['dropped_pct']:>7.1f}% "
+                  f"{f['p50_ms']:>8.1f} {f['p95_ms']:>8.1f} {f['p99_ms']:>8.1f} {errors:>7} "
+                  f"{max(polls, default=0):>9.1f}")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(30)
+            tmp.cleanup()
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({"url": args.url or f"local {args.server} w={args.workers} t={args.threads}",
+                       "args": vars(args), "results": results}, f, indent=1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Runs the real app.py frame pipeline in-process against a throwaway setup.
+
+PipelineDriver imports app with a temporary working directory and a
+SQLite DATABASE_URL, so model files, spill files and the database all
+live under one temp dir and no server, camera or network is involved.
+It enrolls a synthetic population through app.train_registrations (the
+training worker's handler) and feeds JPEG-encoded synthetic frames
+through the same steps as /process_frame: decode_frame, then
+analyze_frame for detection, preprocessing, tracking, prediction and
+attendance logging. Per-stage timings come from app.pipeline_metrics.
+
+    driver = PipelineDriver()
+    driver.enroll(range(1, 101), samples=5)
+    result = driver.run_frames(frames, kiosk="bench")
+"""
+import importlib
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks import synthetic
+from metrics import Registry
+from training_worker import Job
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentiles(seconds):
+    ms = np.asarray(seconds) * 1000
+    if not len(ms):
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "mean_ms": 0.0}
+    return {"p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)), "mean_ms": float(ms.mean())}
+
+def encode_frames(frames, quality=70):
+    """JPEG bytes per frame, as the kiosk page uploads them."""
+    return [cv2.imencode('.jpg', f, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes() for f in frames]
+
+class PipelineDriver:
+    def __init__(self, workdir=None, env=None):
+        self._tmp = None
+        if workdir is None:
+            self._tmp = tempfile.TemporaryDirectory(prefix="face-bench-")
+            workdir = self._tmp.name
+        self.workdir = workdir
+        os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+        os.environ.update(env or {})
+        self._cwd = os.getcwd()
+        if REPO_ROOT not in sys.path:
+            sys.path.insert(0, REPO_ROOT)  # '' on sys.path would follow the chdir
+        os.chdir(workdir)  # app.py keeps its model files relative to the cwd
+        if 'app' in sys.modules:
+            raise RuntimeError("app is already imported; use one PipelineDriver per process")
+        self.app = importlib.import_module('app')
+        self.app.startup.wait()  # schema and model load on app's startup thread
+        self.enrolled = 0
+        self._next_job = 1
+
+    def close(self):
+        self.app.attendance_writer.close()
+        os.chdir(self._cwd)
+        if self._tmp is not None:
+            self._tmp.cleanup()
+
+    def reset_metrics(self):
+        self.app.pipeline_metrics = Registry()
+        return self.app.pipeline_metrics
+
+    def enroll(self, identities, samples=5, batch=16, captured=(), face_size=(100, 100)):
+        """Registers each identity (emp_id "E<n>") with `samples` faces, `batch`
+        registrations per model update like the training worker coalesces
+        them. Identities in `captured` get faces cut out of frames by the
+        cascade and preprocessor, as a kiosk capture would (needed for them
+        to be recognized in frame streams); the rest are only gallery filler
+        and use a faster resize. Returns seconds per train_registrations call."""
+        identities = list(identities)
+        timings = []
+        for start in range(0, len(identities), batch):
+            jobs = []
+            for ident in identities[start:start + batch]:
+                faces = [self._sample(ident, v, ident in captured, face_size) for v in range(1, samples + 1)]
+                faces = [f for f in faces if f is not None]
+                color = cv2.cvtColor(synthetic.draw_face(ident, size=120), cv2.COLOR_GRAY2BGR)
+                jobs.append(Job(self._next_job, {"kiosk_id": "bench-enroll", "name": f"Person {ident}",
+                                                 "emp_id": f"E{ident}", "faces": faces,
+                                                 "faces_color": [color]}))
+                self._next_job += 1
+            t0 = time.perf_counter()
+            results = self.app.train_registrations(jobs)
+            timings.append(time.perf_counter() - t0)
+            failed = [error for ok, error in results if not ok]
+            if failed:
+                raise RuntimeError(f"enrollment failed: {failed[0]}")
+        self.enrolled += len(identities)
+        return timings
+
+    @staticmethod
+    def _sample(ident, variation, captured, face_size):
+        if captured:
+            # Near and far from the camera, so every scenario's face size is covered
+            return synthetic.registration_sample(ident, variation, face_size=face_size, px_range=(70, 300))
+        return cv2.resize(synthetic.draw_face(ident, size=120, variation=variation), face_size)
+
+    def run_frames(self, jpegs, kiosk="bench", mode='attendance', via='direct'):
+        """Pushes encoded frames through the pipeline one after another.
+        via='direct' calls decode_frame/analyze_frame; via='flask' posts to
+        /process_frame with the test client (adds request handling)."""
+        app = self.app
+        session = app.sessions.get(kiosk)
+        app.set_app_mode(session, mode)
+        client = app.app.test_client() if via == 'flask' else None
+        latencies, faces = [], 0
+        t_start = time.perf_counter()
+        for jpeg in jpegs:
+            t0 = time.perf_counter()
+            if client is not None:
+                result = client.post('/process_frame', data=jpeg,
+                                     headers={'Content-Type': 'image/jpeg', 'X-Kiosk-Id': kiosk}).get_json()
+            else:
+                with app.pipeline_metrics.stage('frame'):
+                    with app.pipeline_metrics.stage('decode'):
+                        frame = app.decode_frame(jpeg)
+                    result = app.analyze_frame(frame, session)
+            latencies.append(time.perf_counter() - t0)
+            faces += len(result.get('faces', []))
+        elapsed = time.perf_counter() - t_start
+        return {"frames": len(jpegs), "seconds": elapsed, "fps": len(jpegs) / elapsed if elapsed else 0.0,
+                "faces_returned": faces, "latency": percentiles(latencies)}
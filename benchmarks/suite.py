@@ -0,0 +1,151 @@
+"""
+Reproducible end-to-end benchmark of the recognition pipeline.
+
+Runs pipeline_driver.PipelineDriver (app.py in-process, SQLite, synthetic
+faces) over a grid of scenarios and writes one JSON file:
+
+  - frames: throughput and per-frame latency for every combination of
+    frame size, faces per frame and enrolled population, with per-stage
+    p50/p95/p99 from app.pipeline_metrics and the recognized fraction;
+  - training: time per registration (40 faces, like a kiosk capture)
+    against the largest population.
+
+Everything is seeded, so two runs on the same machine differ only by
+timing noise. Compare a result with an earlier one to spot regressions:
+
+    python -m benchmarks.suite --out results/HEAD.json
+    python -m benchmarks.suite --compare results/base.json results/HEAD.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks import synthetic
+from benchmarks.pipeline_driver import PipelineDriver, encode_frames, percentiles
+
+FRAME_SIZES = {"qvga": (320, 240), "vga": (640, 480), "hd": (1280, 720)}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def scenario_frames(n_frames, faces, frame_size):
+    width, height = frame_size
+    # Faces large enough for the half-size detection pass, small enough to fit side by side
+    face_px = int(min(height * 0.45, width / faces * 0.8))
+    stream = synthetic.frame_stream(n_frames, identities=tuple(range(1, faces + 1)),
+                                    frame_size=frame_size, face_px=face_px, seed=faces)
+    return encode_frames(frame for frame, _ in stream)
+
+def run(args):
+    driver = PipelineDriver(env={"TRACK_DETECT_EVERY": str(args.detect_every)})
+    app = driver.app
+    results = {"meta": {"commit": git_commit(), "date": datetime.datetime.now().isoformat(timespec='seconds'),
+                        "python": platform.python_version(), "opencv": cv2.__version__,
+                        "numpy": np.__version__, "cpus": os.cpu_count(), "machine": platform.machine(),
+                        "args": vars(args)},
+               "frames": [], "training": {}}
+    streams = {(size, faces): scenario_frames(args.frames, faces, FRAME_SIZES[size])
+               for size in args.frame_sizes for faces in args.faces}
+    try:
+        for population in sorted(args.population):
+            t0 = time.perf_counter()
+            driver.enroll(range(driver.enrolled + 1, population + 1), samples=args.samples,
+                          captured=range(1, max(args.faces) + 1))
+            print(f"population {population}: enrolled in {time.perf_counter() - t0:.1f}s "
+                  f"({len(app.matcher)} samples)")
+            for size in args.frame_sizes:
+                for faces in args.faces:
+                    name = f"{size}-{faces}face-{population}ids"
+                    # Same kiosk session state each time: a fresh tracker and cooldowns
+                    app.cooldowns = type(app.cooldowns)(app.COOLDOWN_SECONDS)
+                    metrics = driver.reset_metrics()
+                    out = driver.run_frames(streams[(size, faces)], kiosk=name, via=args.via)
+                    counters = dict(metrics.counters)
+                    predicted = counters.get('recognitions', 0) + counters.get('unknowns', 0)
+                    results["frames"].append(dict(
+                        out, name=name, frame_size=FRAME_SIZES[size], faces=faces, population=population,
+                        recognized=counters.get('recognitions', 0) / predicted if predicted else None,
+                        counters=counters,
+                        stages={stage: hist.summary() for stage, hist in sorted(metrics.stages.items())}))
+                    lat = out["latency"]
+                    print(f"  {name:<24} {out['fps']:7.1f} fps  p50 {lat['p50_ms']:7.2f} ms  "
+                          f"p99 {lat['p99_ms']:7.2f} ms")
+
+        # Registration/training cost on top of the largest gallery
+        metrics = driver.reset_metrics()
+        first = driver.enrolled + 1
+        timings = driver.enroll(range(first, first + args.registrations), samples=40, batch=1,
+                                captured=range(first, first + args.registrations))
+        results["training"] = dict(percentiles(timings), registrations=args.registrations, faces_each=40,
+                                   population=driver.enrolled - args.registrations,
+                                   stages={stage: hist.summary() for stage, hist in sorted(metrics.stages.items())})
+        print(f"training: {results['training']['p50_ms']:.1f} ms per registration (p50)")
+    finally:
+        driver.close()
+    return results
+
+def compare(old_path, new_path, threshold):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    before = {s["name"]: s for s in old["frames"]}
+    print(f"{old['meta'].get('commit')} -> {new['meta'].get('commit')}  (flagging > {threshold:.0%} slower)")
+    print(f"{'scenario':<24} {'p50 ms':>16} {'p99 ms':>16} {'fps':>14}")
+    regressions = 0
+    rows = [(s["name"], before.get(s["name"]), s) for s in new["frames"]]
+    if old.get("training") and new.get("training"):
+        rows.append(("training", {"latency": old["training"], "fps": None},
+                     {"latency": new["training"], "fps": None}))
+    for name, a, b in rows:
+        if a is None:
+            print(f"{name:<24} (new)")
+            continue
+        la, lb = a["latency"], b["latency"]
+        slower = lb["p50_ms"] > la["p50_ms"] * (1 + threshold)
+        regressions += slower
+        fps = f"{a['fps']:6.1f}>{b['fps']:6.1f}" if b.get("fps") else ""
+        print(f"{name:<24} {la['p50_ms']:7.2f}>{lb['p50_ms']:7.2f} {la['p99_ms']:7.2f}>{lb['p99_ms']:7.2f} "
+              f"{fps:>14}{'  SLOWER' if slower else ''}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--frame-sizes', nargs='+', default=['qvga', 'vga', 'hd'], choices=list(FRAME_SIZES))
+    parser.add_argument('--faces', type=int, nargs='+', default=[1, 3], help="faces per frame")
+    parser.add_argument('--population', type=int, nargs='+', default=[10, 100, 1000], help="enrolled identities")
+    parser.add_argument('--samples', type=int, default=5, help="faces per enrolled identity")
+    parser.add_argument('--frames', type=int, default=60, help="frames per scenario")
+    parser.add_argument('--registrations', type=int, default=5, help="timed 40-face registrations")
+    parser.add_argument('--detect-every', type=int, default=5)
+    parser.add_argument('--via', choices=['direct', 'flask'], default='direct',
+                        help="call analyze_frame directly or post through Flask's test client")
+    parser.add_argument('--out', help="write results JSON here")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="compare two result files")
+    parser.add_argument('--threshold', type=float, default=0.10, help="p50 slowdown flagged by --compare")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+    out = os.path.abspath(args.out) if args.out else None  # the driver changes directory
+    results = run(args)
+    if out:
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        with open(out, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(f"results written to {out}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Synthetic faces and frame streams for offline benchmarks.
+
+Faces are drawn procedurally (skin ellipse, eyes, brows, nose, mouth) so
+that the stock Haar cascade detects them and LBPH can tell identities
+apart; no camera, network or real photos are needed. Everything is
+seeded, so runs are reproducible between commits.
+"""
+import cv2
+import numpy as np
+
+from preprocess import FramePreprocessor
+
+def draw_face(identity, size=200, variation=0):
+    """Grayscale face for `identity`. `variation` adds per-sample jitter
+    (lighting, small shifts) the way repeated captures of one person differ."""
+    shape = np.random.default_rng(identity)
+    jitter = np.random.default_rng((identity, variation))
+    img = np.full((size, size), 40, np.uint8)
+    c = size // 2
+    skin = int(150 + shape.integers(0, 45))
+    cv2.ellipse(img, (c, c), (int(size * shape.uniform(0.33, 0.38)), int(size * 0.46)), 0, 0, 360, skin, -1)
+
+    eye_y = int(size * shape.uniform(0.37, 0.43))
+    eye_dx = int(size * shape.uniform(0.14, 0.18))
+    eye_w = int(size * shape.uniform(0.06, 0.09))
+    brow_tilt = int(size * shape.uniform(-0.03, 0.03))
+    for s in (-1, 1):
+        ex = c + s * eye_dx
+        cv2.ellipse(img, (ex, eye_y), (eye_w, int(size * 0.04)), 0, 0, 360, 50, -1)
+        by = eye_y - int(size * 0.09)
+        cv2.line(img, (ex - int(size * .1), by + s * brow_tilt), (ex + int(size * .1), by - s * brow_tilt),
+                 60, max(2, size // int(shape.integers(30, 50))))
+
+    nose_len = shape.uniform(0.56, 0.64)
+    cv2.line(img, (c, eye_y + size // 20), (c, int(size * nose_len)), 120, 3)
+    mouth_y = int(size * shape.uniform(0.70, 0.75))
+    cv2.ellipse(img, (c, mouth_y), (int(size * shape.uniform(0.10, 0.17)), int(size * 0.04)),
+                0, 0, 360, 70, -1)
+
+    # Fixed per-identity texture plus per-sample noise and lighting
+    texture = cv2.GaussianBlur(shape.normal(0, 12, (size, size)), (0, 0), 2)
+    noise = jitter.normal(0, 1.5, (size, size)) if variation else 0
+    gain = jitter.uniform(0.9, 1.1) if variation else 1.0
+    out = np.clip(img * gain + texture + noise, 0, 255).astype(np.uint8)
+    if variation:
+        shift = jitter.integers(-3, 4, 2)
+        out = cv2.warpAffine(out, np.float32([[1, 0, shift[0]], [0, 1, shift[1]]]), (size, size),
+                             borderMode=cv2.BORDER_REPLICATE)
+    return out
+
+_cascade = None
+
+def cascade():
+    global _cascade
+    if _cascade is None:
+        _cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    return _cascade
+
+def background(frame_size=(640, 480), seed=0):
+    width, height = frame_size
+    rng = np.random.default_rng(seed)
+    return np.clip(rng.normal(90, 8, (height, width)), 0, 255).astype(np.uint8)
+
+def registration_sample(identity, variation, frame_size=(640, 480), face_size=(100, 100), px_range=(140, 190)):
+    """One enrollment sample captured the way /process_frame does it: the face
+    is placed in a frame (`px_range` pixels wide), detected with the Haar
+    cascade, then cropped, resized and CLAHE-normalized by FramePreprocessor.
+    Returns None if the cascade misses it."""
+    rng = np.random.default_rng((identity, variation, 7))
+    width, height = frame_size
+    px = int(rng.integers(*px_range))
+    canvas = background(frame_size)
+    x, y = int(rng.integers(0, width - px)), (height - px) // 2
+    canvas[y:y + px, x:x + px] = cv2.resize(draw_face(identity, variation=variation), (px, px))
+    found = cascade().detectMultiScale(canvas, 1.1, 5, minSize=(60, 60))
+    if len(found) == 0:
+        return None
+    pre = FramePreprocessor(scale=1.0, face_size=face_size)
+    pre.prepare(canvas)
+    return pre.face(found[0])
+
+def gallery(identities, samples_per_identity, face_size=(100, 100), detect=True):
+    """Training faces (already FACE_SIZE) and integer labels starting at 1.
+    detect=False skips the cascade and just resizes the drawn face, which is
+    much faster for very large galleries."""
+    faces, labels = [], []
+    for ident in range(1, identities + 1):
+        for v in range(1, samples_per_identity + 1):
+            if detect:
+                face = registration_sample(ident, v, face_size=face_size)
+                if face is None: continue
+            else:
+                face = cv2.resize(draw_face(ident, size=120, variation=v), face_size)
+            faces.append(face)
+            labels.append(ident)
+    return faces, np.array(labels, dtype=np.int32)
+
+def frame_stream(n_frames, identities=(1,), frame_size=(640, 480), face_px=150, speed=2, seed=0):
+    """Yields (bgr_frame, [(identity, (x, y, w, h)), ...]) with faces drifting
+    slowly across the frame like people standing at a kiosk."""
+    width, height = frame_size
+    base = background(frame_size, seed)
+    slots = max(1, len(identities))
+    faces = {ident: cv2.resize(draw_face(ident), (face_px, face_px)) for ident in identities}
+    for i in range(n_frames):
+        canvas = base.copy()
+        truth = []
+        for k, ident in enumerate(identities):
+            span = max(1, width // slots - face_px)
+            x = k * (width // slots) + (i * speed) % span
+            y = min(height - face_px, max(0, (height - face_px) // 2 + int(10 * np.sin(i / 15.0 + k))))
+            canvas[y:y + face_px, x:x + face_px] = faces[ident]
+            truth.append((ident, (x, y, face_px, face_px)))
+        yield cv2.cvtColor(canvas, cv2.COLOR_GRAY2BGR), truth
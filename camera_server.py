@@ -0,0 +1,98 @@
+"""
+Local stand-in for network cameras, for trying multi_camera.py without them.
+
+Serves each source as an MJPEG-over-HTTP stream (what most IP cameras
+offer next to RTSP, and what OpenCV's FFmpeg backend opens from a URL)
+at /cam/<n>, paced at the source's frame rate. Sources are video files
+(looped) or "synthetic:<people>" for generated faces from
+benchmarks/synthetic.py, so no footage is needed either.
+
+Usage:
+    python camera_server.py lobby.mp4 synthetic:2 --port 8090
+    python multi_camera.py http://localhost:8090/cam/0 http://localhost:8090/cam/1
+"""
+import argparse
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+BOUNDARY = "frame"
+
+def synthetic_frames(people, fps):
+    from benchmarks import synthetic
+    identities = tuple(range(1, people + 1))
+    while True:
+        for frame, _ in synthetic.frame_stream(int(fps * 60), identities=identities, face_px=140):
+            yield frame
+
+def file_frames(path):
+    cap = cv2.VideoCapture(path)
+    while cap.isOpened():
+        ok, frame = cap.read()
+        if not ok:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = cap.read()
+            if not ok:
+                break
+        yield frame
+    cap.release()
+
+def source_fps(source, default):
+    if source.startswith("synthetic:"):
+        return default
+    fps = cv2.VideoCapture(source).get(cv2.CAP_PROP_FPS)
+    return fps if fps and fps < 240 else default
+
+def make_handler(sources, fps, quality):
+    class CameraHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            match = re.fullmatch(r"/cam/(\d+)", self.path)
+            if not match or int(match.group(1)) >= len(sources):
+                self.send_error(404, f"cameras: /cam/0 .. /cam/{len(sources) - 1}")
+                return
+            source = sources[int(match.group(1))]
+            rate = source_fps(source, fps)
+            frames = (synthetic_frames(int(source.split(":", 1)[1] or 1), rate)
+                      if source.startswith("synthetic:") else file_frames(source))
+            self.send_response(200)
+            self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            due = time.perf_counter()
+            try:
+                for frame in frames:
+                    jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+                    self.wfile.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                     f"Content-Length: {len(jpeg)}\r\n\r\n".encode() + jpeg + b"\r\n")
+                    due += 1.0 / rate
+                    time.sleep(max(0.0, due - time.perf_counter()))
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # client went away
+
+        def log_message(self, fmt, *args):
+            print(f"[camera_server] {self.address_string()} {fmt % args}")
+
+    return CameraHandler
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('sources', nargs='+', help="video file or synthetic:<people>")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--fps', type=float, default=15.0, help="rate for synthetic sources and files without one")
+    parser.add_argument('--quality', type=int, default=80, help="JPEG quality")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.sources, args.fps, args.quality))
+    server.daemon_threads = True
+    for i, source in enumerate(args.sources):
+        print(f"http://{args.host}:{args.port}/cam/{i}  <- {source}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+"""
+Pooled database connections for app.py.
+
+DATABASE_URL is parsed once into a DBConfig (PostgreSQL, MySQL, or
+SQLite for local testing), and connections are reused from a fixed-size
+ConnectionPool instead of being opened per query:
+
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT ... VALUES (%s, %s)", (a, b))
+        conn.commit()
+
+A connection that sat idle longer than `health_check_after` is pinged on
+checkout and replaced if the server dropped it; connections older than
+`recycle_after` are closed and reopened. Leaving the block returns the
+connection (rolling back anything uncommitted, or discarding it if the
+backend raised a connection error). PooledConnection.close() also just
+returns it, so the older `conn = get_db_connection() ... conn.close()`
+call sites keep working.
+
+SQLite takes the same '%s' placeholders as the other two backends; they
+are rewritten to '?' by the cursor wrapper. It needs a file path: an
+in-memory database would be a separate, empty one per pooled connection.
+"""
+import contextlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+DEFAULT_POOL_SIZE = 5
+DEFAULT_TIMEOUT = 10.0          # seconds to wait for a free connection
+DEFAULT_HEALTH_CHECK_AFTER = 30.0
+DEFAULT_RECYCLE_AFTER = 1800.0
+
+class PoolTimeout(Exception):
+    pass
+
+class DBConfig:
+    """Backend name plus a connect() for one DATABASE_URL (or DB_* env vars)."""
+
+    def __init__(self, url=None, db_name=None):
+        url = url if url is not None else os.environ.get('DATABASE_URL')
+        self.url = url
+        if url and url.startswith(("postgres://", "postgresql://")):
+            self.backend = 'postgres'
+            # Render's deprecated "postgres://" scheme
+            self.dsn = url.replace("postgres://", "postgresql://", 1) if url.startswith("postgres://") else url
+        elif url and url.startswith("sqlite://"):
+            self.backend = 'sqlite'
+            self.path = url[len("sqlite:///"):]
+            if self.path in ("", ":memory:"):
+                # Every pooled connection would open its own empty database
+                raise ValueError(f"DATABASE_URL {url!r} needs a file path, e.g. sqlite:///face.db")
+        else:
+            self.backend = 'mysql'
+            if url:
+                result = urlparse(url)
+                db_from_url = result.path[1:] if result.path else ""
+                self.params = {
+                    'host': result.hostname,
+                    'user': result.username,
+                    'password': result.password,
+                    'database': db_name or db_from_url or 'face',
+                    'port': result.port or 3306,
+                }
+            else:
+                self.params = {
+                    'host': os.environ.get('DB_HOST', 'localhost'),
+                    'user': os.environ.get('DB_USER', 'root'),
+                    'password': os.environ.get('DB_PASSWORD', ''),
+                    'database': db_name or os.environ.get('DB_NAME', 'face'),
+                    'port': int(os.environ.get('DB_PORT', 3306)),
+                }
+        self._driver = None
+
+    def driver(self):
+        """The backend module, imported once (None if it is not installed)."""
+        if self._driver is None:
+            try:
+                if self.backend == 'postgres':
+                    import psycopg2
+                    self._driver = psycopg2
+                elif self.backend == 'mysql':
+                    import mysql.connector
+                    self._driver = mysql.connector
+                else:
+                    self._driver = sqlite3
+            except ImportError:
+                return None
+        return self._driver
+
+    def connect(self):
+        driver = self.driver()
+        if driver is None:
+            raise RuntimeError(f"driver for {self.backend} is not installed")
+        if self.backend == 'postgres':
+            return driver.connect(self.dsn)
+        if self.backend == 'mysql':
+            return driver.connect(**self.params)
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=DEFAULT_TIMEOUT)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def ping(self, raw):
+        """Raises if the server side of `raw` is gone."""
+        if self.backend == 'mysql':
+            raw.ping(reconnect=False)
+        else:
+            cursor = raw.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+
+    def integrity_errors(self):
+        """Exception types for constraint violations (e.g. duplicate emp_id)."""
+        driver = self.driver()
+        if self.backend == 'postgres':
+            return (driver.IntegrityError,)
+        if self.backend == 'mysql':
+            return (driver.errors.IntegrityError,)
+        return (sqlite3.IntegrityError,)
+
+    def connection_errors(self):
+        """Exception types meaning the connection itself is broken."""
+        driver = self.driver()
+        if driver is None:
+            return ()
+        if self.backend == 'postgres':
+            return (driver.OperationalError, driver.InterfaceError)
+        if self.backend == 'mysql':
+            return (driver.errors.OperationalError, driver.errors.InterfaceError)
+        return (sqlite3.OperationalError,)
+
+_PLACEHOLDER = re.compile(r"%s")
+
+class SQLiteCursor:
+    """Accepts the '%s' paramstyle used by app.py's MySQL/Postgres queries."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        return self._cursor.execute(_PLACEHOLDER.sub("?", sql), params)
+
+    def executemany(self, sql, seq):
+        return self._cursor.executemany(_PLACEHOLDER.sub("?", sql), seq)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+class PooledConnection:
+    """A checked-out connection; close() returns it to the pool."""
+
+    def __init__(self, pool, raw, created):
+        self._pool = pool
+        self.raw = raw
+        self.created = created
+        self.last_used = time.monotonic()
+        self.checked_out_at = None
+        self.broken = False
+
+    def cursor(self, *args, **kwargs):
+        cursor = self.raw.cursor(*args, **kwargs)
+        return SQLiteCursor(cursor) if self._pool.config.backend == 'sqlite' else cursor
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self._pool.release(self)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+class ConnectionPool:
+    def __init__(self, config, size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT,
+                 health_check_after=DEFAULT_HEALTH_CHECK_AFTER, recycle_after=DEFAULT_RECYCLE_AFTER):
+        self.config = config
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+        self.recycle_after = recycle_after
+        self._idle = []       # LIFO: the most recently used connection is the least likely stale
+        self._total = 0       # idle + checked out + being opened
+        self._cond = threading.Condition()
+        self.stats = {"checkouts": 0, "waits": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0,
+                      "timeouts": 0, "connects": 0, "connect_errors": 0, "reconnects": 0,
+                      "discarded": 0, "in_use_peak": 0, "hold_ms_total": 0.0}
+
+    @property
+    def backend(self):
+        return self.config.backend
+
+    def acquire(self, timeout=None):
+        """Checks out a healthy connection, waiting up to `timeout` for one."""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+        with self._cond:
+            while not self._idle and self._total >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats["timeouts"] += 1
+                    raise PoolTimeout(f"no database connection free within {timeout:.1f}s")
+                waited = True
+                self._cond.wait(remaining)
+            conn = self._idle.pop() if self._idle else None
+            self._total += conn is None
+        try:
+            conn = self._checkout_ready(conn)
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+        wait_ms = (time.monotonic() - start) * 1000
+        with self._cond:
+            self.stats["checkouts"] += 1
+            self.stats["waits"] += waited
+            self.stats["wait_ms_total"] += wait_ms
+            self.stats["wait_ms_max"] = max(self.stats["wait_ms_max"], wait_ms)
+            self.stats["in_use_peak"] = max(self.stats["in_use_peak"], self._total - len(self._idle))
+        conn.checked_out_at = time.monotonic()
+        return conn
+
+    def _checkout_ready(self, conn):
+        now = time.monotonic()
+        if conn is not None and now - conn.created > self.recycle_after:
+            self._close_raw(conn)
+            conn = None
+        if conn is not None and now - conn.last_used > self.health_check_after:
+            try:
+                self.config.ping(conn.raw)
+            except Exception:
+                self._close_raw(conn)
+                self._count("reconnects")
+                conn = None
+        if conn is None:
+            try:
+                conn = PooledConnection(self, self.config.connect(), time.monotonic())
+                self._count("connects")
+            except Exception:
+                self._count("connect_errors")
+                raise
+        return conn
+
+    def _count(self, key):
+        # Connecting and pinging happen outside the lock; the counters don't
+        with self._cond:
+            self.stats[key] += 1
+
+    def release(self, conn):
+        if conn.checked_out_at is None:
+            return  # already returned
+        held_ms = (time.monotonic() - conn.checked_out_at) * 1000
+        conn.checked_out_at = None
+        conn.last_used = time.monotonic()
+        keep = not conn.broken
+        if keep:
+            try:
+                conn.raw.rollback()  # never hand over an open transaction
+            except Exception:
+                keep = False
+        if not keep:
+            self._close_raw(conn)
+        with self._cond:
+            self.stats["hold_ms_total"] += held_ms
+            if keep:
+                self._idle.append(conn)
+            else:
+                self._total -= 1
+            self._cond.notify()
+
+    def _close_raw(self, conn):
+        self._count("discarded")
+        try:
+            conn.raw.close()
+        except Exception:
+            pass
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        """`with pool.connection() as conn:`; rolls back on error and drops
+        the connection if the error says it is broken."""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except self.config.connection_errors():
+            conn.broken = True
+            raise
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+        for conn in idle:
+            self._close_raw(conn)
+
+    def metrics(self):
+        with self._cond:
+            stats = dict(self.stats)
+            stats.update(size=self.size, open=self._total, idle=len(self._idle),
+                         in_use=self._total - len(self._idle), backend=self.backend)
+        checkouts = max(1, stats["checkouts"])
+        stats["wait_ms_avg"] = stats["wait_ms_total"] / checkouts
+        stats["hold_ms_avg"] = stats["hold_ms_total"] / checkouts
+        return stats
@@ -0,0 +1,104 @@
+"""
+In-process fan-out of kiosk events for the /events server-sent stream.
+
+Publishers (frame handling, the training worker, attendance logging) call
+EventHub.publish(topic, kind, data) and never block: each subscriber
+keeps only the newest pending event per (topic, kind), so a slow or
+stalled browser costs one slot per kind instead of a growing queue, and
+it still ends up with the latest registration/recognition state. Topics
+are kiosk IDs plus shared ones such as "attendance".
+
+Subscriptions live in the worker process that serves the stream, so
+events published in another gunicorn worker are not seen; pages fall
+back to polling when the stream is unavailable.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+class TooManySubscribers(Exception):
+    pass
+
+class Subscription:
+    def __init__(self, hub, topics):
+        self.hub = hub
+        self.topics = tuple(topics)
+        self._pending = OrderedDict()  # (topic, kind) -> data, oldest first
+        self._cond = threading.Condition()
+        self.closed = False
+        self.coalesced = 0  # events replaced by a newer one before delivery
+
+    def offer(self, topic, kind, data):
+        key = (topic, kind)
+        with self._cond:
+            if key in self._pending:
+                del self._pending[key]
+                self.coalesced += 1
+            self._pending[key] = data
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Waits up to `timeout` and returns every pending (kind, data) pair
+        ([] on timeout or once closed)."""
+        with self._cond:
+            if not self._pending and not self.closed:
+                self._cond.wait(timeout)
+            events = [(kind, data) for (_, kind), data in self._pending.items()]
+            self._pending.clear()
+            return events
+
+    def close(self):
+        self.hub.unsubscribe(self)
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+class EventHub:
+    def __init__(self, max_subscribers=256):
+        self.max_subscribers = max_subscribers
+        self._topics = {}  # topic -> set of Subscription
+        self._count = 0
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, topics):
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise TooManySubscribers(f"{self._count} event streams already open")
+            sub = Subscription(self, topics)
+            for topic in sub.topics:
+                self._topics.setdefault(topic, set()).add(sub)
+            self._count += 1
+            return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            removed = False
+            for topic in sub.topics:
+                subs = self._topics.get(topic)
+                if subs and sub in subs:
+                    subs.discard(sub)
+                    removed = True
+                    if not subs:
+                        del self._topics[topic]
+            self._count -= removed
+
+    def publish(self, topic, kind, data):
+        """Hands `data` to every subscriber of `topic`; returns how many."""
+        with self._lock:
+            subs = list(self._topics.get(topic, ()))
+            self.published += 1
+            self.delivered += len(subs)
+        for sub in subs:
+            sub.offer(topic, kind, data)
+        return len(subs)
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": self._count, "topics": len(self._topics),
+                    "published": self.published, "delivered": self.delivered}
+
+def format_sse(kind, data):
+    """One text/event-stream message."""
+    return f"event: {kind}\ndata: {json.dumps(data)}\n\n"
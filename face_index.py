@@ -0,0 +1,214 @@
+"""
+Approximate nearest-neighbour candidate indexes for LBPHMatcher.
+
+With tens of thousands of enrolled people, scoring every stored histogram
+for every face dominates recognition time. An index prunes the gallery to
+a short candidate list first; LBPHMatcher then runs the exact chi-square
+distance on the candidates only, so returned distances keep their meaning.
+
+IVFIndex is an inverted-file index. Histograms are embedded as PCA
+projections of their square roots (Hellinger space, where L2 distance
+tracks chi-square closely) and clustered with k-means into `n_lists`
+cells; a query probes the `nprobe` nearest cells. The matcher shortlists
+the `rerank` most promising columns of those cells from the query's
+heaviest bins and scores only them exactly. New enrollments are
+assigned to their nearest cell incrementally, and the index re-fits
+itself once the gallery has grown `retrain_growth` times since the last
+training. Below `min_train` columns the index stays untrained and the
+matcher scans everything, which is cheap at that size anyway. Indexes
+persist to a single .npz file.
+
+ExactIndex is the no-pruning baseline with the same interface.
+"""
+import copy
+import os
+
+import cv2
+import numpy as np
+
+NPROBE = 128      # cells probed per query
+RERANK = 32       # shortlisted candidates scored exactly
+MIN_TRAIN = 2000  # gallery columns before the index is used at all
+
+class ExactIndex:
+    """Every gallery column is a candidate (plain linear scan)."""
+    kind = 'exact'
+    ready = False
+    rerank = 0
+
+    def add(self, hists, first_col, gallery_t):
+        pass
+
+    def rebuild(self, gallery_t):
+        pass
+
+    def __len__(self):
+        return 0
+
+    def candidates(self, query, nprobe=None):
+        return None
+
+    def save(self, path):
+        pass
+
+class IVFIndex:
+    kind = 'ivf'
+
+    def __init__(self, dim, n_lists=None, nprobe=NPROBE, rerank=RERANK, proj_dim=64, min_train=MIN_TRAIN,
+                 retrain_growth=4.0, pca_sample=2048, seed=0):
+        self.dim = dim
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.rerank = rerank
+        self.proj_dim = proj_dim
+        self.min_train = min_train
+        self.retrain_growth = retrain_growth
+        self.pca_sample = pca_sample
+        self.seed = seed
+        self.mean = None
+        self.projection = None
+        self.centroids = None
+        self.assign = np.empty(0, np.int32)   # cell of every gallery column
+        self.vectors = np.empty((0, proj_dim), np.float32)
+        self.trained_size = 0
+        self._lists = None
+
+    @property
+    def ready(self):
+        return self.centroids is not None
+
+    def __len__(self):
+        return len(self.assign)
+
+    # --- Building ---
+
+    def embed(self, hists):
+        """Hellinger embedding: PCA projection of sqrt(histogram)."""
+        hists = np.asarray(hists, np.float32).reshape(-1, self.dim)
+        return (np.sqrt(hists) - self.mean) @ self.projection
+
+    def add(self, hists, first_col, gallery_t):
+        """Indexes new gallery columns first_col.. ; `gallery_t` is the full
+        bin-major gallery (dim, n) including them, used when (re)training."""
+        total = first_col + len(hists)
+        if self.ready and total < self.retrain_growth * self.trained_size:
+            if first_col != len(self.assign):
+                raise ValueError(f"index holds {len(self.assign)} columns, cannot add at {first_col}")
+            vectors = self.embed(hists)
+            self.vectors = np.vstack([self.vectors, vectors])
+            self.assign = np.concatenate([self.assign, self._nearest_cells(vectors, 1)[:, 0]])
+            self._lists = None
+        elif total >= self.min_train:
+            self.train(gallery_t[:, :total])
+
+    def extended(self, hists, first_col):
+        """A copy that also holds new gallery columns first_col.. , leaving
+        this index (possibly in use by other threads) unchanged. None when
+        the index is untrained or due for retraining."""
+        total = first_col + len(hists)
+        if not self.ready or first_col != len(self.assign) or total >= self.retrain_growth * self.trained_size:
+            return None
+        vectors = self.embed(hists)
+        other = copy.copy(self)
+        other.vectors = np.vstack([self.vectors, vectors])
+        other.assign = np.concatenate([self.assign, self._nearest_cells(vectors, 1)[:, 0]])
+        other._lists = None
+        return other
+
+    def rebuild(self, gallery_t):
+        """Discards the index and retrains it on a bin-major (dim, n) gallery."""
+        self.centroids = None
+        self.assign = np.empty(0, np.int32)
+        self.vectors = np.empty((0, self.proj_dim), np.float32)
+        if gallery_t.shape[1] >= self.min_train:
+            self.train(gallery_t)
+
+    def train(self, gallery_t, chunk=4096):
+        """Fits PCA and k-means on the bin-major gallery and assigns every column."""
+        n = gallery_t.shape[1]
+        rng = np.random.default_rng(self.seed)
+        sample = np.sort(rng.choice(n, min(n, self.pca_sample), replace=False))
+        roots = np.sqrt(np.asarray(gallery_t[:, sample], np.float32).T)
+        self.mean = roots.mean(axis=0)
+        centered = roots - self.mean
+        # PCA through the small Gram matrix (sample x sample)
+        eigvals, eigvecs = np.linalg.eigh(centered @ centered.T)
+        top = np.argsort(eigvals)[::-1][:min(self.proj_dim, len(sample))]
+        top = top[eigvals[top] > 1e-12]
+        proj = np.zeros((self.dim, self.proj_dim), np.float32)
+        proj[:, :len(top)] = (centered.T @ eigvecs[:, top]) / np.sqrt(eigvals[top])
+        self.projection = proj
+
+        self.vectors = np.vstack([self.embed(np.asarray(gallery_t[:, s:s + chunk]).T)
+                                  for s in range(0, n, chunk)]).astype(np.float32)
+        k = self.n_lists or int(np.clip(4 * np.sqrt(n), 8, 4096))
+        k = min(k, n)
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 1e-3)
+        cv2.setRNGSeed(self.seed)
+        _, labels, centers = cv2.kmeans(self.vectors, k, None, criteria, 1, cv2.KMEANS_PP_CENTERS)
+        self.centroids = centers.astype(np.float32)
+        self.assign = labels.ravel().astype(np.int32)
+        self.trained_size = n
+        self._lists = None
+
+    # --- Searching ---
+
+    def _nearest_cells(self, vectors, count):
+        c = self.centroids
+        d = (c * c).sum(axis=1)[None, :] - 2.0 * (vectors @ c.T)  # + |v|^2, constant per row
+        count = min(count, len(self.centroids))
+        return np.argpartition(d, count - 1, axis=1)[:, :count].astype(np.int32)
+
+    def _inverted_lists(self):
+        if self._lists is None:
+            order = np.argsort(self.assign, kind='stable').astype(np.int64)
+            bounds = np.searchsorted(self.assign[order], np.arange(len(self.centroids) + 1))
+            self._lists = (order, bounds)
+        return self._lists
+
+    def candidates(self, query, nprobe=None):
+        """Sorted gallery columns in the nprobe cells nearest to `query`,
+        or None when the index is not trained yet (scan everything)."""
+        if not self.ready:
+            return None
+        cells = self._nearest_cells(self.embed(query), nprobe or self.nprobe)[0]
+        order, bounds = self._inverted_lists()
+        cols = np.concatenate([order[bounds[c]:bounds[c + 1]] for c in cells])
+        cols.sort()
+        return cols
+
+    # --- Persistence ---
+
+    def save(self, path):
+        if not self.ready: return
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, mean=self.mean, projection=self.projection, centroids=self.centroids,
+                 vectors=self.vectors, assign=self.assign,
+                 params=np.array([self.dim, self.n_lists or 0, self.nprobe, self.proj_dim,
+                                  self.min_train, self.trained_size, self.pca_sample, self.seed,
+                                  self.rerank], np.int64),
+                 retrain_growth=np.float64(self.retrain_growth))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            params = [int(v) for v in data['params']]
+            dim, n_lists, nprobe, proj_dim, min_train, trained_size, pca_sample, seed = params[:8]
+            rerank = params[8] if len(params) > 8 else RERANK  # files from before re-ranking
+            index = cls(dim, n_lists=n_lists or None, nprobe=nprobe, rerank=rerank, proj_dim=proj_dim,
+                        min_train=min_train, retrain_growth=float(data['retrain_growth']),
+                        pca_sample=pca_sample, seed=seed)
+            index.mean = data['mean']
+            index.projection = data['projection']
+            index.centroids = data['centroids']
+            index.vectors = data['vectors']
+            index.assign = data['assign']
+            index.trained_size = trained_size
+        return index
+
+def create_index(kind, dim, **kwargs):
+    """'ivf' -> IVFIndex, anything else -> ExactIndex."""
+    if kind == 'ivf':
+        return IVFIndex(dim, **kwargs)
+    return ExactIndex()
@@ -0,0 +1,152 @@
+"""
+Lightweight face tracking between frames.
+
+A person usually stands in front of a kiosk for dozens of consecutive
+frames, so running the Haar cascade and LBPH prediction on every frame is
+mostly repeated work. FaceTracker runs full detection only every
+`detect_every` frames (or sooner when tracking gets unsure). In between,
+each face box is carried forward by template matching its last patch in a
+small search window around the previous position. Detections are matched
+to existing tracks by IoU, and the recognized identity is cached per
+track between detection passes. Each full detection pass re-predicts
+recognized tracks too, so when one person steps out and another steps
+into the same spot the track does not keep the first identity; the
+caller clears or replaces it (set_identity) when the new prediction
+misses the threshold or names someone else.
+
+All coordinates are in the image passed to update() (the downscaled
+detection image in app.py).
+"""
+import itertools
+
+import cv2
+
+DETECT_EVERY = 5          # full cascade pass every N frames
+MIN_TRACK_SCORE = 0.6     # TM_CCOEFF_NORMED below this forces a re-detect
+IOU_MATCH = 0.3           # detection <-> track association threshold
+MAX_MISSES = 1            # detection passes a track may go unmatched
+RETRY_UNKNOWN_EVERY = 5   # frames between re-predicting an unrecognized track
+SEARCH_MARGIN = 0.25      # search window padding, as a fraction of box size
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+class Track:
+    """One face followed across frames, with its cached identity."""
+
+    def __init__(self, track_id, box, template):
+        self.track_id = track_id
+        self.box = box
+        self.template = template
+        self.score = 1.0
+        self.misses = 0
+        self.age = 0
+        self.label = None         # recognizer label, None until recognized
+        self.distance = 999
+        self.last_predicted = None
+
+    @property
+    def recognized(self):
+        return self.label is not None
+
+    def set_identity(self, label, distance, frame_index):
+        self.label = label
+        self.distance = distance
+        self.last_predicted = frame_index
+
+class FaceTracker:
+    def __init__(self, detect_every=DETECT_EVERY, min_track_score=MIN_TRACK_SCORE,
+                 iou_match=IOU_MATCH, max_misses=MAX_MISSES, retry_unknown_every=RETRY_UNKNOWN_EVERY):
+        self.detect_every = max(1, detect_every)
+        self.min_track_score = min_track_score
+        self.iou_match = iou_match
+        self.max_misses = max_misses
+        self.retry_unknown_every = retry_unknown_every
+        self.tracks = []
+        self.frame_index = 0
+        self.last_detect = None
+        self.detections = 0
+        self._ids = itertools.count(1)
+
+    def update(self, gray, detect):
+        """Advances all tracks to `gray` and returns the visible ones.
+        `detect(gray)` must return (x, y, w, h) boxes; it is only called when
+        a full detection pass is due."""
+        self.frame_index += 1
+        due = self.last_detect is None or self.frame_index - self.last_detect >= self.detect_every
+        if not due:
+            for track in self.tracks:
+                if track.misses: continue
+                self._follow(track, gray)
+                if track.score < self.min_track_score:
+                    due = True
+        if due:
+            self._associate(gray, [tuple(int(v) for v in box) for box in detect(gray)])
+            self.last_detect = self.frame_index
+            self.detections += 1
+        for track in self.tracks:
+            track.age += 1
+        return [t for t in self.tracks if t.misses == 0]
+
+    def needs_recognition(self, track):
+        """True for new tracks, for recognized ones on every full detection
+        pass, and periodically for ones still unrecognized."""
+        if track.last_predicted is None:
+            return True
+        if track.recognized:
+            return self.last_detect == self.frame_index and track.last_predicted < self.frame_index
+        return self.frame_index - track.last_predicted >= self.retry_unknown_every
+
+    def reset(self):
+        self.tracks = []
+        self.last_detect = None
+
+    def _follow(self, track, gray):
+        x, y, w, h = track.box
+        mx, my = int(w * SEARCH_MARGIN), int(h * SEARCH_MARGIN)
+        x0, y0 = max(0, x - mx), max(0, y - my)
+        x1, y1 = min(gray.shape[1], x + w + mx), min(gray.shape[0], y + h + my)
+        window = gray[y0:y1, x0:x1]
+        if window.shape[0] < h or window.shape[1] < w:
+            track.score = 0.0
+            return
+        result = cv2.matchTemplate(window, track.template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (dx, dy) = cv2.minMaxLoc(result)
+        track.score = score
+        if score >= self.min_track_score:
+            track.box = (x0 + dx, y0 + dy, w, h)
+
+    def _associate(self, gray, boxes):
+        pairs = sorted(((iou(t.box, b), ti, bi) for ti, t in enumerate(self.tracks)
+                        for bi, b in enumerate(boxes)), reverse=True)
+        used_tracks, used_boxes = set(), set()
+        for overlap, ti, bi in pairs:
+            if overlap < self.iou_match: break
+            if ti in used_tracks or bi in used_boxes: continue
+            used_tracks.add(ti)
+            used_boxes.add(bi)
+            track = self.tracks[ti]
+            track.box, track.misses, track.score = boxes[bi], 0, 1.0
+            track.template = self._patch(gray, track.box)
+
+        survivors = []
+        for ti, track in enumerate(self.tracks):
+            if ti not in used_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses: continue
+            survivors.append(track)
+        for bi, box in enumerate(boxes):
+            if bi not in used_boxes:
+                survivors.append(Track(next(self._ids), box, self._patch(gray, box)))
+        self.tracks = survivors
+
+    @staticmethod
+    def _patch(gray, box):
+        x, y, w, h = box
+        return gray[y:y + h, x:x + w].copy()
@@ -0,0 +1,94 @@
+"""
+Per-kiosk pipeline state.
+
+Each browser kiosk (or camera) gets its own mode, registration buffers and
+latest-recognition slot, keyed by a client-supplied kiosk ID, so several
+kiosks served by one process never trample each other's registrations.
+"""
+import threading
+import time
+
+DEFAULT_KIOSK_ID = "default"
+IDLE_TIMEOUT_SECONDS = 15 * 60
+EVICT_INTERVAL_SECONDS = 60
+MAX_KIOSK_ID_LENGTH = 64
+
+class KioskSession:
+    """Mutable state for one kiosk. Hold `lock` while changing fields."""
+
+    def __init__(self, kiosk_id):
+        self.kiosk_id = kiosk_id
+        self.lock = threading.RLock()
+        self.mode = 'idle'
+        self.reg_name = ""
+        self.reg_emp_id = ""
+        self.reg_counter = 0
+        self.reg_faces = []
+        self.reg_faces_color = []
+        self.reg_status_msg = "idle"
+        self.reg_job = None  # training_worker.Job once the capture is queued
+        self.reg_attempt = 0  # bumped by every registration start; timers only end their own
+        self.latest_recognition = {"name": "", "emp_id": "", "time": 0}
+        self.recognition_pushed = 0  # time of the last 'recognition' event sent
+        self.tracker = None  # FaceTracker, created on the first attendance frame
+        self.last_seen = time.monotonic()
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    def reset_registration(self):
+        self.reg_counter = 0
+        self.reg_faces, self.reg_faces_color = [], []
+
+    @property
+    def busy(self):
+        """True while a registration is being captured, queued or trained."""
+        return self.reg_status_msg in ("processing", "queued", "training")
+
+class SessionRegistry:
+    """Thread-safe map of kiosk ID -> KioskSession with idle eviction."""
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT_SECONDS, max_sessions=512):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_evict = time.monotonic()
+
+    def get(self, kiosk_id=None):
+        kiosk_id = (kiosk_id or DEFAULT_KIOSK_ID)[:MAX_KIOSK_ID_LENGTH]
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_evict > EVICT_INTERVAL_SECONDS or len(self._sessions) >= self.max_sessions:
+                self._evict_locked(now)
+            session = self._sessions.get(kiosk_id)
+            if session is None:
+                session = self._sessions[kiosk_id] = KioskSession(kiosk_id)
+        session.touch()
+        return session
+
+    def evict_idle(self):
+        with self._lock:
+            return self._evict_locked(time.monotonic())
+
+    def _evict_locked(self, now):
+        self._last_evict = now
+        stale = [k for k, s in self._sessions.items()
+                 if now - s.last_seen > self.idle_timeout and not s.busy]
+        for kiosk_id in stale:
+            del self._sessions[kiosk_id]
+        # Still full: drop the least recently used idle sessions
+        overflow = len(self._sessions) - self.max_sessions + 1
+        if overflow > 0:
+            idle = sorted((s for s in self._sessions.values() if not s.busy), key=lambda s: s.last_seen)
+            for session in idle[:overflow]:
+                del self._sessions[session.kiosk_id]
+                stale.append(session.kiosk_id)
+        return len(stale)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._sessions.values())
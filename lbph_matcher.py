@@ -0,0 +1,352 @@
+"""
+Vectorized NumPy LBPH matching engine.
+
+Drop-in alternative to cv2.face.LBPHFaceRecognizer.predict for large
+galleries. All training histograms live in one contiguous float32 matrix
+(stored bin-major), and whole batches of faces are scored with a
+vectorized chi-square distance that only touches each query's non-zero
+bins, in cache-sized gallery chunks so memory stays bounded.
+
+Histograms are bit-for-bit identical to OpenCV's (circular LBP with
+bilinear sampling, per-cell normalized spatial histograms), so a matcher
+can be built from a trained recognizer with from_recognizer() (or from
+its saved YAML with from_yaml()) and returns
+the same (label, distance) pairs as recognizer.predict().
+
+Optionally each person's samples can be collapsed to their mean histogram
+('centroid') or to the `top_k` samples closest to it ('topk'). This shrinks
+the search by up to samples-per-person times; distances are then measured
+against the reduced gallery, so re-check CONFIDENCE_THRESHOLD when using it.
+
+An optional candidate index (face_index.IVFIndex) prunes the gallery
+before exact scoring for very large enrolled populations. Its candidates
+are first ranked by a cheap estimate from the query's heaviest bins, and
+only the best `index.rerank` of them are scored exactly.
+"""
+import sys
+
+import numpy as np
+
+NO_MATCH = (-1, sys.float_info.max)  # what OpenCV returns for an empty model
+CHUNK_BYTES = 4 * 1024 * 1024        # cache-sized working set per distance chunk
+PROBE_FRACTION = 1 / 8               # share of a query's bins used to shortlist index candidates
+
+class LBPHMatcher:
+    def __init__(self, radius=1, neighbors=8, grid_x=8, grid_y=8, reduce='all', top_k=5, chunk_cols=None,
+                 index=None):
+        if reduce not in ('all', 'centroid', 'topk'):
+            raise ValueError(f"reduce must be 'all', 'centroid' or 'topk', not {reduce!r}")
+        self.radius = radius
+        self.neighbors = neighbors
+        self.grid_x = grid_x
+        self.grid_y = grid_y
+        self.reduce = reduce
+        self.top_k = top_k
+        self.chunk_cols = chunk_cols
+        self.index = index
+        self.dim = grid_x * grid_y * (2 ** neighbors)
+        # Gallery is stored bin-major, shape (dim, capacity): the bins a query
+        # touches are then contiguous rows, which makes the sparse gather cheap.
+        self._hist_t = np.empty((self.dim, 0), np.float32)
+        self._labels = np.empty(0, np.int32)
+        self._sums = np.empty(0, np.float64)
+        self._count = 0
+        self._gallery = None  # (hist_t, labels, column_sums) actually searched
+
+    @classmethod
+    def from_recognizer(cls, recognizer, **kwargs):
+        """Copies the histograms and labels out of a trained cv2 LBPH recognizer."""
+        matcher = cls(radius=recognizer.getRadius(), neighbors=recognizer.getNeighbors(),
+                      grid_x=recognizer.getGridX(), grid_y=recognizer.getGridY(), **kwargs)
+        hists = recognizer.getHistograms()
+        if hists:
+            matcher.add_histograms(np.vstack([h.reshape(1, -1) for h in hists]),
+                                   np.asarray(recognizer.getLabels()).ravel())
+        return matcher
+
+    @classmethod
+    def from_yaml(cls, text, **kwargs):
+        """Parses a model saved by the cv2 LBPH recognizer's write() from
+        memory, without a temporary file or a recognizer."""
+        import cv2
+        fs = cv2.FileStorage(text, cv2.FILE_STORAGE_READ | cv2.FILE_STORAGE_MEMORY)
+        try:
+            node = fs.getNode('opencv_lbphfaces')
+            if node.empty():
+                raise ValueError("not an LBPH model")
+            matcher = cls(radius=int(node.getNode('radius').real()), neighbors=int(node.getNode('neighbors').real()),
+                          grid_x=int(node.getNode('grid_x').real()), grid_y=int(node.getNode('grid_y').real()),
+                          **kwargs)
+            seq = node.getNode('histograms')
+            if seq.size():
+                matcher.add_histograms(np.vstack([seq.at(i).mat().reshape(1, -1) for i in range(seq.size())]),
+                                       node.getNode('labels').mat().ravel())
+            return matcher
+        finally:
+            fs.release()
+
+    # --- Gallery ---
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def histograms_matrix(self):
+        """(n, dim) view of the stored histograms."""
+        return self._hist_t[:, :self._count].T
+
+    @property
+    def labels(self):
+        return self._labels[:self._count]
+
+    def train(self, faces, labels):
+        """Replaces the gallery (like recognizer.train)."""
+        self._hist_t = np.empty((self.dim, 0), np.float32)
+        self._labels = np.empty(0, np.int32)
+        self._sums = np.empty(0, np.float64)
+        self._count = 0
+        if self.index is not None:
+            self.index.rebuild(self._hist_t)
+        self.update(faces, labels)
+
+    def update(self, faces, labels):
+        """Appends samples (like recognizer.update)."""
+        self.add_histograms(self.histograms(faces), labels)
+
+    def add_histograms(self, hists, labels):
+        hists = np.asarray(hists, np.float32).reshape(-1, self.dim)
+        labels = np.asarray(labels, np.int32).ravel()
+        if len(hists) != len(labels):
+            raise ValueError("histograms and labels differ in length")
+        needed = self._count + len(hists)
+        if needed > self._hist_t.shape[1] or not self._hist_t.flags.writeable:
+            # Amortized growth keeps enrollment appends O(new samples)
+            capacity = max(needed, 2 * self._hist_t.shape[1], 64)
+            grown = np.empty((self.dim, capacity), np.float32)
+            grown[:, :self._count] = self._hist_t[:, :self._count]
+            grown_labels = np.empty(capacity, np.int32)
+            grown_labels[:self._count] = self._labels[:self._count]
+            grown_sums = np.empty(capacity, np.float64)
+            grown_sums[:self._count] = self._sums[:self._count]
+            self._hist_t, self._labels, self._sums = grown, grown_labels, grown_sums
+        self._hist_t[:, self._count:needed] = hists.T
+        self._labels[self._count:needed] = labels
+        self._sums[self._count:needed] = hists.sum(axis=1, dtype=np.float64)
+        self._count = needed
+        if self.index is not None and self.reduce == 'all':
+            self.index.add(hists, needed - len(hists), self._hist_t)
+        self._gallery = None
+
+    def remove(self, label):
+        """Drops every sample of `label` from the gallery."""
+        keep = self.labels != label
+        if keep.all():
+            return 0
+        hist_t = np.ascontiguousarray(self._hist_t[:, :self._count][:, keep])
+        removed = self._count - hist_t.shape[1]
+        self.set_gallery(hist_t, self.labels[keep])
+        return removed
+
+    def cell_area(self, face_size):
+        """Pixels per LBPH grid cell for faces of face_size (w, h); histogram
+        values are bin counts divided by this."""
+        width, height = face_size
+        return ((height - 2 * self.radius) // self.grid_y) * ((width - 2 * self.radius) // self.grid_x)
+
+    def attach_index(self, index):
+        """Prunes searches with `index`, rebuilding it unless it already
+        covers exactly the current gallery (e.g. one loaded from disk)."""
+        self.index = index
+        if self.reduce == 'all' and not (index.ready and len(index) == self._count):
+            index.rebuild(self._hist_t[:, :self._count])
+        self._gallery = None
+
+    def with_index(self, index):
+        """A new matcher searching this one's gallery (no copy) with `index`,
+        which should already cover it; this matcher is left untouched."""
+        other = LBPHMatcher(self.radius, self.neighbors, self.grid_x, self.grid_y, reduce=self.reduce,
+                            top_k=self.top_k, chunk_cols=self.chunk_cols)
+        other.set_gallery(self._hist_t[:, :self._count], self.labels, self._sums[:self._count])
+        other.attach_index(index)
+        return other
+
+    def set_gallery(self, hist_t, labels, sums=None):
+        """Uses an existing bin-major (dim, n) float32 matrix as the gallery
+        without copying, e.g. a read-only memory map. `sums` are its
+        precomputed column sums, if available."""
+        if hist_t.shape[0] != self.dim:
+            raise ValueError(f"gallery has {hist_t.shape[0]} bins, expected {self.dim}")
+        self._hist_t = hist_t
+        self._labels = np.asarray(labels, np.int32).ravel()
+        self._sums = hist_t.sum(axis=0, dtype=np.float64) if sums is None else sums
+        self._count = hist_t.shape[1]
+        if self.index is not None:
+            self.attach_index(self.index)
+        self._gallery = None
+
+    def _search_gallery(self):
+        if self._gallery is None:
+            if self.reduce != 'all' and self._count:
+                hist, labels = self._reduced(self.histograms_matrix, self.labels)
+                hist_t = np.ascontiguousarray(hist.T)
+                if self.index is not None:
+                    self.index.rebuild(hist_t)
+                self._gallery = (hist_t, labels, hist_t.sum(axis=0, dtype=np.float64))
+            else:
+                self._gallery = (self._hist_t[:, :self._count], self.labels, self._sums[:self._count])
+        return self._gallery
+
+    def _reduced(self, hist, labels):
+        order = np.argsort(labels, kind='stable')
+        uniq, starts = np.unique(labels[order], return_index=True)
+        bounds = list(starts) + [len(order)]
+        out_hist, out_labels = [], []
+        for i, label in enumerate(uniq):
+            rows = np.ascontiguousarray(hist[order[bounds[i]:bounds[i + 1]]])
+            centroid = rows.mean(axis=0, dtype=np.float64).astype(np.float32)
+            if self.reduce == 'centroid' or len(rows) <= self.top_k:
+                picked = centroid[None, :] if self.reduce == 'centroid' else rows
+            else:
+                rows_t = np.ascontiguousarray(rows.T)
+                dist = chi_square(centroid, rows_t, rows_t.sum(axis=0, dtype=np.float64))
+                picked = rows[np.argsort(dist)[:self.top_k]]
+            out_hist.append(picked)
+            out_labels.append(np.full(len(picked), label, np.int32))
+        return np.vstack(out_hist), np.concatenate(out_labels)
+
+    # --- Feature extraction ---
+
+    def histograms(self, faces):
+        """LBPH spatial histograms for a batch of equally sized grayscale faces,
+        shape (n, dim), matching OpenCV's implementation."""
+        imgs = np.asarray(faces, dtype=np.float32)
+        if imgs.ndim == 2:
+            imgs = imgs[None]
+        n, height, width = imgs.shape
+        r = self.radius
+        center = imgs[:, r:height - r, r:width - r]
+        codes = np.zeros(center.shape, np.int32)
+        eps = np.finfo(np.float32).eps
+        for k in range(self.neighbors):
+            x = np.float32(r * np.cos(2.0 * np.pi * k / self.neighbors))
+            y = np.float32(-r * np.sin(2.0 * np.pi * k / self.neighbors))
+            fx, fy = int(np.floor(x)), int(np.floor(y))
+            cx, cy = int(np.ceil(x)), int(np.ceil(y))
+            tx, ty = np.float32(x - fx), np.float32(y - fy)
+            w1, w2 = (1 - tx) * (1 - ty), tx * (1 - ty)
+            w3, w4 = (1 - tx) * ty, tx * ty
+            shifted = lambda dy, dx: imgs[:, r + dy:height - r + dy, r + dx:width - r + dx]
+            t = w1 * shifted(fy, fx) + w2 * shifted(fy, cx) + w3 * shifted(cy, fx) + w4 * shifted(cy, cx)
+            codes |= ((t > center) | (np.abs(t - center) < eps)).astype(np.int32) << k
+
+        bins = 2 ** self.neighbors
+        cells = self.grid_x * self.grid_y
+        cell_h, cell_w = codes.shape[1] // self.grid_y, codes.shape[2] // self.grid_x
+        codes = codes[:, :self.grid_y * cell_h, :self.grid_x * cell_w]
+        codes = codes.reshape(n, self.grid_y, cell_h, self.grid_x, cell_w).transpose(0, 1, 3, 2, 4)
+        codes = codes.reshape(n, cells, cell_h * cell_w)
+        # One bincount for the whole batch: offset each (face, cell) into its own bin range
+        offsets = (np.arange(n * cells, dtype=np.int64) * bins).reshape(n, cells, 1)
+        counts = np.bincount((codes + offsets).ravel(), minlength=n * cells * bins)
+        return (counts.reshape(n, self.dim) / np.float32(cell_h * cell_w)).astype(np.float32)
+
+    # --- Matching ---
+
+    def predict(self, face):
+        """(label, distance) for one face, same contract as recognizer.predict."""
+        return self.predict_batch([face])[0]
+
+    def predict_batch(self, faces):
+        """[(label, distance), ...] for a batch of faces."""
+        if len(faces) == 0:
+            return []
+        return self.predict_histograms(self.histograms(faces))
+
+    def predict_histograms(self, queries):
+        hist_t, labels, col_sums = self._search_gallery()
+        total = hist_t.shape[1]
+        if not total:
+            return [NO_MATCH] * len(queries)
+        best = np.full(len(queries), np.inf)
+        best_col = np.zeros(len(queries), np.int64)
+        nz = [np.flatnonzero(q) for q in queries]
+        max_nz = max(1, max(len(i) for i in nz))
+        step = self.chunk_cols or max(64, CHUNK_BYTES // (4 * max_nz))
+        scratch = np.empty(max_nz * min(step, total), np.float32)
+
+        candidates = [None] * len(queries)
+        if self.index is not None and self.index.ready:
+            candidates = [self.index.candidates(q) for q in queries]
+
+        # Full scans go chunk-major so each gallery chunk is shared by the batch
+        full = [i for i, c in enumerate(candidates) if c is None]
+        for start in range(0, total if full else 0, step):
+            stop = min(total, start + step)
+            block, block_sums = hist_t[:, start:stop], col_sums[start:stop]
+            for i in full:
+                dist = chi_square(queries[i], block, block_sums, nz=nz[i], scratch=scratch)
+                j = int(np.argmin(dist))
+                if dist[j] < best[i]:
+                    best[i], best_col[i] = dist[j], start + j
+
+        rerank = getattr(self.index, 'rerank', 0)
+        for i, cols in enumerate(candidates):
+            if cols is None: continue
+            if rerank and len(cols) > rerank:
+                cols = shortlist(queries[i], hist_t, col_sums, cols, rerank, nz=nz[i])
+            for start in range(0, len(cols), step):
+                part = cols[start:start + step]
+                dist = chi_square(queries[i], hist_t, col_sums[part], nz=nz[i], scratch=scratch, cols=part)
+                j = int(np.argmin(dist))
+                if dist[j] < best[i]:
+                    best[i], best_col[i] = dist[j], part[j]
+
+        return [(int(labels[col]), float(d)) if np.isfinite(d) else NO_MATCH
+                for col, d in zip(best_col, best)]
+
+def shortlist(query, gallery_t, gallery_sums, cols, keep, nz=None, fraction=PROBE_FRACTION):
+    """The `keep` columns of `cols` with the smallest chi-square distance
+    estimated from only the query's heaviest `fraction` of non-zero bins,
+    sorted. The caller then scores just these exactly."""
+    if nz is None:
+        nz = np.flatnonzero(query)
+    if not len(nz):
+        return cols[:keep]
+    count = max(1, int(len(nz) * fraction))
+    heavy = np.sort(nz[np.argpartition(query[nz], len(nz) - count)[len(nz) - count:]])
+    q = query[heavy, None]
+    scale = 4.0 * len(nz) / count  # the skipped bins are assumed to contribute like these, per bin
+    # Past half the gallery, estimating every column from contiguous row
+    # segments is cheaper than gathering the candidates (and loses none)
+    contiguous = 2 * len(cols) > gallery_t.shape[1]
+    if contiguous:
+        cols = np.arange(gallery_t.shape[1])
+    estimate = np.empty(len(cols), np.float64)
+    step = max(64, CHUNK_BYTES // (4 * count))
+    for start in range(0, len(cols), step):
+        part = cols[start:start + step]
+        g = gallery_t[heavy, start:start + len(part)] if contiguous else gallery_t[np.ix_(heavy, part)]
+        np.divide(g * q, g + q, out=g)
+        estimate[start:start + len(part)] = gallery_sums[part] - scale * g.sum(axis=0, dtype=np.float64)
+    return np.sort(cols[np.argpartition(estimate, keep - 1)[:keep]])
+
+def chi_square(query, gallery_t, gallery_sums, nz=None, scratch=None, cols=None):
+    """OpenCV HISTCMP_CHISQR_ALT distance from one histogram to every column
+    of a bin-major (dim, n) gallery, or only to `cols` when given.
+
+    Uses (q-g)^2/(q+g) = q + g - 4qg/(q+g); the last term is zero wherever
+    the query bin is empty, so only the query's non-zero bins are touched:
+    d = 2 * (sum(q) + sum(g) - 4 * sum_nz(qg/(q+g))).
+    """
+    if nz is None:
+        nz = np.flatnonzero(query)
+    q = query[nz, None]
+    g = gallery_t[nz] if cols is None else gallery_t[np.ix_(nz, cols)]
+    shape = g.shape
+    if scratch is None or scratch.size < g.size:
+        scratch = np.empty(g.size, np.float32)
+    denom = scratch[:g.size].reshape(shape)
+    np.add(g, q, out=denom)
+    np.multiply(g, q, out=g)
+    np.divide(g, denom, out=g)
+    return 2.0 * (float(query.sum(dtype=np.float64)) + gallery_sums - 4.0 * g.sum(axis=0, dtype=np.float64))
@@ -0,0 +1,203 @@
+"""
+Low-overhead timing and counters for the recognition pipeline.
+
+    with metrics.stage('detect'):
+        faces = face_cascade.detectMultiScale(...)
+    metrics.inc('faces', len(faces))
+
+Each stage feeds a histogram with fixed, log-spaced buckets (one lock and
+a bisect per observation), from which p50/p95/p99 are interpolated.
+Other components' stats dicts (pool, writer, training queue, ...) are
+registered as collectors and read only when /metrics is scraped.
+render_prometheus() produces the Prometheus text format; values are per
+worker process and carry a `pid` label so scrapes of different gunicorn
+workers can be told apart.
+
+SamplingProfiler records the stacks of every thread at a fixed interval
+while it runs and returns them in collapsed ("folded") form, ready for
+flamegraph tools.
+"""
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# 50 us .. ~13 s, x1.5 per bucket
+BUCKETS = tuple(50e-6 * 1.5 ** i for i in range(32))
+PREFIX = "face"
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q):
+        """Linear interpolation inside the bucket holding the q-th value."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return 0.0
+        rank, seen = q * total, 0
+        for i, c in enumerate(counts):
+            if seen + c >= rank and c:
+                lo = self.buckets[i - 1] if i > 0 else 0.0
+                hi = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lo + (hi - lo) * (rank - seen) / c
+            seen += c
+        return self.buckets[-1]
+
+    def summary(self):
+        return {"count": self.count, "mean_ms": self.sum / self.count * 1000 if self.count else 0.0,
+                "p50_ms": self.quantile(0.50) * 1000, "p95_ms": self.quantile(0.95) * 1000,
+                "p99_ms": self.quantile(0.99) * 1000}
+
+class _Timer:
+    __slots__ = ("hist", "start")
+
+    def __init__(self, hist):
+        self.hist = hist
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.start)
+        return False
+
+class Registry:
+    def __init__(self, prefix=PREFIX):
+        self.prefix = prefix
+        self.stages = {}
+        self.counters = Counter()
+        self.collectors = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def histogram(self, stage):
+        hist = self.stages.get(stage)
+        if hist is None:
+            with self._lock:
+                hist = self.stages.setdefault(stage, Histogram())
+        return hist
+
+    def stage(self, name):
+        """Context manager timing one pipeline stage."""
+        return _Timer(self.histogram(name))
+
+    def observe(self, name, seconds):
+        self.histogram(name).observe(seconds)
+
+    def inc(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def collector(self, name, fn):
+        """`fn()` returns a dict of numbers, read at scrape time."""
+        self.collectors[name] = fn
+
+    def snapshot(self):
+        """JSON-friendly view: per-stage percentiles, counters, collectors."""
+        with self._lock:
+            counters = dict(self.counters)
+        return {"uptime_s": time.time() - self.started,
+                "stages": {name: hist.summary() for name, hist in sorted(self.stages.items())},
+                "counters": counters,
+                **{name: self._collect(fn) for name, fn in self.collectors.items()}}
+
+    def render_prometheus(self):
+        p, pid = self.prefix, os.getpid()
+        lines = [f"# TYPE {p}_stage_seconds histogram"]
+        for name, hist in sorted(self.stages.items()):
+            with hist._lock:
+                counts, total, hsum = list(hist.counts), hist.count, hist.sum
+            labels = f'stage="{name}",pid="{pid}"'
+            cumulative = 0
+            for bound, c in zip(hist.buckets, counts):
+                cumulative += c
+                lines.append(f'{p}_stage_seconds_bucket{{{labels},le="{bound:.6g}"}} {cumulative}')
+            lines.append(f'{p}_stage_seconds_bucket{{{labels},le="+Inf"}} {total}')
+            lines.append(f'{p}_stage_seconds_sum{{{labels}}} {hsum:.9g}')
+            lines.append(f'{p}_stage_seconds_count{{{labels}}} {total}')
+        with self._lock:
+            counters = sorted(self.counters.items())
+        for name, value in counters:
+            lines.append(f"# TYPE {p}_{name}_total counter")
+            lines.append(f'{p}_{name}_total{{pid="{pid}"}} {value}')
+        for group, fn in sorted(self.collectors.items()):
+            for key, value in sorted(self._collect(fn).items()):
+                lines.append(f"# TYPE {p}_{group}_{key} gauge")
+                lines.append(f'{p}_{group}_{key}{{pid="{pid}"}} {value:.9g}')
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _collect(fn):
+        try:
+            stats = fn()
+        except Exception as e:
+            print(f"Metrics collector error: {e}")
+            return {}
+        # Numbers only (bools count as 0/1); nested or text values are skipped
+        return {k: float(v) for k, v in stats.items() if isinstance(v, (int, float))}
+
+class SamplingProfiler:
+    """Samples every thread's Python stack each `interval` seconds."""
+
+    def __init__(self, interval=0.005, max_depth=48):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self, limit=None):
+        """'outer;inner;leaf count' lines, most frequent first."""
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common(limit))
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                parts = []
+                while frame is not None and len(parts) < self.max_depth:
+                    code = frame.f_code
+                    parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                parts.append(names.get(ident, "thread"))
+                self.stacks[";".join(reversed(parts))] += 1
+            self.samples += 1
@@ -0,0 +1,266 @@
+"""
+Append-only binary store for LBPH face histograms.
+
+Replaces rewriting trainer.yml (and the whole DB blob) on every
+registration. The model is a log of records:
+
+    ADD        label, n histograms   - one enrollment (or re-enrollment)
+    TOMBSTONE  label                 - everything earlier for label is dead
+
+Each record is self-contained bytes, so the same bytes go to the local
+file (appended) and to one database row (inserted). Replaying the log
+gives the live gallery; compact() rewrites it as a single ADD per live
+label once enough of it is dead or fragmented.
+
+Record layout (little-endian):
+
+    magic 'LBPS' | version u8 | op u8 | encoding u8 | pad u8 |
+    label i32 | count u32 | dim u32 | scale f32 | payload | crc32 u32
+
+LBPH histograms are bin counts divided by the cell area, so they are
+stored as uint8 counts plus that divisor ('scale') when this is lossless
+up to float32 rounding (16 KB per sample instead of 64 KB), else as raw
+float32.
+"""
+import hashlib
+import os
+import struct
+import zlib
+
+import numpy as np
+
+MAGIC = b'LBPS'
+VERSION = 1
+OP_ADD, OP_TOMBSTONE = 1, 2
+ENC_UINT8, ENC_FLOAT32 = 0, 1
+HEADER = struct.Struct('<4sBBBBiIIf')
+CRC = struct.Struct('<I')
+
+COMPACT_DEAD_RATIO = 0.3   # compact when this share of stored samples is dead
+COMPACT_MAX_RECORDS = 256  # ... or when it has more records than this (and 2 per live label)
+
+class CorruptRecord(ValueError):
+    pass
+
+def encode_record(op, label, hists=None, scale=0.0):
+    """Serializes one record. `hists` is (n, dim) float32 for OP_ADD."""
+    if op == OP_TOMBSTONE:
+        header = HEADER.pack(MAGIC, VERSION, op, ENC_UINT8, 0, int(label), 0, 0, 0.0)
+        return header + CRC.pack(zlib.crc32(header))
+    hists = np.ascontiguousarray(hists, np.float32).reshape(len(hists), -1)
+    encoding, payload = ENC_FLOAT32, hists
+    if scale:
+        counts = np.rint(hists.astype(np.float64) * scale)
+        # OpenCV and LBPHMatcher may round the division differently by 1 ulp
+        if counts.max(initial=0) <= 255 and np.allclose(
+                (counts / np.float32(scale)).astype(np.float32), hists, rtol=1e-6, atol=0):
+            encoding, payload = ENC_UINT8, counts.astype(np.uint8)
+    if encoding == ENC_FLOAT32:
+        scale = 0.0
+    header = HEADER.pack(MAGIC, VERSION, op, encoding, 0, int(label), hists.shape[0], hists.shape[1], scale)
+    body = header + payload.tobytes()
+    return body + CRC.pack(zlib.crc32(body))
+
+def record_label(record):
+    return HEADER.unpack_from(record)[5]
+
+def _record_size(view, pos):
+    """Size of the complete, checksum-valid record at `pos`, else None."""
+    if len(view) - pos < HEADER.size + CRC.size:
+        return None
+    magic, version, _, encoding, _, _, count, dim, _ = HEADER.unpack_from(view, pos)
+    end = pos + HEADER.size + count * dim * (1 if encoding == ENC_UINT8 else 4)
+    if magic != MAGIC or version != VERSION or end + CRC.size > len(view):
+        return None
+    if CRC.unpack_from(view, end)[0] != zlib.crc32(view[pos:end]):
+        return None
+    return end + CRC.size - pos
+
+def _torn_tail(view, pos):
+    """True if no valid record starts after the damaged one at `pos`: it is
+    a write cut short at the end of the log, not corruption mid-file."""
+    raw = bytes(view)
+    start = raw.find(MAGIC, pos + 1)
+    while start != -1:
+        if _record_size(view, start):
+            return False
+        start = raw.find(MAGIC, start + 1)
+    return True
+
+def decode_records(buf):
+    """Yields (op, label, hists or None, record_size) from a bytes-like log.
+    Stops at a torn trailing record; raises CorruptRecord on bad data,
+    including a damaged record with valid ones after it."""
+    view = memoryview(buf)
+    pos = 0
+    while pos < len(view):
+        if len(view) - pos < HEADER.size + CRC.size:
+            return  # torn write at the end
+        magic, version, op, encoding, _, label, count, dim, scale = HEADER.unpack_from(view, pos)
+        if magic != MAGIC or version != VERSION:
+            raise CorruptRecord(f"bad record header at offset {pos}")
+        item = 1 if encoding == ENC_UINT8 else 4
+        end = pos + HEADER.size + count * dim * item
+        if end + CRC.size > len(view) or CRC.unpack_from(view, end)[0] != zlib.crc32(view[pos:end]):
+            if _torn_tail(view, pos):
+                return  # torn final record
+            raise CorruptRecord(f"damaged record at offset {pos} is followed by valid records")
+        hists = None
+        if op == OP_ADD:
+            dtype = np.uint8 if encoding == ENC_UINT8 else np.float32
+            hists = np.frombuffer(view, dtype, count * dim, pos + HEADER.size).reshape(count, dim)
+            if encoding == ENC_UINT8:
+                hists = (hists / np.float32(scale)).astype(np.float32, copy=False)
+        yield op, label, hists, end + CRC.size - pos
+        pos = end + CRC.size
+
+class SegmentLog:
+    """Replayed state of a record log: live histograms per label plus the
+    bookkeeping compaction needs."""
+
+    def __init__(self):
+        self.segments = {}     # label -> [hists, ...] in insertion order
+        self.records = 0
+        self.dead_samples = 0
+        self.valid_bytes = 0
+
+    def apply(self, op, label, hists, size=0):
+        self.records += 1
+        self.valid_bytes += size
+        if op == OP_ADD:
+            self.segments.setdefault(label, []).append(hists)
+        elif op == OP_TOMBSTONE:
+            self.dead_samples += sum(len(h) for h in self.segments.pop(label, []))
+            self.dead_samples += 1  # the tombstone itself
+
+    def replay(self, buf):
+        for op, label, hists, size in decode_records(buf):
+            self.apply(op, label, hists, size)
+        return self
+
+    @property
+    def live_samples(self):
+        return sum(len(h) for parts in self.segments.values() for h in parts)
+
+    def gallery(self, dim):
+        """(hists (n, dim) float32, labels (n,) int32) of every live sample."""
+        parts, labels = [], []
+        for label, segs in self.segments.items():
+            for hists in segs:
+                parts.append(hists)
+                labels.append(np.full(len(hists), label, np.int32))
+        if not parts:
+            return np.empty((0, dim), np.float32), np.empty(0, np.int32)
+        return np.vstack(parts), np.concatenate(labels)
+
+    def gallery_t(self, dim):
+        """Like gallery(), but bin-major (dim, n) as the shared gallery
+        stores it, filled in one pass instead of stacking then transposing."""
+        count = self.live_samples
+        hist_t = np.empty((dim, count), np.float32)
+        labels = np.empty(count, np.int32)
+        pos = 0
+        for label, segs in self.segments.items():
+            for hists in segs:
+                hist_t[:, pos:pos + len(hists)] = hists.T
+                labels[pos:pos + len(hists)] = label
+                pos += len(hists)
+        return hist_t, labels
+
+    def needs_compaction(self):
+        live = self.live_samples
+        fragmented = self.records > max(COMPACT_MAX_RECORDS, 2 * len(self.segments))
+        dead = self.dead_samples > 0 and self.dead_samples >= COMPACT_DEAD_RATIO * (live + self.dead_samples)
+        return fragmented or dead
+
+    def compacted_records(self, scale=0.0):
+        """One ADD record per live label, replacing the whole log."""
+        return [encode_record(OP_ADD, label, np.vstack(segs), scale) for label, segs in self.segments.items()]
+
+class ModelStore:
+    """The record log as a local append-only file."""
+
+    def __init__(self, path, scale=0.0):
+        self.path = path
+        self.scale = scale
+        self.log = SegmentLog()
+
+    def load(self):
+        """Replays the file; drops a torn trailing record left by a crash.
+        Damage anywhere else raises CorruptRecord and leaves the file as is."""
+        self.log = SegmentLog()
+        if not os.path.exists(self.path):
+            return self.log
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        self.log.replay(data)
+        if self.log.valid_bytes < len(data):
+            print(f"Model store: discarding {len(data) - self.log.valid_bytes} bytes of torn record")
+            with open(self.path, 'r+b') as f:
+                f.truncate(self.log.valid_bytes)
+        return self.log
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def size(self):
+        return os.path.getsize(self.path) if self.exists() else 0
+
+    def _append(self, record):
+        with open(self.path, 'ab') as f:
+            f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+        for op, label, hists, size in decode_records(record):
+            self.log.apply(op, label, hists, size)
+        return record
+
+    def add(self, label, hists):
+        """Appends one enrollment; returns the record bytes (for the DB)."""
+        return self._append(encode_record(OP_ADD, label, hists, self.scale))
+
+    def delete(self, label):
+        """Appends a tombstone for label; returns the record bytes."""
+        return self._append(encode_record(OP_TOMBSTONE, label))
+
+    def digest(self):
+        """sha256 hex digest of the file, or None if there is none."""
+        if not self.exists():
+            return None
+        h = hashlib.sha256()
+        with open(self.path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _write(self, buffers):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            for buf in buffers:
+                f.write(buf)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def write_all(self, records):
+        """Atomically replaces the file with `records` (import or compaction)."""
+        self._write(records)
+        return self.load()
+
+    def adopt(self, log, buffers, digest):
+        """Takes `log`, already replayed from `buffers` (e.g. database rows),
+        as the store's state without re-reading anything. The file is only
+        rewritten when its sha256 differs from `digest`, the hash of the
+        concatenated buffers."""
+        if self.digest() != digest:
+            self._write(buffers)
+        else:
+            print("Model store: local file already matches, not rewritten")
+        self.log = log
+        return log
+
+    def compact(self):
+        """Rewrites the log as one record per live label; returns the new records."""
+        records = self.log.compacted_records(self.scale)
+        self.write_all(records)
+        return records
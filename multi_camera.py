@@ -0,0 +1,345 @@
+"""
+Attendance from several cameras in one process.
+
+Every entrance gets a capture thread (video_pipeline.CaptureThread) that
+keeps only its camera's newest frame. A small pool of recognition workers
+serves all cameras: each worker takes a batch of frames, at most one per
+camera, detects the faces in each and scores the faces of the whole
+batch with one LBPHMatcher.predict_batch call.
+
+Scheduling is round-robin: every batch starts with the camera after the
+one served last, and a camera never has more than one frame in flight.
+A camera whose frames keep coming (a busy entrance, or a file that is
+read faster than real time) can therefore take at most its turn, and
+stale frames are skipped rather than queued.
+
+Attendance goes to the same CSV as attendance_app.py, and one cooldown is
+shared by all cameras, so someone seen by two cameras at the same
+entrance is logged once.
+
+Sources are camera indices, video files (played at their own frame rate,
+looping) or stream URLs that OpenCV can open (RTSP, MJPEG over HTTP).
+camera_server.py serves local stand-ins for network cameras:
+
+    python camera_server.py lobby.mp4 side.mp4 --port 8090
+    python multi_camera.py 0 http://localhost:8090/cam/0 http://localhost:8090/cam/1 --show
+"""
+import argparse
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import attendance_app
+from attendance_state import CooldownIndex
+from lbph_matcher import LBPHMatcher
+from preprocess import FramePreprocessor
+from video_pipeline import Announcer, CaptureThread, FrameSlot, RateMeter, Result
+
+MATCH_THRESHOLD = 75  # same LBPH distance cut-off as attendance_app.py
+STALE_SECONDS = 1.0   # boxes older than this are not drawn
+
+class FileCapture:
+    """Plays a video file like a live camera: at the file's frame rate,
+    starting over at the end when `loop` is set."""
+
+    def __init__(self, path, loop=True):
+        self.cap = cv2.VideoCapture(path)
+        self.loop = loop
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.interval = 1.0 / fps if fps and fps < 240 else 1.0 / 30
+        self._due = time.perf_counter()
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        delay = self._due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        self._due = max(self._due + self.interval, time.perf_counter() - self.interval)
+        ok, image = self.cap.read()
+        if not ok and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, image = self.cap.read()
+        return ok, image
+
+    def release(self):
+        self.cap.release()
+
+def open_source(source, loop=True):
+    if source.isdigit():
+        return cv2.VideoCapture(int(source))
+    if os.path.isfile(source):
+        return FileCapture(source, loop=loop)
+    return cv2.VideoCapture(source)  # rtsp://, http://... (FFmpeg backend)
+
+class Camera:
+    """One source: its capture thread, its newest frame and its counters."""
+
+    def __init__(self, name, source, cap, on_put):
+        self.name = name
+        self.source = source
+        self.cap = cap
+        self.slot = FrameSlot(on_put=on_put)
+        self.capture = CaptureThread(cap, self.slot, name=f"capture-{name}")
+        self.taken = 0        # seq of the last frame handed to a worker
+        self.busy = False     # a worker has one of its frames
+        self.latest = None    # last Result for this camera
+        self.meter = RateMeter()
+        self.stats = {"processed": 0, "skipped": 0, "faces": 0, "recognized": 0}
+
+class FairScheduler:
+    """Round-robin over cameras with a new frame; one frame in flight per camera."""
+
+    def __init__(self):
+        self.cameras = []
+        self._next = 0
+        self._cond = threading.Condition()
+
+    def add(self, camera):
+        with self._cond:
+            self.cameras.append(camera)
+
+    def wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def take(self, max_frames, timeout=0.5):
+        """[(camera, frame), ...] for up to `max_frames` cameras, or [] on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                picks = self._pick(max_frames)
+                if picks:
+                    return picks
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    return []
+
+    def done(self, camera):
+        with self._cond:
+            camera.busy = False
+            self._cond.notify_all()
+
+    def _pick(self, max_frames):
+        picks, n = [], len(self.cameras)
+        for i in range(n):
+            index = (self._next + i) % n
+            camera = self.cameras[index]
+            frame = camera.slot.latest()
+            if camera.busy or frame is None or frame.seq <= camera.taken:
+                continue
+            if camera.taken:
+                camera.stats["skipped"] += frame.seq - camera.taken - 1
+            camera.taken, camera.busy = frame.seq, True
+            picks.append((camera, frame))
+            self._next = (index + 1) % n
+            if len(picks) == max_frames:
+                break
+        return picks
+
+    def finished(self):
+        """True once every capture has stopped and its last frame was handled."""
+        with self._cond:
+            return all(c.slot.closed and not c.busy and
+                       c.taken == (c.slot.latest().seq if c.slot.latest() else 0) for c in self.cameras)
+
+class AttendanceLog:
+    """Shared by every camera: one cooldown per person, one CSV writer."""
+
+    def __init__(self, cooldown=attendance_app.COOLDOWN_SECONDS, announcer=None):
+        self.cooldowns = CooldownIndex(cooldown)
+        self.announcer = announcer
+        self.stats = {"logged": 0, "deduplicated": 0}
+        self._lock = threading.Lock()
+
+    def seen(self, camera, name):
+        if not self.cooldowns.hit(name):
+            self.stats["deduplicated"] += 1
+            return False
+        with self._lock:
+            attendance_app.mark_attendance(name)
+            self.stats["logged"] += 1
+        print(f"[{camera.name}] Logged attendance for {name}")
+        if self.announcer:
+            self.announcer.say(f"Thank you {name}")
+        return True
+
+class RecognitionPool:
+    """`workers` threads taking batches of up to `max_batch` frames from
+    `scheduler` and recognizing all their faces with one predict call."""
+
+    def __init__(self, scheduler, matcher, id_to_name, log, workers=2, max_batch=4, threshold=MATCH_THRESHOLD):
+        self.scheduler = scheduler
+        self.matcher = matcher
+        self.id_to_name = id_to_name
+        self.log = log
+        self.max_batch = max_batch
+        self.threshold = threshold
+        self.stats = {"batches": 0, "frames": 0, "faces": 0}
+        self._stats_lock = threading.Lock()
+        self._halt = threading.Event()
+        self.threads = [threading.Thread(target=self._run, name=f"recognition-{i}", daemon=True)
+                        for i in range(workers)]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self._halt.set()
+        self.scheduler.wake()
+        for thread in self.threads:
+            thread.join(2.0)
+
+    def _run(self):
+        # Preprocessors and cascades are not shared between threads
+        pre = FramePreprocessor(scale=0.5)
+        cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        while not self._halt.is_set():
+            picks = self.scheduler.take(self.max_batch)
+            if not picks:
+                continue
+            try:
+                self._recognize(picks, pre, cascade)
+            except Exception as e:
+                print(f"Recognition error: {e}")
+            finally:
+                for camera, _ in picks:
+                    self.scheduler.done(camera)
+
+    def _recognize(self, picks, pre, cascade):
+        boxes, crops = [], []
+        for camera, frame in picks:
+            _, small_gray = pre.prepare(frame.image)
+            found = [pre.to_full(box) for box in cascade.detectMultiScale(small_gray, 1.2, 5)]
+            boxes.append(found)
+            crops.append(pre.faces(found))
+        # Faces from every camera in the batch, scored together
+        faces = np.concatenate(crops) if crops else []
+        predictions = iter(self.matcher.predict_batch(faces) if len(faces) and len(self.matcher) else
+                           [(-1, float('inf'))] * len(faces))
+        finished = time.perf_counter()
+        for (camera, frame), found in zip(picks, boxes):
+            results = []
+            for box in found:
+                label, distance = next(predictions)
+                name = self.id_to_name.get(label, "Unknown") if distance < self.threshold else "Unknown"
+                if name != "Unknown":
+                    camera.stats["recognized"] += 1
+                    self.log.seen(camera, name)
+                results.append((box, name, (0, 255, 0) if name != "Unknown" else (0, 0, 255)))
+            camera.latest = Result(frame.seq, frame.captured_at, finished, results)
+            camera.stats["processed"] += 1
+            camera.stats["faces"] += len(found)
+            camera.meter.tick()
+        with self._stats_lock:
+            self.stats["batches"] += 1
+            self.stats["frames"] += len(picks)
+            self.stats["faces"] += len(faces)
+
+def load_matcher():
+    """The desktop app's trained model (trainer.yml) as a batch matcher."""
+    id_to_name = attendance_app.load_data()
+    if not id_to_name or not os.path.exists(attendance_app.MODEL_FILE):
+        print("No trained model found; every face will be Unknown. Register users with attendance_app.py.")
+        return LBPHMatcher(), {}
+    return LBPHMatcher.from_recognizer(attendance_app.recognizer), id_to_name
+
+def print_stats(cameras, pool, log):
+    for camera in cameras:
+        s, result = camera.stats, camera.latest
+        latency = (result.finished_at - result.captured_at) * 1000 if result else 0.0
+        print(f"  {camera.name:<12} capture {camera.capture.meter.rate():5.1f} fps  "
+              f"recognized {camera.meter.rate():5.1f} fps  latency {latency:5.0f} ms  "
+              f"skipped {s['skipped']:>6}  faces {s['faces']:>6}  known {s['recognized']:>6}")
+    frames = pool.stats["frames"]
+    print(f"  pool: {pool.stats['batches']} batches, {frames / max(1, pool.stats['batches']):.1f} frames "
+          f"and {pool.stats['faces'] / max(1, pool.stats['batches']):.1f} faces per batch; "
+          f"attendance logged {log.stats['logged']}, deduplicated {log.stats['deduplicated']}")
+
+def show(cameras):
+    for camera in cameras:
+        frame = camera.slot.latest()
+        if frame is None:
+            continue
+        image = frame.image.copy()
+        result = camera.latest
+        if result and time.perf_counter() - result.finished_at < STALE_SECONDS:
+            for (x, y, w, h), name, color in result.faces:
+                cv2.rectangle(image, (x, y), (x + w, y + h), color, 2)
+                cv2.putText(image, name, (x + 5, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        cv2.putText(image, f"{camera.name}  {camera.meter.rate():4.1f} fps", (10, 25),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+        cv2.imshow(f"Camera {camera.name}", image)
+    return cv2.waitKey(1) & 0xFF
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('sources', nargs='+', help="camera index, video file or stream URL")
+    parser.add_argument('--workers', type=int, default=2, help="recognition threads shared by all cameras")
+    parser.add_argument('--max-batch', type=int, default=4, help="frames (one per camera) per recognition batch")
+    parser.add_argument('--threshold', type=float, default=MATCH_THRESHOLD)
+    parser.add_argument('--no-loop', action='store_true', help="stop video files at their end")
+    parser.add_argument('--show', action='store_true', help="one window per camera")
+    parser.add_argument('--speak', action='store_true', help="announce attendance (text-to-speech)")
+    parser.add_argument('--stats-interval', type=float, default=5.0)
+    parser.add_argument('--duration', type=float, help="stop after this many seconds")
+    args = parser.parse_args()
+
+    matcher, id_to_name = load_matcher()
+    announcer = Announcer(attendance_app.speak, repeat_seconds=attendance_app.ANNOUNCE_REPEAT_SECONDS) \
+        if args.speak else None
+    if announcer:
+        announcer.start()
+    log = AttendanceLog(announcer=announcer)
+    scheduler = FairScheduler()
+    for i, source in enumerate(args.sources):
+        cap = open_source(source, loop=not args.no_loop)
+        if not cap.isOpened():
+            print(f"ERROR: Could not open video source {source}")
+            continue
+        scheduler.add(Camera(f"cam{i}", source, cap, scheduler.wake))
+    if not scheduler.cameras:
+        return
+    pool = RecognitionPool(scheduler, matcher, id_to_name, log, workers=args.workers,
+                           max_batch=args.max_batch, threshold=args.threshold)
+    for camera in scheduler.cameras:
+        camera.capture.start()
+    pool.start()
+    print(f"{len(scheduler.cameras)} cameras, {args.workers} workers, "
+          f"{len(id_to_name)} registered users. Ctrl+C to stop.")
+
+    started = last_stats = time.monotonic()
+    try:
+        while not scheduler.finished():
+            now = time.monotonic()
+            if args.duration and now - started >= args.duration:
+                break
+            if now - last_stats >= args.stats_interval:
+                print_stats(scheduler.cameras, pool, log)
+                last_stats = now
+            if args.show:
+                if show(scheduler.cameras) == ord('q'):
+                    break
+            else:
+                time.sleep(0.05)
+    except KeyboardInterrupt:
+        pass
+    for camera in scheduler.cameras:
+        camera.capture.stop()
+    pool.stop()
+    for camera in scheduler.cameras:
+        camera.capture.join(2.0)
+        camera.cap.release()
+    print_stats(scheduler.cameras, pool, log)
+    if announcer:
+        announcer.close()
+    if args.show:
+        cv2.destroyAllWindows()
+
+if __name__ == '__main__':
+    main()
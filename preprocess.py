@@ -0,0 +1,72 @@
+"""
+Shared per-frame preprocessing for app.py and attendance_app.py.
+
+Each frame is converted to grayscale once, and the detection image is
+derived from that by downscaling and CLAHE (at a quarter of the pixels of
+the full frame). The face crops that go to the recognizer are cut from the
+plain grayscale frame and get their own CLAHE after being normalized to
+FACE_SIZE. Grayscale and detection buffers are reused across frames of
+the same size.
+
+Recognizer inputs are therefore not the same as before this module, when
+crops were cut from a CLAHE-equalized full frame: models trained on those
+should be retrained (re-register the users).
+
+A FramePreprocessor is not thread-safe; give each thread (or kiosk) its own.
+"""
+import cv2
+import numpy as np
+
+FACE_SIZE = (100, 100)
+DETECT_SCALE = 0.5
+
+class FramePreprocessor:
+    def __init__(self, scale=DETECT_SCALE, face_size=FACE_SIZE, clip_limit=2.0, tile_grid=(8, 8)):
+        self.scale = scale
+        self.face_size = face_size
+        self.clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid)
+        self.gray = None
+        self.small = None
+
+    def prepare(self, frame):
+        """Returns (gray, small): full-resolution grayscale and the downscaled,
+        CLAHE-equalized detection image. Both are reused buffers, valid until
+        the next call; boxes found in `small` map back with to_full()."""
+        height, width = frame.shape[:2]
+        if self.gray is None or self.gray.shape != (height, width):
+            self.gray = np.empty((height, width), np.uint8)
+            small_size = (max(1, int(width * self.scale)), max(1, int(height * self.scale)))
+            self.small = np.empty(small_size[::-1], np.uint8)
+        if frame.ndim == 2:
+            np.copyto(self.gray, frame)
+        else:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        if self.scale == 1.0:
+            np.copyto(self.small, self.gray)
+        else:
+            cv2.resize(self.gray, self.small.shape[::-1], dst=self.small, interpolation=cv2.INTER_AREA)
+        self.clahe.apply(self.small, dst=self.small)
+        return self.gray, self.small
+
+    def to_full(self, box):
+        """Maps a box found in the detection image back to full resolution."""
+        inv = 1.0 / self.scale
+        return tuple(int(round(v * inv)) for v in box)
+
+    def face(self, box):
+        """Recognizer-ready face for a full-resolution (x, y, w, h) box:
+        cropped from the last prepared gray frame, resized to FACE_SIZE and
+        contrast-normalized with CLAHE. Returns a new array."""
+        x, y, w, h = box
+        roi = cv2.resize(self.gray[y:y+h, x:x+w], self.face_size, interpolation=cv2.INTER_AREA)
+        return self.clahe.apply(roi)
+
+    def faces(self, boxes):
+        """Every box in the frame as one stacked (n, height, width) uint8
+        array of recognizer-ready faces, ready for a single batch predict."""
+        width, height = self.face_size
+        out = np.empty((len(boxes), height, width), np.uint8)
+        for i, (x, y, w, h) in enumerate(boxes):
+            cv2.resize(self.gray[y:y+h, x:x+w], self.face_size, dst=out[i], interpolation=cv2.INTER_AREA)
+            out[i] = self.clahe.apply(out[i])
+        return out
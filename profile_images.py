@@ -0,0 +1,164 @@
+"""
+Cached profile images for /user_image.
+
+Every recognition used to read the full profile_image blob from the
+database. ProfileImageCache keeps encoded JPEGs (full size and a small
+thumbnail, made once at enrollment) in a byte-bounded LRU, optionally
+backed by a directory of files that all workers share, and gives each
+image a strong ETag so browsers can revalidate without a download.
+
+Entries are tagged with the shared model generation: images only change
+when someone (re-)enrolls, which always publishes a new model, so a
+worker that sees a new generation drops its cached images. The enrolling
+worker also invalidates the user explicitly.
+"""
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+THUMB_SIZE = 160  # longest side, pixels (the card shows 80 px; 2x for HiDPI)
+VARIANTS = ('full', 'thumb')
+MISSING = object()  # cached "no image for this emp_id"
+
+def make_thumbnail(jpeg, size=THUMB_SIZE):
+    """JPEG bytes scaled so the longest side is at most `size`, or None."""
+    img = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+    scale = size / max(h, w)
+    if scale < 1:
+        img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+    return encoded.tobytes() if ok else None
+
+def etag_for(data):
+    return hashlib.sha1(data).hexdigest()[:20]
+
+class ProfileImageCache:
+    def __init__(self, max_bytes=16 << 20, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.generation = None
+        self._items = OrderedDict()  # (emp_id, variant) -> (etag, bytes) or MISSING
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def validate(self, generation):
+        """Drops everything cached under an older model generation."""
+        if generation == self.generation:
+            return
+        with self._lock:
+            if generation == self.generation:
+                return
+            self._items.clear()
+            self._bytes = 0
+            self.generation = generation
+            self.stats["invalidations"] += 1
+        self._prune_disk()
+
+    def get(self, emp_id, variant):
+        """(etag, bytes), MISSING, or None when not cached."""
+        key = (emp_id, variant)
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+                self.stats["hits"] += 1
+                return item
+        data = self._read_disk(emp_id, variant)
+        if data is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["disk_hits"] += 1
+        return self._remember(key, (etag_for(data), data))
+
+    def put(self, emp_id, variant, data, generation):
+        """Caches `data` (None = no image) if it was read under the current
+        generation; returns the (etag, bytes) pair or MISSING."""
+        item = (etag_for(data), data) if data else MISSING
+        if generation != self.generation:
+            return item  # read before a model change: don't keep it
+        if data:
+            self._write_disk(emp_id, variant, data)
+        return self._remember((emp_id, variant), item)
+
+    def invalidate(self, emp_id):
+        with self._lock:
+            for variant in VARIANTS:
+                item = self._items.pop((emp_id, variant), None)
+                if item not in (None, MISSING):
+                    self._bytes -= len(item[1])
+        for variant in VARIANTS:
+            path = self._disk_path(emp_id, variant)
+            if path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def metrics(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._items), bytes=self._bytes, max_bytes=self.max_bytes)
+
+    def _remember(self, key, item):
+        size = len(item[1]) if item is not MISSING else 0
+        if size > self.max_bytes:
+            return item
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old not in (None, MISSING):
+                self._bytes -= len(old[1])
+            self._items[key] = item
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                if evicted is not MISSING:
+                    self._bytes -= len(evicted[1])
+                self.stats["evictions"] += 1
+        return item
+
+    # --- Disk cache (shared by workers; one subdirectory per generation) ---
+
+    def _disk_path(self, emp_id, variant):
+        if not self.disk_dir or self.generation is None:
+            return None
+        # Hashed so distinct emp_ids can never share a file name
+        name = hashlib.sha1(emp_id.encode('utf-8')).hexdigest()[:24]
+        return os.path.join(self.disk_dir, f"g{self.generation}", f"{name}.{variant}.jpg")
+
+    def _read_disk(self, emp_id, variant):
+        path = self._disk_path(emp_id, variant)
+        if not path:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, emp_id, variant, data):
+        path = self._disk_path(emp_id, variant)
+        if not path:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Profile image cache write failed: {e}")
+
+    def _prune_disk(self):
+        if not self.disk_dir or not os.path.isdir(self.disk_dir):
+            return
+        for name in os.listdir(self.disk_dir):
+            if name.startswith("g") and name != f"g{self.generation}":
+                shutil.rmtree(os.path.join(self.disk_dir, name), ignore_errors=True)
@@ -1,5 +1,6 @@
 import mysql.connector
 import os
+import shutil
 from urllib.parse import urlparse
 
 def get_db_connection():
@@ -31,7 +32,7 @@ def reset_system():
         # Disable FK checks to allow truncation
         cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
         
-        tables = ['attendance', 'users', 'system_storage']
+        tables = ['attendance', 'users', 'system_storage', 'model_segments', 'profile_thumbs']
         for table in tables:
             try:
                 print(f"Truncating '{table}' table...")
@@ -50,6 +51,12 @@ def reset_system():
     # 2. Delete Files
     files_to_delete = [
         "trainer.yml",
+        "model.lbps",
+        "model.mmap",
+        "model.gen",
+        "model.lock",
+        "model.sync",
+        "face_index.npz",
         "attendance_log.csv"
     ]
     
@@ -63,5 +70,21 @@ def reset_system():
         else:
             print(f"{f} not found.")
 
+    # 3. Delete Directories (spilled attendance rows would be replayed into the emptied DB)
+    dirs_to_delete = [
+        "attendance_spill",
+        os.environ.get('PROFILE_CACHE_DIR') or "profile_cache"
+    ]
+
+    for d in dirs_to_delete:
+        if os.path.isdir(d):
+            try:
+                shutil.rmtree(d)
+                print(f"Deleted {d}/")
+            except Exception as e:
+                print(f"Error deleting {d}/: {e}")
+        else:
+            print(f"{d}/ not found.")
+
 if __name__ == "__main__":
     reset_system()
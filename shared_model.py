@@ -0,0 +1,222 @@
+"""
+Memory-mapped LBPH gallery shared by every gunicorn worker.
+
+`gunicorn app:app` imports app.py once per worker, and each worker used to
+hold its own copy of every histogram. Here the gallery lives in one file
+that all workers map read-only, so the pages are shared through the OS
+page cache and memory stays flat as workers are added. The matcher
+searches the mapped arrays directly.
+
+Files (next to `path`):
+
+    model.mmap  header | hist_t float32 (dim, capacity) | labels int32 | sums float64
+    model.gen   generation, layout, count, log_bytes  (uint64 each)
+    model.lock  writer lock (flock)
+
+Columns are appended in place up to `capacity`; the count is published
+in model.gen only after the data is written, so readers never see a
+partial column. Deletions and growth past capacity write a new file and
+swap it in (`layout` changes). Every change bumps `generation` (odd
+while a writer is mid-update), which readers poll with a single
+shared-memory read per frame. A reader that keeps seeing an odd
+generation waits for the writer lock; if the writer died mid-update the
+lock is free, and the reader repairs the generation and marks the
+mapping stale (log_bytes 0) so the next start rebuilds it. `log_bytes`
+records how much of model.lbps the mapping reflects, so a crash between
+the two is detected at startup.
+"""
+import contextlib
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows dev server: single process, nothing to share
+    fcntl = None
+
+MAGIC = b'LBPM'
+VERSION = 1
+HEADER = struct.Struct('<4sIIQ')  # magic, version, dim, capacity
+HEADER_SIZE = 64
+GEN_FIELDS = 4  # generation, layout, count, log_bytes
+MIN_CAPACITY = 1024
+SEQLOCK_RETRIES = 100  # odd-generation reads (0.1 ms apart) before waiting for the writer lock
+
+class SharedGallery:
+    def __init__(self, path, dim):
+        self.path = path
+        self.dim = dim
+        self.gen_path = os.path.splitext(path)[0] + '.gen'
+        self.lock_path = os.path.splitext(path)[0] + '.lock'
+        self._gen = None        # live uint64 view of model.gen
+        self._gen_map = None
+        self._data_map = None
+        self.layout = None      # layout of the mapped file
+        self.generation = None  # generation of the current view
+        self._locked = False    # this process holds lock()
+
+    # --- Locking and the generation file ---
+
+    @contextlib.contextmanager
+    def lock(self):
+        """Exclusive writer lock across processes."""
+        with open(self.lock_path, 'a+b') as f:
+            if fcntl: fcntl.flock(f, fcntl.LOCK_EX)
+            self._locked = True
+            try:
+                yield
+            finally:
+                self._locked = False
+                if fcntl: fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _gen_view(self):
+        if self._gen is None:
+            if not os.path.exists(self.gen_path):
+                return None
+            with open(self.gen_path, 'r+b') as f:
+                self._gen_map = mmap.mmap(f.fileno(), GEN_FIELDS * 8)
+            self._gen = np.frombuffer(self._gen_map, np.uint64, GEN_FIELDS)
+        return self._gen
+
+    def state(self):
+        """(generation, layout, count, log_bytes), or None before the first publish."""
+        gen = self._gen_view()
+        if gen is None:
+            return None
+        for _ in range(SEQLOCK_RETRIES):  # seqlock: odd while a writer is mid-update
+            first = int(gen[0])
+            values = [int(v) for v in gen]
+            if first % 2 == 0 and int(gen[0]) == first:
+                return (first, *values[1:])
+            time.sleep(0.0001)
+        # The writer is slow or died mid-update: its lock tells which
+        if self._locked:
+            return self._repair()
+        with self.lock():
+            return self._repair()
+
+    def _repair(self):
+        """State under the writer lock, fixing an odd generation left by a
+        crashed writer (its fields may be half-written: remap, rebuild later)."""
+        gen = self._gen
+        if int(gen[0]) % 2:
+            print("Shared model: repairing an update interrupted by a crashed writer")
+            gen[1], gen[3] = int(gen[1]) + 1, 0
+            gen[0] = int(gen[0]) + 1
+            self._gen_map.flush()
+        return tuple(int(v) for v in gen)
+
+    def _publish(self, layout, count, log_bytes):
+        gen = self._gen_view()
+        if gen is None:
+            with open(self.gen_path, 'wb') as f:
+                f.write(bytes(GEN_FIELDS * 8))
+            gen = self._gen_view()
+        gen[0] = int(gen[0]) + 1
+        gen[1], gen[2], gen[3] = layout, count, log_bytes
+        gen[0] = int(gen[0]) + 1
+        self._gen_map.flush()
+
+    def changed(self):
+        """True when another process published a new model since view()."""
+        gen = self._gen_view()
+        return gen is not None and int(gen[0]) != self.generation
+
+    # --- Reading ---
+
+    def view(self):
+        """(hist_t (dim, n), labels (n,), sums (n,)) read-only views of the
+        current model, remapping the file if its layout changed."""
+        while True:
+            state = self.state()
+            if state is None:
+                return None
+            generation, layout, count, _ = state
+            if self._data_map is None or layout != self.layout:
+                with open(self.path, 'rb') as f:
+                    self._data_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.layout = layout
+                if self.state()[0] != generation:
+                    continue  # file swapped again while mapping
+            self.generation = generation
+            hist_t, labels, sums = self._arrays(self._data_map)
+            return hist_t[:, :count], labels[:count], sums[:count]
+
+    def _arrays(self, buf):
+        magic, version, dim, capacity = HEADER.unpack_from(buf)
+        if magic != MAGIC or version != VERSION or dim != self.dim:
+            raise ValueError(f"{self.path} is not a {self.dim}-bin LBPH gallery")
+        offset = HEADER_SIZE
+        hist_t = np.frombuffer(buf, np.float32, dim * capacity, offset).reshape(dim, capacity)
+        offset += dim * capacity * 4
+        labels = np.frombuffer(buf, np.int32, capacity, offset)
+        offset += capacity * 4
+        sums = np.frombuffer(buf, np.float64, capacity, offset)
+        return hist_t, labels, sums
+
+    # --- Writing (hold lock()) ---
+
+    def rewrite(self, hist_t, labels, log_bytes):
+        """Replaces the whole gallery with bin-major `hist_t` (dim, n)."""
+        count = hist_t.shape[1]
+        capacity = max(MIN_CAPACITY, 2 * count)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w+b') as f:
+            # Sparse file: unused capacity costs no disk or page cache
+            f.truncate(HEADER_SIZE + capacity * (self.dim * 4 + 4 + 8))
+            buf = mmap.mmap(f.fileno(), 0)
+            HEADER.pack_into(buf, 0, MAGIC, VERSION, self.dim, capacity)
+            out_hist, out_labels, out_sums = self._arrays(buf)
+            out_hist[:, :count] = hist_t
+            out_labels[:count] = labels
+            out_sums[:count] = hist_t.sum(axis=0, dtype=np.float64)
+            buf.flush()
+            del out_hist, out_labels, out_sums
+            buf.close()
+        os.replace(tmp, self.path)
+        state = self.state()
+        self._publish((state[1] + 1) if state else 1, count, log_bytes)
+
+    def append(self, hists, labels, log_bytes):
+        """Adds (n, dim) histograms in place, or rewrites when out of capacity."""
+        state = self.state()
+        current = self.view() if state else None
+        if current is None:
+            return self.rewrite(np.ascontiguousarray(hists.T), labels, log_bytes)
+        _, layout, count, _ = state
+        n = len(hists)
+        with open(self.path, 'r+b') as f:
+            buf = mmap.mmap(f.fileno(), 0)
+            out_hist, out_labels, out_sums = self._arrays(buf)
+            if count + n > out_hist.shape[1]:
+                del out_hist, out_labels, out_sums
+                buf.close()
+                hist_t = np.hstack([current[0], hists.T])
+                return self.rewrite(hist_t, np.concatenate([current[1], labels]), log_bytes)
+            out_hist[:, count:count + n] = hists.T
+            out_labels[count:count + n] = labels
+            out_sums[count:count + n] = hists.sum(axis=1, dtype=np.float64)
+            buf.flush()
+            del out_hist, out_labels, out_sums
+            buf.close()
+        self._publish(layout, count + n, log_bytes)
+
+    def remove(self, label, log_bytes):
+        """Drops every column of `label` (writes a new file)."""
+        current = self.view()
+        if current is None:
+            return  # nothing published yet, so nothing to drop
+        hist_t, labels, _ = current
+        keep = labels != label
+        self.rewrite(np.ascontiguousarray(hist_t[:, keep]), labels[keep], log_bytes)
+
+    def set_log_bytes(self, log_bytes):
+        state = self.state()
+        if state is None:
+            return
+        generation, layout, count, _ = state
+        self._publish(layout, count, log_bytes)
@@ -0,0 +1,74 @@
+"""
+Staged, timed startup for app.py.
+
+Importing app used to create the detector, run the schema DDL and load
+(possibly download) the model before gunicorn could answer a single
+request, in every worker. Now the import only builds cheap objects and
+Startup runs the slow phases on a background thread. Meanwhile / and
+static files are served, /healthz answers and /readyz returns 503 until
+the phases have finished. Every phase, and the import itself, is timed
+and logged. The timings are also reported by /readyz and /metrics.
+
+A failing phase is logged and the rest still run: the app has always
+come up without a database, and a worker that is "ready" with an empty
+model behaves like one with no registrations yet.
+"""
+import contextlib
+import threading
+import time
+
+class Startup:
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases = {}  # name -> seconds, in the order they ran
+        self.errors = {}  # name -> message
+        self.ready = False
+        self._done = threading.Event()
+        self._thread = None
+
+    def mark(self, name):
+        """Records the time since `started` as phase `name` (e.g. the import)."""
+        self._record(name, time.perf_counter() - self.started)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.errors[name] = str(e)
+            print(f"Startup: {name} failed: {e}")
+        finally:
+            self._record(name, time.perf_counter() - t0)
+
+    def run(self, steps, background=True):
+        """Runs [(name, fn), ...] in order, then marks the app ready."""
+        if not background:
+            self._run(steps)
+            return
+        self._thread = threading.Thread(target=self._run, args=(steps,), name="startup", daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        """Blocks until startup has finished; True if it has."""
+        return self._done.wait(timeout)
+
+    def snapshot(self):
+        return {"ready": self.ready, "uptime_s": round(time.perf_counter() - self.started, 3),
+                "phases_ms": {name: round(s * 1000, 1) for name, s in self.phases.items()},
+                "errors": dict(self.errors)}
+
+    def metrics(self):
+        return {"ready": self.ready, **{f"{name}_ms": s * 1000 for name, s in self.phases.items()}}
+
+    def _run(self, steps):
+        for name, fn in steps:
+            with self.phase(name):
+                fn()
+        self.ready = True
+        self._done.set()
+        print(f"Startup: ready {(time.perf_counter() - self.started) * 1000:.0f} ms after import began")
+
+    def _record(self, name, seconds):
+        self.phases[name] = seconds
+        print(f"Startup: {name} {seconds * 1000:.0f} ms")
@@ -0,0 +1,96 @@
+"""
+Local test client for stream_server.py.
+
+Streams a recorded video (or a camera index) over the WebSocket channel
+at the browser's cadence and reports round-trip latency and dropped
+frames.
+
+Usage:
+    python stream_client.py footage.mp4 --url ws://localhost:8765 --mode attendance
+    python stream_client.py footage.mp4 --register "Jane Doe" EMP042
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import cv2
+import numpy as np
+from websockets.asyncio.client import connect
+
+def open_source(source):
+    return cv2.VideoCapture(int(source) if source.isdigit() else source)
+
+async def stream(args):
+    cap = open_source(args.source)
+    if not cap.isOpened():
+        print(f"ERROR: Could not open video source {args.source}")
+        return
+
+    sent_at = {}
+    latencies = []
+    stats = {"sent": 0, "answered": 0, "faces": 0}
+
+    async with connect(args.url, max_size=None) as ws:
+        if args.register:
+            name, emp_id = args.register
+            await ws.send(json.dumps({"type": "register_start", "name": name, "emp_id": emp_id}))
+        else:
+            await ws.send(json.dumps({"type": "set_mode", "mode": args.mode}))
+
+        async def receiver():
+            async for message in ws:
+                msg = json.loads(message)
+                if msg.get('type') == 'faces':
+                    stats["answered"] += 1
+                    stats["faces"] += len(msg.get('faces', []))
+                    started = sent_at.pop(msg['seq'], None)
+                    if started is not None:
+                        latencies.append(time.perf_counter() - started)
+                elif args.verbose or msg.get('type') != 'registration':
+                    print(msg)
+
+        recv_task = asyncio.create_task(receiver())
+        interval = args.interval / 1000.0
+        began = time.perf_counter()
+        seq = 0
+        while args.frames <= 0 or seq < args.frames:
+            ret, frame = cap.read()
+            if not ret:
+                if not args.loop: break
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                continue
+            ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
+            if not ok: continue
+            seq += 1
+            sent_at[seq] = time.perf_counter()
+            await ws.send(encoded.tobytes())
+            stats["sent"] += 1
+            await asyncio.sleep(interval)
+
+        await asyncio.sleep(1.0)  # let the last answers arrive
+        recv_task.cancel()
+        elapsed = time.perf_counter() - began
+
+    cap.release()
+    print(f"Sent {stats['sent']} frames in {elapsed:.1f}s, answered {stats['answered']} "
+          f"({stats['sent'] - stats['answered']} dropped), {stats['faces']} faces")
+    if latencies:
+        ms = np.array(latencies) * 1000
+        print(f"Latency ms: p50={np.percentile(ms, 50):.1f} p95={np.percentile(ms, 95):.1f} "
+              f"max={ms.max():.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a video through the kiosk WebSocket channel")
+    parser.add_argument('source', help="video file, image sequence pattern or camera index")
+    parser.add_argument('--url', default='ws://localhost:8765')
+    parser.add_argument('--mode', default='attendance', choices=['idle', 'attendance', 'registration'])
+    parser.add_argument('--register', nargs=2, metavar=('NAME', 'EMP_ID'))
+    parser.add_argument('--interval', type=float, default=150, help="ms between frames (browser uses 150)")
+    parser.add_argument('--frames', type=int, default=0, help="stop after N frames (0 = whole video)")
+    parser.add_argument('--loop', action='store_true', help="restart the video when it ends")
+    parser.add_argument('--verbose', action='store_true')
+    asyncio.run(stream(parser.parse_args()))
+
+if __name__ == '__main__':
+    main()
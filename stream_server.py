@@ -0,0 +1,179 @@
+"""
+WebSocket streaming channel for kiosks.
+
+Each kiosk keeps one connection open instead of polling several HTTP
+endpoints: binary JPEG/WebP frames go up, JSON messages come down
+(face boxes, recognition events, registration progress and new
+attendance rows). Frames run through the same app.analyze_frame logic as
+/process_frame, on a thread pool, so a single asyncio worker can serve
+many kiosks at once.
+
+Kiosk sessions (mode, registration progress, last recognition) live in
+this process's own app.sessions. The Procfile runs the stream server
+apart from the gunicorn workers, so they are not shared with the HTTP
+endpoints: a kiosk should drive a whole session over one channel.
+ws://host:port/?kiosk=<id> names the session, so a reconnecting kiosk
+gets its state back. The model, users and attendance are shared through
+model.mmap and the database as usual.
+
+Usage:
+    python stream_server.py
+    (STREAM_HOST, STREAM_PORT, STREAM_WORKERS environment variables)
+
+Client -> server messages:
+    <binary>                                     one encoded frame
+    {"type": "set_mode", "mode": "attendance"}
+    {"type": "register_start", "name": "...", "emp_id": "..."}
+
+Server -> client messages:
+    {"type": "faces", "seq": n, "faces": [...]}
+    {"type": "recognition", "name": "...", "emp_id": "...", "time": t}
+    {"type": "registration", "status": "...", "progress": n, "mode": "..."}
+    {"type": "attendance", "day": "...", "seq": n, "entries": [...], "summary": [...]}
+    {"type": "ack", "command": "...", "success": bool}
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+import app as attendance
+
+STREAM_HOST = os.environ.get('STREAM_HOST', '0.0.0.0')
+STREAM_PORT = int(os.environ.get('STREAM_PORT', 8765))
+STREAM_WORKERS = int(os.environ.get('STREAM_WORKERS', os.cpu_count() or 4))
+STATUS_INTERVAL = 0.5  # seconds between status change checks
+MAX_FRAME_BYTES = 4 * 1024 * 1024
+
+log = logging.getLogger("stream")
+executor = ThreadPoolExecutor(max_workers=STREAM_WORKERS, thread_name_prefix="frame")
+
+def run_frame(buf, session):
+    """Decodes and analyzes one frame (runs on the executor)."""
+    if not attendance.startup.ready:
+        return {"success": False, "error": "Starting up"}
+    frame = attendance.decode_frame(buf)
+    if frame is None:
+        return {"success": False, "error": "Decode failed"}
+    try:
+        return attendance.analyze_frame(frame, session)
+    except Exception as e:
+        log.exception("Error analyzing streamed frame")
+        return {"success": False, "error": str(e)}
+
+class KioskStream:
+    """One connected kiosk. Only the newest unprocessed frame is kept, so a
+    slow pipeline drops stale frames instead of building a backlog."""
+
+    def __init__(self, ws, session):
+        self.ws = ws
+        self.session = session
+        self.pending = None
+        self.pending_seq = 0
+        self.received = 0
+        self.dropped = 0
+        self.frame_ready = asyncio.Event()
+        self.last_registration = None
+        self.last_recognition_time = 0
+        self.attendance_sent = 0
+        self.attendance_day = None
+
+    async def send(self, message):
+        await self.ws.send(json.dumps(message))
+
+    async def receive_loop(self):
+        async for message in self.ws:
+            if isinstance(message, bytes):
+                if len(message) > MAX_FRAME_BYTES:
+                    continue
+                self.received += 1
+                if self.pending is not None:
+                    self.dropped += 1
+                self.pending, self.pending_seq = message, self.received
+                self.frame_ready.set()
+            else:
+                await self.handle_command(message)
+
+    async def handle_command(self, text):
+        try:
+            cmd = json.loads(text)
+        except ValueError:
+            return
+        kind = cmd.get('type')
+        if kind == 'set_mode':
+            ok = attendance.set_app_mode(self.session, cmd.get('mode'))
+        elif kind == 'register_start':
+            ok = attendance.start_registration(self.session, cmd.get('name'), cmd.get('emp_id'))
+        else:
+            return
+        await self.send({"type": "ack", "command": kind, "success": ok})
+        await self.push_status()
+
+    async def frame_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.frame_ready.wait()
+            self.frame_ready.clear()
+            buf, seq = self.pending, self.pending_seq
+            self.pending = None
+            if buf is None:
+                continue
+            self.session.touch()
+            result = await loop.run_in_executor(executor, run_frame, buf, self.session)
+            result.update({"type": "faces", "seq": seq})
+            await self.send(result)
+            await self.push_status()
+
+    async def status_loop(self):
+        while True:
+            await self.push_status()
+            await asyncio.sleep(STATUS_INTERVAL)
+
+    async def push_status(self):
+        """Sends only what changed since the last push."""
+        registration = attendance.registration_snapshot(self.session)
+        if registration != self.last_registration:
+            self.last_registration = dict(registration)
+            await self.send(dict(registration, type="registration"))
+
+        recognition = attendance.recognition_snapshot(self.session)
+        if recognition and recognition['time'] != self.last_recognition_time:
+            self.last_recognition_time = recognition['time']
+            await self.send(dict(recognition, type="recognition"))
+
+        feed = attendance.today_log.feed(self.attendance_sent)
+        if feed["entries"] or feed["summary"] or feed["day"] != self.attendance_day:
+            self.attendance_sent, self.attendance_day = feed["seq"], feed["day"]
+            await self.send(dict(feed, type="attendance"))
+
+def kiosk_id_for(ws):
+    query = parse_qs(urlparse(ws.request.path).query)
+    return query.get('kiosk', [None])[0] or f"ws-{uuid.uuid4().hex[:12]}"
+
+async def handle_kiosk(ws):
+    kiosk = KioskStream(ws, attendance.sessions.get(kiosk_id_for(ws)))
+    log.info("Kiosk %s connected: %s", kiosk.session.kiosk_id, ws.remote_address)
+    tasks = [asyncio.create_task(kiosk.frame_loop()), asyncio.create_task(kiosk.status_loop())]
+    try:
+        await kiosk.receive_loop()
+    except ConnectionClosed:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        log.info("Kiosk disconnected: %s (%d frames, %d dropped)",
+                 ws.remote_address, kiosk.received, kiosk.dropped)
+
+async def main():
+    async with serve(handle_kiosk, STREAM_HOST, STREAM_PORT, max_size=MAX_FRAME_BYTES):
+        log.info("Stream server listening on ws://%s:%d", STREAM_HOST, STREAM_PORT)
+        await asyncio.Future()
+
+if __name__ == '__main__':
+    asyncio.run(main())
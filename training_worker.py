@@ -0,0 +1,152 @@
+"""
+Background training service for registrations.
+
+Enrollments used to start one thread each, which updated the model that
+request threads were predicting with and then rewrote it. Instead, every
+finished capture becomes a Job on a bounded queue served by a single
+worker thread. The worker takes whatever is waiting (up to `max_batch`
+jobs), so a burst of registrations becomes one model update, and hands
+the batch to `handler`. The handler builds the new model state off to the
+side and swaps it in for readers in one assignment; recognition keeps
+using the old state until then and never waits on training.
+"""
+import itertools
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_QUEUE_SIZE = 32
+DEFAULT_MAX_BATCH = 16
+DEFAULT_NICE = 10  # scheduling priority below request threads (Linux: per thread)
+KEEP_FINISHED_JOBS = 256
+
+class QueueFull(Exception):
+    pass
+
+class Job:
+    """One registration waiting for, or going through, training."""
+
+    def __init__(self, job_id, payload):
+        self.job_id = job_id
+        self.payload = payload
+        self.status = 'queued'  # queued -> training -> done | error
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def snapshot(self):
+        return {"id": self.job_id, "status": self.status, "error": self.error,
+                "wait_ms": int((self.started - self.created) * 1000) if self.started else None,
+                "train_ms": int((self.finished - self.started) * 1000) if self.finished and self.started else None}
+
+class TrainingService:
+    def __init__(self, handler, maxsize=DEFAULT_QUEUE_SIZE, max_batch=DEFAULT_MAX_BATCH, on_finish=None,
+                 nice=DEFAULT_NICE):
+        """`handler(jobs)` trains one batch and returns an (ok, error) pair per
+        job; `on_finish(job)` runs after each job settles. The worker thread
+        runs `nice` levels below the request threads where the OS allows it."""
+        self.handler = handler
+        self.on_finish = on_finish
+        self.max_batch = max_batch
+        self.nice = nice
+        self.queue = queue.Queue(maxsize)
+        self.jobs = OrderedDict()
+        self.current = []
+        self.processed = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_batch_size = 0
+        self.last_batch_ms = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="training-worker", daemon=True)
+                self._thread.start()
+        return self
+
+    def submit(self, payload):
+        """Queues a job; raises QueueFull when the queue is at capacity."""
+        self.start()
+        job = Job(next(self._ids), payload)
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            raise QueueFull(f"training queue is full ({self.queue.maxsize} jobs)")
+        with self._lock:
+            self.jobs[job.job_id] = job
+            while len(self.jobs) > KEEP_FINISHED_JOBS and next(iter(self.jobs.values())).finished:
+                self.jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def position(self, job):
+        """1-based place in the queue, 0 once training has started."""
+        if job.status != 'queued':
+            return 0
+        with self.queue.mutex:
+            for i, queued in enumerate(self.queue.queue, 1):
+                if queued is job:
+                    return i
+        return 0
+
+    def stats(self):
+        return {"depth": self.queue.qsize(), "capacity": self.queue.maxsize,
+                "training": len(self.current), "processed": self.processed, "failed": self.failed,
+                "batches": self.batches, "last_batch_size": self.last_batch_size,
+                "last_batch_ms": self.last_batch_ms}
+
+    def _run(self):
+        lower_priority(self.nice)
+        while True:
+            batch = [self.queue.get()]
+            # Coalesce whatever else arrived meanwhile into the same update
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            started = time.time()
+            for job in batch:
+                job.status, job.started = 'training', started
+            self.current = batch
+            try:
+                results = self.handler(batch)
+            except Exception as e:
+                print(f"Training batch failed: {e}")
+                results = [(False, str(e))] * len(batch)
+            finished = time.time()
+            self.current = []
+            self.batches += 1
+            self.last_batch_size = len(batch)
+            self.last_batch_ms = int((finished - started) * 1000)
+            for job, (ok, error) in zip(batch, results):
+                job.status, job.error, job.finished = ('done' if ok else 'error'), error, finished
+                self.processed += 1
+                self.failed += 0 if ok else 1
+                if self.on_finish:
+                    try:
+                        self.on_finish(job)
+                    except Exception as e:
+                        print(f"Training callback error: {e}")
+            for _ in batch:
+                self.queue.task_done()
+
+def lower_priority(nice):
+    """Lowers the calling thread's CPU priority; on Linux every thread has
+    its own nice value. A no-op where that is unsupported."""
+    if not nice or not hasattr(os, 'setpriority'):
+        return
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), nice)
+    except OSError as e:
+        print(f"Training worker: could not lower priority: {e}")
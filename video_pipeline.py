@@ -0,0 +1,219 @@
+"""
+Threaded camera pipeline for the desktop attendance app.
+
+attendance_app.py used to read, detect, recognize, speak, log and show
+every frame on one thread, so a slow step (above all the blocking
+text-to-speech call) froze the video. The stages now run separately:
+
+  - CaptureThread reads the camera into a FrameSlot, a latest-frame-only
+    buffer: a frame nobody took before the next one arrived is dropped,
+    so consumers never work through a backlog;
+  - RecognitionWorker takes the newest frame, runs the detection and
+    recognition function on it and publishes the result;
+  - Announcer speaks on its own thread from a short queue, dropping an
+    announcement that is already waiting or was just spoken;
+  - the display loop (in the app) shows every new frame at once with the
+    latest recognition result drawn over it, and never waits on the
+    other stages.
+
+RateMeter tracks frames per second; every Frame carries its capture time
+so the display can report capture-to-display latency.
+"""
+import threading
+import time
+from collections import deque, namedtuple
+
+Frame = namedtuple('Frame', 'seq image captured_at')
+Result = namedtuple('Result', 'seq captured_at finished_at faces')
+
+class FrameSlot:
+    """Holds only the newest frame. put() never blocks; get() waits for a
+    frame newer than the one the caller already has. `on_put()`, if given,
+    is called after every new frame (e.g. to wake a shared scheduler)."""
+
+    def __init__(self, on_put=None):
+        self._cond = threading.Condition()
+        self._frame = None
+        self.closed = False
+        self.on_put = on_put
+
+    def put(self, image, captured_at=None):
+        with self._cond:
+            seq = self._frame.seq + 1 if self._frame else 1
+            self._frame = Frame(seq, image, captured_at or time.perf_counter())
+            self._cond.notify_all()
+        if self.on_put:
+            self.on_put()
+        return seq
+
+    def get(self, after=0, timeout=None):
+        """Newest frame with seq > `after`, or None on timeout or close."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.closed or (self._frame and self._frame.seq > after), timeout)
+            frame = self._frame
+        return frame if frame and frame.seq > after else None
+
+    def latest(self):
+        return self._frame
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        if self.on_put:
+            self.on_put()
+
+class RateMeter:
+    """Events per second over the last `window` seconds."""
+
+    def __init__(self, window=2.0):
+        self.window = window
+        self._times = deque()
+
+    def tick(self, now=None):
+        now = time.perf_counter() if now is None else now
+        self._times.append(now)
+        while self._times and now - self._times[0] > self.window:
+            self._times.popleft()
+
+    def rate(self):
+        if len(self._times) < 2:
+            return 0.0
+        span = self._times[-1] - self._times[0]
+        return (len(self._times) - 1) / span if span > 0 else 0.0
+
+class CaptureThread(threading.Thread):
+    """Reads `cap` (anything with read() -> (ok, image)) into `slot` as fast
+    as the camera delivers."""
+
+    def __init__(self, cap, slot, name="capture"):
+        super().__init__(name=name, daemon=True)
+        self.cap = cap
+        self.slot = slot
+        self.meter = RateMeter()
+        self.failed = False
+        self._halt = threading.Event()
+
+    def run(self):
+        while not self._halt.is_set():
+            ok, image = self.cap.read()
+            if not ok:
+                self.failed = True
+                break
+            self.slot.put(image)
+            self.meter.tick()
+        self.slot.close()
+
+    def stop(self):
+        self._halt.set()
+
+class RecognitionWorker(threading.Thread):
+    """Runs `process(image) -> faces` on the newest frame in `slot`; the
+    last result is in `latest`. pause() waits for the current frame to
+    finish, so the caller can use the model exclusively until resume()."""
+
+    def __init__(self, slot, process, name="recognition"):
+        super().__init__(name=name, daemon=True)
+        self.slot = slot
+        self.process = process
+        self.latest = None
+        self.meter = RateMeter()
+        self.processed = 0
+        self.skipped = 0  # frames replaced in the slot before this worker got to them
+        self.errors = 0
+        self._halt = threading.Event()
+        self._resume = threading.Event()
+        self._resume.set()
+        self._idle = threading.Event()
+
+    def run(self):
+        seq = 0
+        while not self._halt.is_set():
+            if not self._resume.is_set():
+                self._idle.set()
+                self._resume.wait()
+                continue
+            self._idle.clear()
+            frame = self.slot.get(after=seq, timeout=0.5)
+            if frame is None:
+                if self.slot.closed:
+                    break
+                continue
+            if seq:
+                self.skipped += frame.seq - seq - 1
+            seq = frame.seq
+            try:
+                faces = self.process(frame.image)
+            except Exception as e:
+                self.errors += 1
+                print(f"Recognition error: {e}")
+                continue
+            self.latest = Result(frame.seq, frame.captured_at, time.perf_counter(), faces)
+            self.processed += 1
+            self.meter.tick()
+        self._idle.set()
+
+    def pause(self, timeout=5.0):
+        self._resume.clear()
+        return self._idle.wait(timeout)
+
+    def resume(self):
+        self.latest = None  # boxes from before the pause are stale
+        self._resume.set()
+
+    def stop(self):
+        self._halt.set()
+        self._resume.set()
+
+class Announcer(threading.Thread):
+    """Speaks queued texts one at a time with `speak(text)` (which may block).
+    A text that is already queued, or was spoken less than `repeat_seconds`
+    ago, is dropped; when `maxsize` texts are waiting the oldest goes."""
+
+    def __init__(self, speak, repeat_seconds=10.0, maxsize=4, name="announcer"):
+        super().__init__(name=name, daemon=True)
+        self.speak = speak
+        self.repeat_seconds = repeat_seconds
+        self._pending = deque(maxlen=maxsize)
+        self._spoken = {}  # text -> when it was last spoken
+        self._cond = threading.Condition()
+        self._stopping = False
+        self.stats = {"queued": 0, "spoken": 0, "deduplicated": 0, "dropped": 0}
+
+    def say(self, text):
+        """Queues `text`; returns False if it was deduplicated."""
+        now = time.monotonic()
+        with self._cond:
+            if len(self._spoken) > 256:
+                self._spoken = {t: when for t, when in self._spoken.items() if now - when < self.repeat_seconds}
+            if text in self._pending or now - self._spoken.get(text, -self.repeat_seconds) < self.repeat_seconds:
+                self.stats["deduplicated"] += 1
+                return False
+            if len(self._pending) == self._pending.maxlen:
+                self.stats["dropped"] += 1
+            self._pending.append(text)
+            self.stats["queued"] += 1
+            self._cond.notify()
+        return True
+
+    def run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._stopping)
+                if not self._pending:
+                    return
+                text = self._pending.popleft()
+                self._spoken[text] = time.monotonic()
+            try:
+                self.speak(text)
+            except Exception as e:
+                print(f"TTS error: {e}")
+            self.stats["spoken"] += 1
+
+    def close(self, timeout=5.0):
+        """Speaks what is still queued (up to `timeout`), then stops."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self.is_alive():
+            self.join(timeout)